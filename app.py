@@ -1,11 +1,153 @@
-from flask import Flask, render_template_string, request, send_file
+from flask import (Flask, Request, Response, after_this_request, jsonify, render_template_string, request,
+                   send_file, url_for)
+import contextlib
+import hmac
+import io
+import json
+import logging
 import os
-import shutil
+import re
 import tempfile
-from process_accounting_report import process_accounting_report
+import threading
+import uuid
+from process_accounting_report import (INPUT_SUFFIXES, PARSER_VERSION, CancelToken, ReportCancelled, ReportError,
+                                       extract_report, output_name, report_workbook_bytes, write_report)
+from result_cache import ResultCache, content_hasher, content_key
+from job_queue import JobQueue, QueueFull
+from scratch_space import ScratchFull, ScratchSpace, UploadTooLarge, directory_size, upload_name
+from report_metrics import METRICS_LOGGER, REGISTRY, RunMetrics
+from report_layout import get_layout
+from report_profile import ReportProfile
 
 app = Flask(__name__)
 
+# One JSON line per processed report on stderr (gunicorn/Render capture it)
+metrics_log = logging.getLogger(METRICS_LOGGER)
+if not metrics_log.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_log.addHandler(handler)
+    metrics_log.setLevel(logging.INFO)
+    metrics_log.propagate = False
+
+# Per-request workspaces, upload size limit and cleanup of anything left behind
+scratch = ScratchSpace.from_env()
+# Let werkzeug reject oversized requests before reading them (a little slack for the form)
+app.config['MAX_CONTENT_LENGTH'] = scratch.max_upload_bytes + 1024 * 1024
+
+
+class UploadRequest(Request):
+    # werkzeug parks any upload over 500 KB in a temp file while it parses the
+    # form; keep it in memory up to the same limit as everything else, and
+    # put bigger ones under the scratch root
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=scratch.in_memory_bytes, mode='rb+', dir=scratch.directory)
+
+
+app.request_class = UploadRequest
+
+# The layout profile (REPORT_LAYOUT, else the default), compiled once here at
+# startup: a bad profile stops the app from starting instead of failing every
+# upload, and every request and job reuses the same matcher
+layout = get_layout()
+
+# Processed outputs keyed by SHA-256 of the upload, so re-uploads skip parsing.
+# The layout is part of the key; a different profile can parse the same file differently.
+result_cache = ResultCache.from_env()
+
+
+RESULT_VERSION = f"{PARSER_VERSION}+{layout.fingerprint}"
+
+
+def result_key(path):
+    return content_key(path, RESULT_VERSION)
+
+
+# Background workers behind /jobs, so big reports don't hold a request open
+job_queue = JobQueue.from_env(result_cache=result_cache, cache_key=result_key, save_upload=scratch.save_upload)
+scratch.watch(job_queue.directory, float(os.environ.get('JOB_TTL_HOURS', 24)) * 3600)
+
+# Time budget for a synchronous /process request. Under gunicorn's gthread
+# workers a long request never trips the worker timeout, so it is enforced here.
+# It is cooperative (checked between rows): it can't interrupt a read or write
+# that is stuck, and nothing caps a /process request's memory, which is the
+# worker's own (JOB_MEMORY_MB only applies to job processes). Big reports
+# belong on /jobs, where both are enforced on a separate process.
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', 100))
+# Profiling a slow report in production (see report_profile.py): a /process
+# request sent with an X-Profile header equal to PROFILE_TOKEN is parsed under
+# cProfile, bypassing the result cache. It is answered as usual plus
+# Server-Timing (the time per parser phase) and X-Profile-Id headers, the
+# phases and hot spots are logged as a 'report_profiled' JSON line, and the raw
+# profile can be fetched from /profiles/<id> (same header) for snakeviz & co.
+# Without PROFILE_TOKEN the header is ignored. One profiled request per worker
+# at a time; another asking meanwhile runs normally and gets X-Profile: busy.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'accounting_report_profiles'))
+os.makedirs(PROFILE_DIR, exist_ok=True)
+scratch.watch(PROFILE_DIR, float(os.environ.get('PROFILE_TTL_HOURS', 24)) * 3600)
+profile_lock = threading.Lock()
+
+# Request threads per worker (set by gunicorn.conf.py), for /readyz
+THREADS = int(os.environ.get('GUNICORN_THREADS', 1))
+
+# Requests being handled by this worker right now
+in_flight = 0
+in_flight_lock = threading.Lock()
+
+
+@app.before_request
+def _request_started():
+    global in_flight
+    with in_flight_lock:
+        in_flight += 1
+    # In this worker, not in a preloading gunicorn master
+    scratch.start_sweeper()
+
+
+@app.teardown_request
+def _request_finished(exc):
+    global in_flight
+    with in_flight_lock:
+        in_flight -= 1
+
+
+
+def _profile_allowed():
+    token = request.headers.get('X-Profile')
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token.encode('utf-8'), PROFILE_TOKEN.encode('utf-8')))
+
+
+@contextlib.contextmanager
+def _profiling(profiler):
+    # Runs the block under `profiler` (a ReportProfile, or None for a normal
+    # request) and adds the profile's headers to this request's response
+    if profiler is None:
+        yield
+        return
+    if not profile_lock.acquire(blocking=False):
+        @after_this_request
+        def busy(response):
+            response.headers['X-Profile'] = 'busy'
+            return response
+        yield
+        return
+    try:
+        with profiler.running():
+            yield
+    finally:
+        profile_lock.release()
+    profile_id = uuid.uuid4().hex
+    profiler.save(os.path.join(PROFILE_DIR, profile_id + '.prof'))
+    metrics_log.info(json.dumps({'event': 'report_profiled', 'profile_id': profile_id, **profiler.summary()},
+                                default=str))
+
+    @after_this_request
+    def headers(response):
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['Server-Timing'] = profiler.server_timing()
+        return response
+
 # Embedded HTML to avoid "TemplateNotFound" errors on cloud platforms
 INDEX_HTML = """
 <!DOCTYPE html>
@@ -139,6 +281,16 @@ INDEX_HTML = """
             transform: translateY(0);
         }
 
+        button.secondary {
+            display: none;
+            margin-top: 0.75rem;
+            background: transparent;
+            border: 1px solid var(--glass-border);
+            box-shadow: none;
+            color: var(--text-muted);
+            padding: 0.6rem 1.5rem;
+        }
+
         @keyframes fadeIn {
             from { opacity: 0; transform: translateY(20px); }
             to { opacity: 1; transform: translateY(0); }
@@ -168,11 +320,12 @@ INDEX_HTML = """
                 <span class="upload-icon">📂</span>
                 <span>Drag & drop or Click to Browse</span>
                 <span class="file-name" id="file-name"></span>
-                <input type="file" name="file" id="file-input" accept=".xlsx" required>
+                <input type="file" name="file" id="file-input" accept="{{ accept }}" required>
             </div>
             
             <button type="submit" id="submit-btn">Process Report</button>
             <div class="loading" id="loading-msg">Processing your file... please wait</div>
+            <button type="button" class="secondary" id="cancel-btn">Cancel</button>
         </form>
     </div>
 
@@ -183,6 +336,8 @@ INDEX_HTML = """
         const form = document.getElementById('upload-form');
         const submitBtn = document.getElementById('submit-btn');
         const loadingMsg = document.getElementById('loading-msg');
+        const cancelBtn = document.getElementById('cancel-btn');
+        let currentJob = null;
 
         fileInput.addEventListener('change', (e) => {
             if (e.target.files.length > 0) {
@@ -211,11 +366,96 @@ INDEX_HTML = """
             }
         });
 
-        form.addEventListener('submit', () => {
+        function resetForm(message) {
+            currentJob = null;
+            cancelBtn.style.display = 'none';
+            submitBtn.style.opacity = '1';
+            submitBtn.textContent = 'Process Report';
+            submitBtn.disabled = false;
+            loadingMsg.textContent = message;
+            loadingMsg.style.display = message ? 'block' : 'none';
+        }
+
+        // Submit as a background job and poll it, instead of holding the request open
+        async function pollJob(job) {
+            let errors = 0;
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                let response;
+                try {
+                    response = await fetch(job.status_url);
+                } catch (err) {
+                    // Server workers are recycled now and then; try again a few times
+                    if (++errors > 3) throw err;
+                    continue;
+                }
+                const status = await response.json();
+                if (status.status === 'done') {
+                    resetForm(status.cached ? 'Done (same report as an earlier upload).'
+                        : `Done: ${status.processed} processed, ${status.errored} errored lines.`);
+                    window.location = job.result_url;
+                    return;
+                }
+                if (status.status === 'cancelled') {
+                    resetForm('Cancelled.');
+                    return;
+                }
+                if (status.status === 'failed' || !response.ok) {
+                    resetForm(`Failed: ${status.error || 'unknown error'}`);
+                    return;
+                }
+                loadingMsg.textContent = progressText(status);
+            }
+        }
+
+        function progressText(status) {
+            const p = status.progress;
+            if (!p) {
+                return status.message || `Processing your file... (${status.status}, ${status.elapsed}s)`;
+            }
+            if (p.stage === 'write') {
+                return `Writing ${p.total.toLocaleString()} lines... (${status.elapsed}s)`;
+            }
+            const rows = p.total ? `${Math.floor(100 * p.rows / p.total)}% of ${p.total.toLocaleString()} rows`
+                : `${p.rows.toLocaleString()} rows`;
+            const section = p.section ? `, ${p.section} section` : '';
+            const verb = p.stage === 'read' ? 'Reading' : 'Processing';
+            return `${verb}: ${rows}, ${p.transactions.toLocaleString()} transactions${section} (${status.elapsed}s)`;
+        }
+
+        function cancelJob() {
+            if (currentJob) {
+                // sendBeacon still goes out while the page is being closed
+                navigator.sendBeacon(currentJob.cancel_url);
+            }
+        }
+
+        cancelBtn.addEventListener('click', () => {
+            cancelJob();
+            loadingMsg.textContent = 'Cancelling...';
+        });
+        // Nobody is waiting for the result any more, so free the worker
+        window.addEventListener('pagehide', cancelJob);
+
+        form.addEventListener('submit', async (e) => {
+            e.preventDefault();
             submitBtn.style.opacity = '0.7';
             submitBtn.textContent = 'Processing...';
             submitBtn.disabled = true;
+            loadingMsg.textContent = 'Uploading...';
             loadingMsg.style.display = 'block';
+            try {
+                const response = await fetch('/jobs', {method: 'POST', body: new FormData(form)});
+                if (!response.ok) {
+                    resetForm(`Upload failed: ${await response.text()}`);
+                    return;
+                }
+                currentJob = await response.json();
+                cancelBtn.style.display = 'block';
+                await pollJob(currentJob);
+            } catch (err) {
+                resetForm(`Error: ${err}`);
+            }
         });
     </script>
 </body>
@@ -224,7 +464,7 @@ INDEX_HTML = """
 
 @app.route('/')
 def index():
-    return render_template_string(INDEX_HTML)
+    return render_template_string(INDEX_HTML, accept=','.join(INPUT_SUFFIXES))
 
 @app.route('/process', methods=['POST'])
 def process_file():
@@ -236,21 +476,148 @@ def process_file():
         return "No selected file", 400
     
     if file:
-        temp_dir = tempfile.mkdtemp()
+        # The upload goes straight from werkzeug's stream to the reader (in
+        # memory up to IN_MEMORY_RESPONSE_MB, in a temp file past that)
+        upload = None
         try:
-            input_path = os.path.join(temp_dir, file.filename)
-            file.save(input_path)
-            
-            output_filename = f"Processed_{file.filename}"
-            output_path = os.path.join(temp_dir, output_filename)
-        
-            process_accounting_report(input_path, output_path)
-            
-            return send_file(output_path, as_attachment=True)
+            digest = content_hasher(RESULT_VERSION)
+            upload = scratch.receive_upload(file, digest)
+
+            filename = upload_name(file.filename)
+            output_filename = output_name(filename)
+            key = digest.hexdigest()
+            profiler = ReportProfile(filename) if _profile_allowed() else None
+            # A profiled request always parses
+            cached_path = result_cache.get(key) if profiler is None else None
+            if cached_path:
+                upload.cleanup()
+                return send_file(cached_path, as_attachment=True, download_name=output_filename)
+
+            # Parsed in-process straight to DataFrames; no intermediate files
+            metrics = RunMetrics(source=filename)
+            with _profiling(profiler):
+                try:
+                    df_proc, df_err = extract_report(upload.source(), metrics=metrics, layout=layout,
+                                                     cancel=CancelToken(timeout=REQUEST_TIMEOUT_SECONDS),
+                                                     filename=filename)
+                except ReportCancelled as e:
+                    metrics.finish('cancelled')
+                    upload.cleanup()
+                    return f"{e}; big reports go through the background /jobs queue.", 503
+                except ReportError as e:
+                    metrics.finish('failed')
+                    upload.cleanup()
+                    return f"Could not process the report: {e}", 422
+
+                with metrics.stage('write'):
+                    if not upload.spilled:
+                        output = report_workbook_bytes(df_proc, df_err)
+                    else:
+                        # Big report: write to the workspace and stream it from there
+                        output = None
+                        output_path = upload.workspace.file(output_filename)
+                        write_report(df_proc, df_err, output_path)
+            metrics.finish('ok')
+
+            if output is not None:
+                upload.cleanup()
+                result_cache.put_bytes(key, output)
+                return send_file(io.BytesIO(output), as_attachment=True, download_name=output_filename)
+            result_cache.put(key, output_path)
+            return scratch.send(upload.workspace, output_path, output_filename)
             
+        except UploadTooLarge as e:
+            return str(e), 413
+        except ScratchFull as e:
+            return str(e), 503
         except Exception as e:
+            if upload is not None:
+                upload.cleanup()
             return f"An error occurred: {str(e)}", 500
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    if 'file' not in request.files:
+        return "No file part", 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return "No selected file", 400
+
+    try:
+        job_id = job_queue.submit(file)
+    except UploadTooLarge as e:
+        return str(e), 413
+    except QueueFull as e:
+        return str(e), 503
+    body = job_queue.status(job_id)
+    body.update(status_url=url_for('job_status', job_id=job_id),
+                result_url=url_for('job_result', job_id=job_id),
+                cancel_url=url_for('cancel_job', job_id=job_id))
+    return jsonify(body), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    result = job_queue.result(job_id)
+    if result is None:
+        status = job_queue.status(job_id)
+        if status is None:
+            return jsonify(error="Unknown job"), 404
+        return jsonify(status), 409
+    output_path, output_name = result
+    return send_file(output_path, as_attachment=True, download_name=output_name)
+
+@app.route('/profiles/<profile_id>')
+def profile_result(profile_id):
+    # The raw profile of a profiled /process request
+    if not _profile_allowed():
+        return jsonify(error="Profiling is not enabled for this request"), 403
+    path = os.path.join(PROFILE_DIR, profile_id + '.prof')
+    if not re.fullmatch(r'[0-9a-f]{32}', profile_id) or not os.path.exists(path):
+        return jsonify(error="Unknown profile"), 404
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}.prof")
+
+@app.route('/healthz')
+def healthz():
+    # Liveness: the worker answers; nothing else is checked
+    return jsonify(status='ok')
+
+@app.route('/readyz')
+def readyz():
+    # Readiness: 503 while this worker's job queue or the scratch space is full,
+    # so a load balancer sends new uploads elsewhere. Like /metrics, the
+    # numbers are this worker's own.
+    jobs = job_queue.load()
+    scratch_full = directory_size(scratch.directory) > scratch.max_bytes
+    with in_flight_lock:
+        requests = in_flight - 1  # not counting this one
+    body = {
+        'status': 'ready' if not jobs['full'] and not scratch_full else 'busy',
+        'jobs': jobs,
+        'requests': {'in_flight': requests, 'threads': THREADS, 'saturation': round(min(requests / THREADS, 1), 2)},
+        'scratch_full': scratch_full,
+    }
+    return jsonify(body), 200 if body['status'] == 'ready' else 503
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape endpoint; totals are per worker process
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     # Only try ngrok if NOT on Render
     if not os.environ.get('RENDER'):
@@ -261,4 +628,5 @@ if __name__ == '__main__':
         except Exception as e:
             print(f" * ngrok skipped: {e}")
 
-    app.run(debug=True, port=int(os.environ.get('PORT', 5000)))
+    # Development server only; production runs gunicorn with gunicorn.conf.py
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=int(os.environ.get('PORT', 5000)))
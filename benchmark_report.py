@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_sample_report import generate_report, parse_row_count
+
+# Throughput / memory benchmark for process_accounting_report() on synthetic
+# reports (see generate_sample_report.py). Each run happens in a fresh process
+# so its peak RSS isn't inflated by earlier runs. Save a run with --save and
+# compare later runs against it with --baseline; the exit status is 1 when
+# throughput drops or peak memory grows past the tolerance, so it can gate a deploy.
+# tests/test_benchmark.py runs the same checks under pytest-benchmark: 10k rows
+# always, 100k and 1M with --slow, those against tests/benchmark_baseline.json
+# (written by --save) for peak memory.
+#
+#   python benchmark_report.py                      # 10k, 100k, 1M rows
+#   python benchmark_report.py --sizes 10k,100k --save bench.json
+#   python benchmark_report.py --sizes 10k,100k --baseline bench.json
+#
+# --startup measures cold starts instead: a fresh interpreter importing the
+# web app, and the CLI's --help. It fails if `import app` loads pandas, numpy
+# or openpyxl (they are imported lazily, see lazy_imports.py), if an import
+# takes longer than --startup-budget, or if it is slower than the baseline.
+#
+#   python benchmark_report.py --startup --save startup.json
+#   python benchmark_report.py --startup --baseline startup.json
+
+DEFAULT_SIZES = '10k,100k,1M'
+DEFAULT_STARTUP_BUDGET = 1.0
+HERE = os.path.dirname(os.path.abspath(__file__))
+STARTUP_COMMANDS = {
+    'import app': ['-c', 'import app'],
+    'cli --help': ['process_accounting_report.py', '--help'],
+}
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), 'accounting_report_bench')
+
+
+def _run_once(input_path, output_path, options):
+    # Child process: one full run, returns the metrics summary
+    from process_accounting_report import process_accounting_report
+    from report_metrics import RunMetrics
+
+    metrics = RunMetrics(source=os.path.basename(input_path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = process_accounting_report(input_path, output_path, metrics=metrics, **options)
+    if result is None:
+        raise RuntimeError(f"processing {input_path} failed")
+    return metrics.result
+
+
+def run_isolated(input_path, output_path, options):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(_run_once, (input_path, output_path, options))
+
+
+def synthetic_report(label, rows, data_dir, seed=0):
+    """Path of the generated report for a size, generated on first use."""
+    input_path = os.path.join(data_dir, f"synthetic_{label}.xlsx")
+    if not os.path.exists(input_path):
+        print(f"Generating {input_path} ...")
+        os.makedirs(data_dir, exist_ok=True)
+        generate_report(input_path, rows=rows, seed=seed)
+    return input_path
+
+
+def benchmark_size(label, rows, data_dir, repeat, options, seed=0):
+    input_path = synthetic_report(label, rows, data_dir, seed)
+    output_path = os.path.join(data_dir, f"Processed_synthetic_{label}.xlsx")
+
+    runs = [run_isolated(input_path, output_path, options) for _ in range(repeat)]
+    # Best of N for time; memory is taken from the same run
+    best = min(runs, key=lambda r: r['seconds'])
+    return {
+        'size': label,
+        'rows': best.get('rows', rows),
+        'seconds': best['seconds'],
+        'rows_per_sec': best['rows_per_sec'],
+        'peak_rss_mb': best['peak_rss_mb'],
+        'stages': {name: stage['seconds'] for name, stage in best['stages'].items()},
+    }
+
+
+def measure_startup(repeat=5):
+    """Best-of-repeat seconds for each STARTUP_COMMANDS entry, plus the heavy modules `import app` loads."""
+    results = {}
+    for name, args in STARTUP_COMMANDS.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + args, cwd=HERE, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        results[name] = round(min(times), 4)
+    check = ("import sys, app; from lazy_imports import HEAVY_MODULES; "
+             "print(','.join(m for m in HEAVY_MODULES if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, '-c', check], cwd=HERE, check=True, capture_output=True, text=True)
+    return {'seconds': results, 'heavy_modules': [m for m in loaded.stdout.strip().split(',') if m]}
+
+
+def compare_startup(startup, baseline, budget, tolerance):
+    """Problems with a measure_startup() result; baseline may be None."""
+    problems = [f"import app loads {name}" for name in startup['heavy_modules']]
+    old = (baseline or {}).get('startup', {}).get('seconds', {})
+    for name, seconds in startup['seconds'].items():
+        if seconds > budget:
+            problems.append(f"{name}: {seconds:.2f}s, budget {budget:.2f}s")
+        if name in old and seconds > old[name] * (1 + tolerance):
+            problems.append(f"{name}: {seconds:.2f}s, baseline {old[name]:.2f}s")
+    return problems
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for results worse than baseline by more than tolerance."""
+    previous = {r['size']: r for r in baseline['results']}
+    problems = []
+    for r in results:
+        old = previous.get(r['size'])
+        if old is None:
+            continue
+        if r['rows_per_sec'] < old['rows_per_sec'] * (1 - tolerance):
+            problems.append(f"{r['size']}: throughput {r['rows_per_sec']:.0f} rows/s, "
+                            f"baseline {old['rows_per_sec']:.0f} rows/s")
+        if old.get('peak_rss_mb') and r['peak_rss_mb'] and r['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            problems.append(f"{r['size']}: peak RSS {r['peak_rss_mb']:.0f} MB, baseline {old['peak_rss_mb']:.0f} MB")
+    return problems
+
+
+def print_results(results):
+    stages = []
+    for r in results:
+        stages += [s for s in r['stages'] if s not in stages]
+    headers = ['Size', 'Rows', 'Seconds', 'Rows/s', 'Peak MB'] + stages
+    table = [[r['size'], str(r['rows']), f"{r['seconds']:.2f}", f"{r['rows_per_sec']:.0f}",
+              f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-']
+             + [f"{r['stages'][s]:.2f}" if s in r['stages'] else '-' for s in stages] for r in results]
+    widths = [max(len(row[i]) for row in [headers] + table) for i in range(len(headers))]
+    for n, row in enumerate([headers] + table):
+        print("  ".join(cell.rjust(w) for cell, w in zip(row, widths)))
+        if n == 0:
+            print("  ".join("-" * w for w in widths))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark process_accounting_report on synthetic reports.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"comma separated row counts (default {DEFAULT_SIZES})")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per size, best time is kept (default 1)")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="where generated reports are kept between runs")
+    parser.add_argument('--batch', action='store_true', help="use the column-wise batch parser")
+    parser.add_argument('--split', type=int, default=None, metavar='N', help="parse in N parallel chunks")
+    parser.add_argument('--fast-write', action='store_true', help="use the streaming workbook writer")
+    parser.add_argument('--save', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="fail if worse than these saved results")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown / memory growth against the baseline (default 0.2)")
+    parser.add_argument('--startup', action='store_true', help="measure cold-start time instead of throughput")
+    parser.add_argument('--startup-budget', type=float, default=DEFAULT_STARTUP_BUDGET,
+                        help=f"most seconds a cold start may take (default {DEFAULT_STARTUP_BUDGET})")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        return run_startup(args)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    options = {'batch': args.batch, 'workers': args.split, 'fast_write': args.fast_write}
+    results = []
+    for label in [s.strip() for s in args.sizes.split(',') if s.strip()]:
+        print(f"Benchmarking {label} rows ...")
+        results.append(benchmark_size(label, parse_row_count(label), args.data_dir, args.repeat, options))
+    print()
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'options': options, 'results': results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+def run_startup(args):
+    startup = measure_startup(max(args.repeat, 5))
+    for name, seconds in startup['seconds'].items():
+        print(f"{name}: {seconds:.3f}s")
+    print(f"heavy modules loaded by import app: {', '.join(startup['heavy_modules']) or 'none'}")
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'startup': startup}, f, indent=2)
+        print(f"Saved results to {args.save}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = compare_startup(startup, baseline, args.startup_budget, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    if problems:
+        return 1
+    print("Startup is within budget.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
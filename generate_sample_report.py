@@ -0,0 +1,163 @@
+import argparse
+import datetime
+import random
+
+import openpyxl
+
+# Synthetic "Create Accounting Execution Report" workbooks for benchmarks.
+# Sheet2 follows the layout of the real sample: summary blocks at the top, a
+# "Journal Entry Errors and Warnings" summary, a "Journal Entries with Errors"
+# section and a "Journal Entries Processed" section. Each transaction has its
+# header block, "Journal Entry Description", an "Accounting Class" line table, a
+# "Total for Journal Entry" row and, in the error section, an "Error Message"
+# table. Column positions are the ones the real export uses.
+
+ROW_WIDTH = 36
+
+ERROR_MESSAGES = [
+    "The accounting date {date} isn't in an open or a future enterable period. Details: You must open "
+    "the accounting period or modify the journal entry rule set or the source value to use a different "
+    "accounting date.",
+    "The account {account} is not valid. Details: The code combination is disabled or end dated.",
+    "The journal entry is not balanced. Details: Entered debits and credits for currency SAR differ.",
+]
+EVENTS = [('Run Costs', 'Run Cost'), ('Payment Costs', 'Payment Cost')]
+
+
+def _row(*cells):
+    # (column, value) pairs -> full-width row list
+    row = [None] * ROW_WIDTH
+    for col, value in cells:
+        row[col] = value
+    return row
+
+
+def _account(rng):
+    return (f"11-{rng.randint(1000, 9999)}-{rng.choice(['11', '99'])}-{rng.randint(1100000, 5199999)}"
+            f"-9999999-{rng.choice(['5000', '9999'])}-99-9999-9999")
+
+
+def _transaction(rng, number, errored, accounting_date):
+    """Rows of one transaction; the processed section's table layout differs a little."""
+    event_class, event_type = rng.choice(EVENTS)
+    rows = [
+        _row((0, 'Transaction Number'), (9, str(number)), (19, 'Ledger'), (27, 'AIC Ledger')),
+        _row((0, 'Event Class'), (9, event_class), (19, 'Ledger Currency'), (27, 'SAR')),
+        _row((0, 'Event Type'), (9, event_type), (19, 'Accounting Date'), (27, accounting_date)),
+    ]
+    if errored:
+        rows.append(_row((0, 'Event Date'), (9, accounting_date), (19, 'Journal Entry Status'), (27, 'Invalid ')))
+    rows += [_row(), _row(), _row((0, 'Journal Entry Description'))]
+
+    # Line table: pairs of debit/credit lines so the entry balances
+    if errored:
+        cols = dict(line=0, cls=2, account=5, currency=12, debit=17, credit=21, acc_debit=24, acc_credit=30)
+        rows += [_row((0, 'Line'), (2, 'Accounting Class'), (5, 'Account'), (12, 'Entered Currency'),
+                      (17, 'Entered Debit'), (21, 'Entered Credit'), (24, 'Accounted Debit'),
+                      (30, 'Accounted Credit')), _row()]
+    else:
+        cols = dict(line=0, cls=1, account=5, currency=13, debit=18, credit=22, acc_debit=26, acc_credit=31)
+        rows.append(_row((0, 'Line'), (1, 'Accounting Class'), (5, 'Account'), (13, 'Entered Currency'),
+                         (18, 'Entered Debit'), (22, 'Entered Credit'), (26, 'Accounted Debit'),
+                         (31, 'Accounted Credit')))
+    total = 0.0
+    line_numbers = []
+    line_no = 1
+    for _ in range(rng.choice([1, 1, 2, 2, 3, 5])):
+        amount = round(rng.uniform(100, 100000), 2)
+        total += amount
+        for debit, credit in ((amount, 0), (0, amount)):
+            account = _account(rng)
+            rows.append(_row((cols['line'], str(line_no)), (cols['cls'], 'Cost'), (cols['account'], account),
+                             (cols['currency'], 'SAR'), (cols['debit'], debit), (cols['credit'], credit),
+                             (cols['acc_debit'], debit), (cols['acc_credit'], credit)))
+            line_numbers.append(line_no)
+            # Line numbers skip now and then, like the real export
+            line_no += rng.choice([1, 1, 1, 2])
+    total = round(total, 2)
+    if errored:
+        rows.append(_row((0, 'Total for Journal Entry'), (24, total), (30, total)))
+        rows += [_row(), _row((0, 'Line'), (3, 'Error Message'))]
+        date_text = accounting_date.strftime('%d-%b-%y').upper()
+        for _ in range(rng.choice([1, 1, 2])):
+            message = rng.choice(ERROR_MESSAGES).format(date=date_text, account=_account(rng)) + ' '
+            # Most messages apply to the whole entry; some name a line
+            line = str(rng.choice(line_numbers)) if rng.random() < 0.3 else None
+            rows.append(_row((0, line), (3, message)))
+        rows += [_row(), _row()]
+    else:
+        rows += [_row(), _row((13, 'Total for Journal Entry'), (26, total), (31, total)), _row(), _row()]
+    return rows
+
+
+def iter_report_rows(rows=10000, error_fraction=0.05, seed=0):
+    """Yield Sheet2 rows (lists) until about `rows` rows have been produced."""
+    rng = random.Random(seed)
+    header = [
+        _row((11, 'Create Accounting Execution Report'), (25, 'Report Date'),
+             (32, datetime.datetime(2026, 1, 26, 13, 3, 47))),
+        _row((0, 'AIC Ledger'), (25, 'Page'), (32, '1 of 1')),
+        _row(), _row((0, ' ')), _row(),
+        _row((0, 'Accounting Event Summary')),
+        _row((0, 'Event Class'), (8, 'Total Number of Events'), (14, 'Number of Events Processed without Warning'),
+             (22, 'Number of Events with Warning'), (28, 'Number of Events in Error')),
+        _row(), _row(),
+        _row((0, 'Journal Entry Errors and Warnings')),
+        _row((0, 'Event Class'), (4, 'Event Type'), (6, 'Ledger'), (7, 'Transaction Number'),
+             (10, 'Journal Entry Status'), (16, 'Journal Line Number'), (20, 'Error and Warning Message')),
+        _row(), _row(), _row((0, ' ')), _row(),
+    ]
+    yield from header
+    produced = len(header)
+    footer = [_row(), _row((0, ' ')), _row((0, ' ')), _row(), _row((0, 'End of Report'))]
+    body_rows = max(rows - produced - len(footer), 0)
+
+    number = 1400000
+    error_budget = int(body_rows * error_fraction)
+    sections = [('Journal Entries with Errors', True, error_budget),
+                ('Journal Entries Processed', False, body_rows - error_budget)]
+    for title, errored, budget in sections:
+        if budget <= 0:
+            continue
+        yield _row((0, title))
+        yield _row()
+        written = 2
+        while written < budget:
+            number += rng.randint(1, 4)
+            accounting_date = datetime.datetime(2026, 1, 31) if not errored else datetime.datetime(2025, 10, 31)
+            for row in _transaction(rng, number, errored, accounting_date):
+                yield row
+                written += 1
+        yield _row((0, ' '))
+    yield from footer
+
+
+def generate_report(path, rows=10000, error_fraction=0.05, seed=0):
+    """Write a synthetic report with roughly `rows` rows in Sheet2; returns path."""
+    # Write-only keeps memory flat even for a million rows
+    workbook = openpyxl.Workbook(write_only=True)
+    workbook.create_sheet('Sheet1').append(['Create Accounting Execution Report'])
+    sheet = workbook.create_sheet('Sheet2')
+    for row in iter_report_rows(rows, error_fraction, seed):
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def parse_row_count(text):
+    # '10k' / '1M' / '250000'
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic Create Accounting report.")
+    parser.add_argument('output', help="path of the .xlsx to write")
+    parser.add_argument('--rows', default='10k', help="approximate Sheet2 rows, e.g. 10k, 100k, 1M (default 10k)")
+    parser.add_argument('--error-fraction', type=float, default=0.05,
+                        help="share of rows in the 'with Errors' section (default 0.05)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_report(args.output, parse_row_count(args.rows), args.error_fraction, args.seed)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,126 @@
+import gc
+import os
+import random
+import sys
+import time
+
+from report_metrics import rss_mb
+
+# Production settings for the web app: gunicorn -c gunicorn.conf.py app:app
+# (the Procfile does this). Every setting can be changed from the environment.
+#
+# Sizing: each web worker is one process plus its job pool (JOB_WORKERS
+# processes), and any of them can need a few hundred MB for a big report. The
+# worker count is the usual 2 x CPUs + 1, cut down to what fits in the memory
+# limit (the container's cgroup limit when there is one) at WORKER_MEMORY_MB
+# per process. WEB_CONCURRENCY overrides it.
+#
+# Workers are gthread: a thread busy parsing a synchronous /process upload
+# doesn't stop the same worker answering /healthz, job polls and downloads.
+# With threads gunicorn's `timeout` only catches a worker that hangs as a
+# whole; the per-request time limit is REQUEST_TIMEOUT_SECONDS in app.py and
+# JOB_TIMEOUT_SECONDS for jobs, and JOB_MEMORY_MB caps each job process's heap.
+# A synchronous /process parse has no memory cap of its own: it runs in the
+# worker, so only MAX_WORKER_RSS_MB (below) and the container limit catch it.
+#
+# pandas and openpyxl leave a fragmented heap behind after a big report, so
+# workers are recycled after GUNICORN_MAX_REQUESTS requests (plus jitter), or
+# after the request that took them past MAX_WORKER_RSS_MB. That is done in
+# post_request() rather than with gunicorn's own max_requests: a worker's jobs
+# run in its own process pool and would die with it, so the restart waits
+# until the worker has no jobs left. (Job status polls count as requests too.)
+#
+# pandas and openpyxl are only imported when a worker parses its first
+# report, so workers boot fast and / and the health checks answer straight
+# away. With GUNICORN_PRELOAD=1 the master instead imports the app and loads
+# them once before forking: workers start already warm and share those pages
+# copy-on-write (gc.freeze() keeps the collector from touching, and so
+# copying, them), at the cost of a slower master start and of code changes
+# needing a full restart rather than a HUP.
+
+DEFAULT_WORKER_MEMORY_MB = 400
+
+
+def memory_limit_mb():
+    """Memory this container may use in MB: cgroup v2, cgroup v1, then physical memory."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                text = f.read().strip()
+        except OSError:
+            continue
+        # 'max' (v2) or a huge number (v1) means no limit
+        if text.isdigit() and int(text) < 1 << 60:
+            return int(text) // 1048576
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 1048576
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_workers(cpus, memory_mb, worker_memory_mb, job_workers):
+    by_cpu = 2 * cpus + 1
+    if memory_mb is None:
+        return by_cpu
+    return max(1, min(by_cpu, memory_mb // (worker_memory_mb * (1 + job_workers))))
+
+
+# Set in the environment so app.py (imported by the workers) sees the same values
+os.environ.setdefault('JOB_WORKERS', '2')
+os.environ.setdefault('GUNICORN_THREADS', '4')
+
+worker_memory_mb = int(os.environ.get('WORKER_MEMORY_MB', DEFAULT_WORKER_MEMORY_MB))
+max_worker_rss_mb = float(os.environ.get('MAX_WORKER_RSS_MB', worker_memory_mb * 2))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY') or default_workers(
+    os.cpu_count() or 1, memory_limit_mb(), worker_memory_mb, int(os.environ['JOB_WORKERS'])))
+worker_class = 'gthread'
+threads = int(os.environ['GUNICORN_THREADS'])
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+recycle_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+recycle_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+# Heartbeat files on tmpfs, so a slow disk can't get healthy workers killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+accesslog = '-'
+
+
+def when_ready(server):
+    server.log.info(f"{workers} workers x {threads} threads, {os.environ['JOB_WORKERS']} job processes each; "
+                    f"memory limit {memory_limit_mb()} MB, worker recycled above {max_worker_rss_mb:g} MB")
+    if preload_app:
+        start = time.perf_counter()
+        readers = sys.modules['process_accounting_report'].warm_up()
+        gc.freeze()
+        server.log.info(f"Preloaded the report libraries ({', '.join(readers)} readers) "
+                        f"in {time.perf_counter() - start:.2f}s")
+
+
+def post_fork(server, worker):
+    # Jitter, so workers started together don't all restart together
+    worker.recycle_after = recycle_requests + random.randint(0, recycle_jitter) if recycle_requests else None
+
+
+def _jobs_pending():
+    app = sys.modules.get('app')
+    return app.job_queue.load()['pending'] if app is not None else 0
+
+
+def post_request(worker, req, environ, resp):
+    if not worker.alive:
+        return
+    rss = rss_mb()
+    if rss is not None and rss > max_worker_rss_mb:
+        reason = f"at {rss:g} MB RSS"
+    elif worker.recycle_after and worker.nr >= worker.recycle_after:
+        reason = f"after {worker.nr} requests"
+    else:
+        return
+    if _jobs_pending():
+        return
+    # Finish the requests in hand, then let the arbiter start a fresh worker
+    worker.log.info(f"Worker {worker.pid} {reason}, restarting it")
+    worker.alive = False
@@ -0,0 +1,318 @@
+import csv
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from process_accounting_report import (
+    CSV_DATE_FORMAT, ERRORED_SHEET, PARSER_VERSION, PROCESSED_SHEET, JournalLine, ReportCancelled, ReportColumns,
+    ReportReadError, SheetNotFoundError, columnar_output_paths, column_dtype, iter_report_lines,
+    parse_output_formats, save_report, typed_report_frame,
+)
+from report_layout import get_layout
+from report_metrics import RunMetrics
+from result_cache import content_key
+
+# Incremental runs for a report that is re-exported several times a day while
+# it grows. Next to the output we keep an index of every transaction's
+# fingerprint (section + Transaction Number + Accounting Date -> hash of its
+# lines). The next run still has to stream the whole sheet (an .xlsx can't be
+# read from an offset), but then only does the work the delta needs:
+#   - the same file again: nothing is read or written at all
+#   - no transaction new, changed or removed: the outputs are left as they are
+#   - CSV output: the rows of the transactions at the start of each section
+#     that are unchanged are kept, the files are rewritten from the first
+#     transaction that differs (usually just the new ones at the end)
+#   - anything else, and any change with xlsx/parquet/feather among the
+#     formats: the outputs are rewritten from the new export. That costs a
+#     full run plus fingerprinting, so for those formats the mode only pays
+#     off when re-exports are often unchanged (the CLI says so).
+# The new export is always authoritative, so the outputs end up the same as a
+# full run's.
+
+INDEX_SUFFIX = '.index.json'
+SECTIONS = {'Processed': PROCESSED_SHEET, 'Error': ERRORED_SHEET}
+
+
+def index_path(output_path):
+    return os.path.splitext(output_path)[0] + INDEX_SUFFIX
+
+
+def _key_text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def transaction_key(section, line):
+    return '|'.join([section, _key_text(line.get('Transaction Number')), _key_text(line.get('Accounting Date'))])
+
+
+def transaction_fingerprint(lines):
+    """Hash of a transaction's lines, header values and errors included."""
+    digest = hashlib.blake2b(digest_size=16)
+    for line in lines:
+        pairs = line.pairs() if type(line) is JournalLine else line.items()
+        # str() rather than repr(): the streamed and batch readers hand back
+        # the same numbers as Python and numpy scalars respectively
+        digest.update('\x1f'.join(f"{k}\x1e{v}" for k, v in pairs).encode('utf-8'))
+        digest.update(b'\x1d')
+    return digest.hexdigest()
+
+
+def iter_transactions(lines):
+    """Group (section, line) records into (section, [lines]) per transaction.
+
+    Lines of one transaction share their header dict, so a new dict (or a new
+    section) starts the next group.
+    """
+    section = txn = None
+    group = []
+    for sec, line in lines:
+        current = line.txn if type(line) is JournalLine else (line.get('Transaction Number'),
+                                                             line.get('Accounting Date'))
+        if group and (sec != section or (current is not txn and current != txn)):
+            yield section, group
+            group = []
+        section, txn = sec, current
+        group.append(line)
+    if group:
+        yield section, group
+
+
+def load_index(output_path):
+    try:
+        with open(index_path(output_path)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == PARSER_VERSION else None
+
+
+def save_index(output_path, index):
+    path = index_path(output_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def output_paths(output_path, formats):
+    paths = []
+    for fmt in formats:
+        paths += [output_path] if fmt == 'xlsx' else list(columnar_output_paths(output_path, fmt).values())
+    return paths
+
+
+def _csv_offset(path, records):
+    # Byte offset just past the header and the first `records` rows; counted
+    # with the csv module since a quoted message can span lines
+    consumed = 0
+
+    def lines(f):
+        nonlocal consumed
+        for raw in f:
+            consumed += len(raw)
+            yield raw.decode('utf-8')
+
+    with open(path, 'rb') as f:
+        reader = csv.reader(lines(f))
+        for _ in range(records + 1):
+            if next(reader, None) is None:
+                return None
+    return consumed
+
+
+def _whole_numbers(df):
+    # typed_report_frame() writes an Int64 column as float64 when any value has
+    # a fraction, which a merge couldn't repeat for the rows it keeps
+    return all(bool((pd.to_numeric(df[col], errors='coerce').dropna() % 1 == 0).all())
+               for col in df.columns if column_dtype(col) == 'Int64')
+
+
+def _merge_csv(frames, kept, index, output_path):
+    # Keep the rows of each section's leading unchanged transactions and
+    # rewrite the CSV from there on. False (nothing written) if the result
+    # could differ from a full rewrite, e.g. a column the old file doesn't have.
+    paths = columnar_output_paths(output_path, 'csv')
+    plan = []
+    for section, df in frames.items():
+        path = paths[SECTIONS[section]]
+        if [str(c) for c in df.columns] != index['columns'][section] or not index['whole_numbers'][section]:
+            return False
+        tail = df.iloc[kept[section]:]
+        if tail.empty and kept[section] == index['lines'][section]:
+            continue
+        offset = _csv_offset(path, kept[section])
+        if offset is None or not _whole_numbers(tail):
+            return False
+        plan.append((path, offset, typed_report_frame(tail, SECTIONS[section])))
+    for path, offset, tail in plan:
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+        tail.to_csv(path, mode='a', header=False, index=False, date_format=CSV_DATE_FORMAT)
+    return [path for path, _, _ in plan]
+
+
+def update_report(input_path, output_path, batch=False, workers=None, fast_write=False,
+                  output_format='xlsx', metrics=None, sheet_name=None, progress=None, cancel=None, layout=None,
+                  summary=None):
+    # Incremental counterpart of process_accounting_report(): same arguments and
+    # messages, but returns a summary dict ('status' is 'current', 'unchanged',
+    # 'merged' or 'rewritten', plus transaction and line counts), or None if
+    # the input could not be read or the output could not be saved.
+    if metrics is None:
+        metrics = RunMetrics(source=os.path.basename(input_path))
+    try:
+        formats = parse_output_formats(output_format)
+        layout = get_layout(layout)
+    except ValueError as e:
+        print(f"Error: {e}")
+        metrics.finish('failed')
+        return None
+
+    index = load_index(output_path)
+    if index is not None and (index.get('formats') != list(formats)
+                              or not all(os.path.exists(p) for p in output_paths(output_path, formats))):
+        index = None
+    # A different layout profile can parse the same export differently
+    source_key = content_key(input_path, f"{PARSER_VERSION}+{layout.fingerprint}")
+    if index is not None and index.get('source') == source_key and summary is None:
+        print(f"Output is up to date with {input_path}")
+        metrics.finish('ok')
+        return {'status': 'current', 'processed': index['lines']['Processed'], 'errored': index['lines']['Error'],
+                'new': 0, 'changed': 0, 'removed': 0, 'unchanged': len(index['transactions']), 'paths': []}
+    previous = index['transactions'] if index is not None else {}
+    # Each section's old transactions in output order, for the CSV merge
+    old_order = {section: [] for section in SECTIONS}
+    for key in previous:
+        old_order[key.split('|', 1)[0]].append(key)
+
+    print(f"Reading input file: {input_path}")
+    try:
+        lines = iter_report_lines(input_path, batch=batch, workers=workers, metrics=metrics, log=print,
+                                  sheet_name=sheet_name, progress=progress, cancel=cancel, layout=layout)
+    except SheetNotFoundError as e:
+        print(f"Error: Could not find the report sheet. {e}")
+        metrics.finish('failed')
+        return None
+    except ReportReadError as e:
+        print(f"Error reading file: {e}")
+        metrics.finish('failed')
+        return None
+    except ReportCancelled as e:
+        print(f"{e}.")
+        metrics.finish('cancelled')
+        return None
+
+    print("Starting processing...")
+    frames = {section: ReportColumns() for section in SECTIONS}
+    transactions = {}
+    seen = {}
+    # Lines of the transactions at the start of each section that are still
+    # exactly what the old outputs begin with
+    kept = {section: 0 for section in SECTIONS}
+    leading = {section: True for section in SECTIONS}
+    done = {section: 0 for section in SECTIONS}
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+    try:
+        with metrics.stage('parse'):
+            for section, txn_lines in iter_transactions(lines):
+                if summary is not None:
+                    summary.add_transaction(section, txn_lines, os.path.basename(input_path))
+                key = transaction_key(section, txn_lines[0])
+                # The same number and date twice in a section: number the repeats
+                seen[key] = seen.get(key, 0) + 1
+                if seen[key] > 1:
+                    key = f"{key}#{seen[key]}"
+                fingerprint = transaction_fingerprint(txn_lines)
+                transactions[key] = [fingerprint, len(txn_lines)]
+                old = previous.get(key)
+                if old is None:
+                    counts['new'] += 1
+                elif old[0] == fingerprint:
+                    counts['unchanged'] += 1
+                else:
+                    counts['changed'] += 1
+                if leading[section]:
+                    position = done[section]
+                    if position < len(old_order[section]) and old_order[section][position] == key \
+                            and old[0] == fingerprint:
+                        kept[section] += len(txn_lines)
+                    else:
+                        leading[section] = False
+                done[section] += 1
+                for line in txn_lines:
+                    frames[section].append(line)
+    except ReportCancelled as e:
+        print(f"{e}.")
+        metrics.finish('cancelled')
+        return None
+    counts['removed'] = sum(1 for key in previous if key not in transactions)
+    for name, n in counts.items():
+        metrics.count(f"{name}_transactions", n)
+
+    with metrics.stage('frames'):
+        df_proc, df_err = frames['Processed'].to_frame(), frames['Error'].to_frame()
+    metrics.count('transactions', len(transactions))
+    metrics.count('processed_lines', len(df_proc))
+    metrics.count('errored_lines', len(df_err))
+    print(f"Extraction complete. Processed Lines: {len(df_proc)}, Error Lines: {len(df_err)}")
+    print(f"Transactions: {counts['new']} new, {counts['changed']} changed, {counts['removed']} removed, "
+          f"{counts['unchanged']} unchanged")
+
+    written = []
+    try:
+        with metrics.stage('write'):
+            if index is not None and not counts['new'] and not counts['changed'] and not counts['removed']:
+                status = 'unchanged'
+                print("No changes since the last run, outputs left as they are")
+            else:
+                # A write that fails half way must not leave an index that
+                # vouches for the old outputs
+                _remove(index_path(output_path))
+                merged = False
+                if index is not None and formats == ('csv',):
+                    merged = _merge_csv({'Processed': df_proc, 'Error': df_err}, kept, index, output_path)
+                if merged is not False:
+                    status = 'merged'
+                    written = merged
+                    for path in written:
+                        print(f"Updated: {path}")
+                else:
+                    status = 'rewritten'
+                    if index is not None and formats != ('csv',):
+                        print("Rewriting the outputs in full (only CSV output can be updated in place)")
+                    written = save_report(df_proc, df_err, output_path, output_format, fast_write)
+                    for path in written:
+                        print(f"Successfully saved to: {path}")
+            save_index(output_path, {
+                'version': PARSER_VERSION,
+                'source': source_key,
+                'formats': list(formats),
+                'columns': {'Processed': [str(c) for c in df_proc.columns], 'Error': [str(c) for c in df_err.columns]},
+                'lines': {'Processed': len(df_proc), 'Error': len(df_err)},
+                'whole_numbers': {'Processed': _whole_numbers(df_proc), 'Error': _whole_numbers(df_err)},
+                'transactions': transactions,
+            })
+    except PermissionError as e:
+        print(f"CRITICAL ERROR: Permission denied when writing to '{e.filename or output_path}'.")
+        print("Please close the Excel file if it is open and run the script again.")
+        metrics.finish('failed')
+        return None
+    except Exception as e:
+        print(f"Error saving file: {e}")
+        metrics.finish('failed')
+        return None
+    metrics.finish('ok')
+    return {'status': status, 'processed': len(df_proc), 'errored': len(df_err), **counts, 'paths': written}
@@ -0,0 +1,320 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from process_accounting_report import CancelToken, output_name as report_output_name, process_accounting_report
+from report_metrics import REGISTRY, RunMetrics
+from scratch_space import upload_name
+
+# Background processing for the web app. Each job is a directory holding the
+# upload, the output, the worker's console log and a status.json. Status lives
+# on disk rather than in a dict so any gunicorn worker can answer for any job.
+# For the same reason a job is cancelled by creating a flag file in its
+# directory, which the worker's CancelToken picks up between rows.
+
+DEFAULT_JOBS_DIR = os.path.join(tempfile.gettempdir(), 'accounting_report_jobs')
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+CANCEL_FLAG = 'cancel'
+
+DEFAULT_TIMEOUT_SECONDS = 15 * 60
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+def _limit_memory(limit_mb):
+    # Pool initializer: cap the heap of each job process, so a report too big
+    # for the box fails that one job with MemoryError instead of getting the
+    # whole container OOM-killed
+    if resource is not None and limit_mb:
+        limit = int(limit_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def _write_json(path, data):
+    # A temp file of its own per write: the job process and the web process
+    # (cancel, a dead worker noticed by status()) can write the same status.json
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _last_line(path):
+    try:
+        with open(path) as f:
+            lines = f.read().strip().splitlines()
+    except FileNotFoundError:
+        return ''
+    return lines[-1] if lines else ''
+
+
+def run_job(job_dir, input_path, output_path, timeout=None):
+    """Worker: process one upload, keeping status.json and log.txt up to date.
+
+    A job still running after `timeout` seconds is stopped and marked failed.
+    """
+    status_path = os.path.join(job_dir, 'status.json')
+    log_path = os.path.join(job_dir, 'log.txt')
+    status = _read_status(job_dir)
+    metrics = RunMetrics(source=status.get('filename'))
+    cancel = CancelToken(flag_path=os.path.join(job_dir, CANCEL_FLAG), timeout=timeout)
+    if cancel.cancelled and not cancel.timed_out:
+        # Cancelled while it was still queued (a timeout already up is the
+        # run's to report, as a failure)
+        status.update(status=CANCELLED, finished=time.time(), metrics=metrics.finish(CANCELLED))
+        _write_json(status_path, status)
+        return status
+    status.update(status=RUNNING, started=time.time(), pid=os.getpid())
+    _write_json(status_path, status)
+
+    def progress(p):
+        # Already throttled by the parser to a couple of writes a second
+        status['progress'] = p._asdict()
+        _write_json(status_path, status)
+
+    # Line-buffered so GET /jobs/<id> can show the latest message mid-run
+    with open(log_path, 'w', buffering=1) as log, contextlib.redirect_stdout(log):
+        try:
+            result = process_accounting_report(input_path, output_path, metrics=metrics, progress=progress,
+                                               cancel=cancel)
+        except Exception as e:
+            print(f"Error: {e}")
+            result = None
+
+    status.update(finished=time.time())
+    status.pop('progress', None)
+    if result is None and cancel.cancelled and not cancel.timed_out:
+        status.update(status=CANCELLED)
+    elif result is None:
+        status.update(status=FAILED, error=_last_line(log_path) or 'unknown error')
+    else:
+        df_proc, df_err = result
+        status.update(status=DONE, processed=len(df_proc), errored=len(df_err))
+    # The pool process's own totals are never scraped; the parent records this
+    status['metrics'] = metrics.result or metrics.finish('failed')
+    _write_json(status_path, status)
+    return status
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _read_status(job_dir):
+    with open(os.path.join(job_dir, 'status.json')) as f:
+        return json.load(f)
+
+
+class JobQueue:
+    def __init__(self, directory=DEFAULT_JOBS_DIR, workers=2, result_cache=None, cache_key=None,
+                 save_upload=None, max_pending=None, memory_limit_mb=None, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        # cache_key(input_path) -> key for result_cache; hits finish immediately.
+        # save_upload(file_storage, path) replaces file_storage.save, e.g. to enforce a size limit.
+        # submit() raises QueueFull while max_pending jobs (default 8 per
+        # worker) are queued or running here; memory_limit_mb caps each job
+        # process's heap and timeout_seconds how long one job may run.
+        self.directory = directory
+        self.workers = workers
+        self.result_cache = result_cache
+        self.cache_key = cache_key
+        self.save_upload = save_upload
+        self.max_pending = max_pending or workers * 8
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout_seconds = timeout_seconds
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        # JOBS_DIR / JOB_WORKERS / JOB_QUEUE_MAX / JOB_MEMORY_MB / JOB_TIMEOUT_SECONDS;
+        # job directories are expired by the app's scratch sweeper
+        return cls(directory=os.environ.get('JOBS_DIR', DEFAULT_JOBS_DIR),
+                   workers=int(os.environ.get('JOB_WORKERS', 2)),
+                   max_pending=int(os.environ.get('JOB_QUEUE_MAX', 0)) or None,
+                   memory_limit_mb=float(os.environ.get('JOB_MEMORY_MB', 0)) or None,
+                   timeout_seconds=float(os.environ.get('JOB_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS)), **kwargs)
+
+    def _executor(self):
+        # Created on first use, so importing the app (e.g. in a gunicorn master) doesn't fork.
+        # Job processes come from a forkserver, not a fork of this process:
+        # gunicorn's gthread workers are multi-threaded, and a child forked
+        # while another thread holds a lock (logging, the import lock, ...)
+        # can hang on it for good. The server imports this module once, so
+        # new job processes still start warm.
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['job_queue'])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=_limit_memory, initargs=(self.memory_limit_mb,))
+            return self._pool
+
+    def load(self):
+        """Jobs queued or running in this process, against the pool size and the queue limit."""
+        with self._lock:
+            pending = self._pending
+        return {'pending': pending, 'workers': self.workers, 'max_pending': self.max_pending,
+                'busy_workers': min(pending, self.workers), 'queued': max(0, pending - self.workers),
+                'saturation': round(min(pending, self.workers) / self.workers, 2),
+                'full': pending >= self.max_pending}
+
+    def job_dir(self, job_id):
+        if not JOB_ID_PATTERN.fullmatch(job_id or ''):
+            return None
+        path = os.path.join(self.directory, job_id)
+        return path if os.path.isdir(path) else None
+
+    def submit(self, file_storage):
+        """Save an uploaded file and queue it; returns the job id.
+
+        QueueFull if this process already has max_pending jobs.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull("Too many reports are being processed, please try again in a minute")
+            # Taken before the upload is saved, so uploads arriving together
+            # can't all get past the check
+            self._pending += 1
+        queued = False
+        try:
+            job_id, queued = self._submit(file_storage)
+        finally:
+            if not queued:
+                with self._lock:
+                    self._pending -= 1
+        return job_id
+
+    def _submit(self, file_storage):
+        # (job id, whether it went to the pool rather than finishing from the cache)
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir)
+        filename = upload_name(file_storage.filename)
+        input_path = os.path.join(job_dir, filename)
+        try:
+            if self.save_upload:
+                self.save_upload(file_storage, input_path)
+            else:
+                file_storage.save(input_path)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        output_name = report_output_name(filename)
+        output_path = os.path.join(job_dir, output_name)
+
+        status = {'id': job_id, 'status': QUEUED, 'filename': filename, 'output_name': output_name,
+                  'submitted': time.time()}
+        key = self.cache_key(input_path) if self.result_cache and self.cache_key else None
+        cached_path = self.result_cache.get(key) if key else None
+        if cached_path:
+            # Copied so a later cache eviction can't break the download
+            shutil.copyfile(cached_path, output_path)
+            status.update(status=DONE, cached=True, finished=time.time())
+            _write_json(os.path.join(job_dir, 'status.json'), status)
+            return job_id, False
+
+        _write_json(os.path.join(job_dir, 'status.json'), status)
+        future = self._executor().submit(run_job, job_dir, input_path, output_path, self.timeout_seconds)
+        future.add_done_callback(lambda f: self._finished(f, job_dir, key, output_path))
+        return job_id, True
+
+    def _finished(self, future, job_dir, key, output_path):
+        # Runs in the parent once the worker returns
+        with self._lock:
+            self._pending -= 1
+        if future.exception() is not None:
+            # The worker process itself died (e.g. killed for memory)
+            status = _read_status(job_dir)
+            status.update(status=FAILED, error=f"worker crashed: {future.exception()}", finished=time.time())
+            _write_json(os.path.join(job_dir, 'status.json'), status)
+            REGISTRY.observe({'status': 'crashed'})
+            return
+        status = future.result()
+        REGISTRY.observe(status['metrics'])
+        if status['status'] == DONE and key:
+            self.result_cache.put(key, output_path)
+
+    def status(self, job_id):
+        """Public view of a job's status, or None for an unknown id."""
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        status = _read_status(job_dir)
+        if status['status'] == RUNNING and status.get('pid') and not _process_alive(status['pid']):
+            # Its worker was killed (out of memory, or its web worker went away)
+            status.update(status=FAILED, error="The worker processing this report stopped", finished=time.time())
+            status.pop('progress', None)
+            _write_json(os.path.join(job_dir, 'status.json'), status)
+        info = {k: status[k] for k in ('id', 'status', 'filename', 'processed', 'errored', 'error', 'cached',
+                                       'progress') if k in status}
+        started = status.get('started', status['submitted'])
+        info['elapsed'] = round(status.get('finished', time.time()) - started, 2)
+        if status['status'] == RUNNING:
+            info['message'] = _last_line(os.path.join(job_dir, 'log.txt'))
+        return info
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns its status, or None for an unknown id.
+
+        A running job stops at the parser's next check, usually within a
+        fraction of a second; one still queued is marked cancelled right away
+        and skipped when a worker picks it up.
+        """
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        status = _read_status(job_dir)
+        if status['status'] not in FINISHED:
+            CancelToken(flag_path=os.path.join(job_dir, CANCEL_FLAG)).cancel()
+            if status['status'] == QUEUED:
+                status.update(status=CANCELLED, finished=time.time())
+                _write_json(os.path.join(job_dir, 'status.json'), status)
+        return self.status(job_id)
+
+    def result(self, job_id):
+        """(path, download name) of a finished job's workbook, else None."""
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        status = _read_status(job_dir)
+        if status['status'] != DONE:
+            return None
+        return os.path.join(job_dir, status['output_name']), status['output_name']
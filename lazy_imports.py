@@ -0,0 +1,47 @@
+import importlib
+
+# pandas, numpy and openpyxl take about half a second to import, which every
+# CLI call and every web worker used to pay at startup, even for --help or a
+# health check. Modules bind them with lazy_module() instead:
+#
+#   pd = lazy_module('pandas', globals(), 'pd')
+#
+# The first attribute lookup (pd.DataFrame, ...) imports the real module and
+# puts it in place of the stand-in, so after that the name is the module
+# itself and lookups cost nothing extra. HEAVY_MODULES is what
+# benchmark_report.py --startup checks `import app` leaves alone;
+# process_accounting_report.warm_up() loads them up front when the server
+# preloads.
+
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name, namespace, alias):
+        self._name = name
+        self._namespace = namespace
+        self._alias = alias
+
+    def load(self):
+        module = importlib.import_module(self._name)
+        # Only replace ourselves, not something rebound since
+        if self._namespace.get(self._alias) is self:
+            self._namespace[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            # Our own attributes, e.g. while being copied or pickled
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+def lazy_module(name, namespace, alias):
+    """A LazyModule for `name`, to be bound as `alias` in `namespace` (a module's globals())."""
+    return LazyModule(name, namespace, alias)
+
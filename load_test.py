@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_report import DEFAULT_DATA_DIR
+from generate_sample_report import generate_report, parse_row_count
+
+# Load test for the web app, standard library only. Start the production
+# server locally and point this at it:
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#   python load_test.py http://127.0.0.1:8000 --concurrency 8 --requests 40
+#   python load_test.py http://127.0.0.1:8000 --sync --rows 10k
+#
+# Each request uploads a report through /jobs, polls it and downloads the
+# result (or posts it to the synchronous /process with --sync). /readyz is
+# sampled while the test runs. Prints latency percentiles per outcome and the
+# busiest queue and thread numbers seen.
+
+
+def _multipart(path):
+    boundary = uuid.uuid4().hex
+    with open(path, 'rb') as f:
+        data = f.read()
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{os.path.basename(path)}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+    return head + data + f'\r\n--{boundary}--\r\n'.encode('utf-8'), f'multipart/form-data; boundary={boundary}'
+
+
+def _request(url, body=None, content_type=None, timeout=600):
+    # (HTTP status, body bytes); connection errors come back as status 0
+    request = urllib.request.Request(url, data=body, method='POST' if body is not None else 'GET')
+    if content_type:
+        request.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except OSError as e:
+        return 0, str(e).encode('utf-8')
+
+
+def run_job(base_url, body, content_type, poll_interval=0.5):
+    """Upload through /jobs and wait for the download; returns an outcome name."""
+    status, reply = _request(base_url + '/jobs', body, content_type)
+    if status != 202:
+        return f"upload {status}"
+    job = json.loads(reply)
+    errors = 0
+    while True:
+        time.sleep(poll_interval)
+        status, reply = _request(base_url + job['status_url'])
+        if status == 0 and errors < 3:
+            # A worker restarting drops the connections it had accepted
+            errors += 1
+            continue
+        if status != 200:
+            return f"status {status}"
+        state = json.loads(reply)['status']
+        if state == 'done':
+            status, _ = _request(base_url + job['result_url'])
+            return 'ok' if status == 200 else f"result {status}"
+        if state in ('failed', 'cancelled'):
+            return state
+
+
+def run_sync(base_url, body, content_type):
+    status, _ = _request(base_url + '/process', body, content_type)
+    return 'ok' if status == 200 else f"process {status}"
+
+
+def sample_readiness(base_url, samples, stop, interval=0.5):
+    while not stop.is_set():
+        status, reply = _request(base_url + '/readyz', timeout=5)
+        if status in (200, 503):
+            samples.append(json.loads(reply))
+        stop.wait(interval)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def print_results(outcomes, samples, wall_seconds):
+    headers = ['Outcome', 'Count', 'p50 s', 'p95 s', 'Max s']
+    table = []
+    for outcome in sorted(outcomes):
+        seconds = outcomes[outcome]
+        table.append([outcome, str(len(seconds)), f"{percentile(seconds, 0.5):.2f}",
+                      f"{percentile(seconds, 0.95):.2f}", f"{max(seconds):.2f}"])
+    widths = [max(len(row[i]) for row in [headers] + table) for i in range(len(headers))]
+    for n, row in enumerate([headers] + table):
+        print("  ".join([row[0].ljust(widths[0])] + [cell.rjust(w) for cell, w in zip(row[1:], widths[1:])]))
+        if n == 0:
+            print("  ".join("-" * w for w in widths))
+    total = sum(len(s) for s in outcomes.values())
+    print(f"\n{total} requests in {wall_seconds:.1f}s ({total / wall_seconds:.2f}/s)")
+    if samples:
+        # Whichever worker answered each sample
+        print(f"/readyz: busy {sum(s['status'] != 'ready' for s in samples)} of {len(samples)} samples, "
+              f"max pending jobs {max(s['jobs']['pending'] for s in samples)}, "
+              f"max requests in flight {max(s['requests']['in_flight'] for s in samples)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the report web app.")
+    parser.add_argument('url', help="base URL, e.g. http://127.0.0.1:8000")
+    parser.add_argument('report', nargs='?', help="report to upload (default: a generated synthetic one)")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="requests at a time (default 4)")
+    parser.add_argument('-n', '--requests', type=int, default=20, help="requests in total (default 20)")
+    parser.add_argument('--rows', default='10k', help="size of the generated report (default 10k)")
+    parser.add_argument('--sync', action='store_true', help="post to /process instead of using /jobs")
+    args = parser.parse_args(argv)
+
+    report = args.report
+    if report is None:
+        os.makedirs(DEFAULT_DATA_DIR, exist_ok=True)
+        report = os.path.join(DEFAULT_DATA_DIR, f"synthetic_{args.rows}.xlsx")
+        if not os.path.exists(report):
+            print(f"Generating {report} ...")
+            generate_report(report, rows=parse_row_count(args.rows))
+    body, content_type = _multipart(report)
+    base_url = args.url.rstrip('/')
+
+    outcomes = {}
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        outcome = run_sync(base_url, body, content_type) if args.sync else run_job(base_url, body, content_type)
+        with lock:
+            outcomes.setdefault(outcome, []).append(time.perf_counter() - start)
+
+    samples = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_readiness, args=(base_url, samples, stop), daemon=True)
+    sampler.start()
+    print(f"{args.requests} requests, {args.concurrency} at a time, uploading {report}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    wall_seconds = time.perf_counter() - start
+    stop.set()
+    sampler.join()
+    print()
+    print_results(outcomes, samples, wall_seconds)
+    return 0 if set(outcomes) == {'ok'} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,298 +1,2162 @@
-import pandas as pd
-import numpy as np
 import os
 import re
+import io
+import csv
+import zipfile
+from xml.etree import ElementTree
+import importlib.util
+import sys
+import glob
+import contextlib
+import time
+import threading
+import datetime
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait
+from collections import namedtuple
+from collections.abc import Mapping
+from report_metrics import METRICS_LOGGER, RunMetrics
+from report_layout import DEFAULT_LAYOUT, LayoutError, available_layouts, get_layout
+from report_profile import ReportProfile, format_profile
+from lazy_imports import HEAVY_MODULES, lazy_module
 
-def process_accounting_report(input_path, output_path):
-    print(f"Reading input file: {input_path}")
-    
+# Imported on first use (see lazy_imports.py), so the CLI and the web app
+# start without them
+pd = lazy_module('pandas', globals(), 'pd')
+np = lazy_module('numpy', globals(), 'np')
+openpyxl = lazy_module('openpyxl', globals(), 'openpyxl')
+
+# Bump whenever a change alters the extracted output, so cached results
+# (see result_cache.py) from an older parser are not served again.
+PARSER_VERSION = "2.2"
+
+# Cell values that pd.read_excel turned into NaN (its default na_values), plus the
+# error codes openpyxl hands back for error cells. The streaming reader maps these
+# to NaN so the parser sees the same values it used to get from read_excel.
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+    '#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!',
+])
+
+
+class ReportError(Exception):
+    """Base class for the errors the library API raises."""
+
+
+class ReportReadError(ReportError):
+    """The workbook could not be opened or read."""
+
+
+class SheetNotFoundError(ReportReadError, ValueError):
+    # Also a ValueError, which is what a missing sheet used to raise
+    """The workbook has no sheet that looks like the report (or not the one asked for)."""
+
+
+class ReportCancelled(ReportError):
+    """The run was stopped through its CancelToken."""
+
+
+def _open_source(source):
+    # Path, binary file object or the workbook's bytes -> something openpyxl can load
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def _normalize_cell(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, str):
+        # Whitespace-only cells are blank too: calamine reads some of them as
+        # empty, so every reader has to, or results depend on the reader.
+        # The rest are interned: the same ledger, class, currency and message
+        # text repeats on thousands of rows, and every parsed line keeps a reference
+        return np.nan if value in NA_STRINGS or value.isspace() else sys.intern(value)
+    # read_excel returned whole-number floats as ints
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# --- Readers ------------------------------------------------------------------
+# Oracle exports arrive as .xlsx, .xls, .xlsb or CSV. Each reader backend turns
+# one of them into the same stream of rows (lists of _normalize_cell() values)
+# for the parser. READERS lists the backends for each format in order of
+# preference; the first one whose package is installed is used.
+# python-calamine (Rust, reads every Excel format) is the fastest, but it loads
+# a whole sheet into memory. That is no worse than xlrd for .xls and it gets
+# .xlsb dates right where pyxlsb doesn't, so it comes first for those; for
+# .xlsx openpyxl's read-only mode streams in flat memory however big the report,
+# so calamine is only used there when asked for. REPORT_READER=<name> forces
+# a backend, e.g. REPORT_READER=calamine to trade memory for speed or to
+# compare results.
+
+READERS = {
+    '.xlsx': ('openpyxl', 'calamine'),
+    '.xls': ('calamine', 'xlrd'),
+    '.xlsb': ('calamine', 'pyxlsb'),
+    '.csv': ('csv',),
+}
+READER_MODULES = {'calamine': 'python_calamine', 'openpyxl': 'openpyxl', 'xlrd': 'xlrd', 'pyxlsb': 'pyxlsb',
+                  'csv': 'csv'}
+INPUT_SUFFIXES = ('.xlsx', '.xlsm', '.xls', '.xlsb', '.csv')
+
+# What a CSV cell has to look like to be read as a number (no leading zeros,
+# so codes like '007' stay text)
+CSV_NUMBER_PATTERN = re.compile(r"^-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?$")
+
+
+class SheetRows:
+    """The rows of one sheet, plus `reader`, the name of the backend reading
+    them, `sheet`, the sheet's name (None for CSV), and `total`, the number of
+    rows the sheet says it has (None when the reader can't tell up front)."""
+
+    def __init__(self, reader, rows, sheet=None, total=None):
+        self.reader = reader
+        self.sheet = sheet
+        self.total = total
+        self._rows = rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._rows)
+
+    def close(self):
+        self._rows.close()
+
+
+# Bytes looked at to tell a CSV file from something that isn't one
+SNIFF_BYTES = 4096
+
+
+def detect_format(source, filename=None):
+    """'.xlsx', '.xls', '.xlsb' or '.csv', from the file's first bytes rather than its name.
+
+    Anything that isn't a workbook is only taken for CSV when its name
+    (`filename`, else the path) ends in .csv, or it has no such name and
+    starts out as text. A file named like a workbook that isn't one, an empty
+    file or binary junk raise ReportReadError.
+    """
+    if filename is None:
+        filename = _source_name(source)
+    source = _open_source(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return _sniff_format(f, filename)
+    position = source.tell()
     try:
-        # Read the raw sheet (Sheet2), header=None because data starts at variable rows
-        df = pd.read_excel(input_path, sheet_name='Sheet2', header=None)
-    except ValueError as e:
-        print(f"Error: Could not read 'Sheet2'. Available sheets might be different. {e}")
-        return
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return
+        return _sniff_format(source, filename)
+    finally:
+        source.seek(position)
 
-    processed_rows = []
-    error_rows = []
-    
-    # Context variables
-    current_section = "Unknown" 
-    current_txn_info = {}
-    current_txn_lines = []
-    current_errors = []
-    
-    # Relaxed Regex patterns
-    # Relaxed Regex patterns
-    txn_num_pattern = re.compile(r"Transaction Number", re.IGNORECASE)
-    # Relaxed to capture "Journal Entries", "Journal Entries Processed", etc.
-    # We use ^ to ensure it's at the start of the row data to avoid matching messages in the middle
-    section_processed_pattern = re.compile(r"^\s*Journal Entr.*", re.IGNORECASE)
-    # Relaxed to capture "Journal Entries with Errors", "Journal Entry Errors", "Journal Entries Errored"
-    section_error_pattern = re.compile(r"^\s*Journal Entr.*Error", re.IGNORECASE)
-    
-    rows = df.values.tolist()
-    
-    def flush_transaction():
-        nonlocal current_txn_lines, current_errors, current_txn_info, current_section
-        
-        if not current_txn_lines:
+
+def _source_name(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    name = getattr(source, 'name', None)
+    return name if isinstance(name, str) else None
+
+
+def _sniff_format(f, filename=None):
+    head = f.read(SNIFF_BYTES)
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        # OLE2 compound file: the old binary .xls
+        return '.xls'
+    if head.startswith(b'PK'):
+        f.seek(-len(head), io.SEEK_CUR)
+        try:
+            with zipfile.ZipFile(f) as archive:
+                return '.xlsb' if 'xl/workbook.bin' in archive.namelist() else '.xlsx'
+        except zipfile.BadZipFile:
+            return '.xlsx'
+    if not head:
+        raise ReportReadError("The file is empty")
+    suffix = os.path.splitext(filename)[1].lower() if filename else ''
+    if suffix == '.csv':
+        return '.csv'
+    if suffix in INPUT_SUFFIXES:
+        # e.g. a truncated download, or an HTML page saved as .xls
+        raise ReportReadError(f"Not a valid {suffix} workbook: the file's contents aren't an Excel file")
+    if _looks_like_text(head):
+        return '.csv'
+    raise ReportReadError("Not an Excel workbook or a CSV file")
+
+
+def _looks_like_text(head):
+    # UTF-8 without NUL bytes, which is what the CSV reader expects
+    if b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A character cut in half at the end of the sample is fine
+        return e.reason == 'unexpected end of data'
+    return True
+
+
+def choose_reader(fmt):
+    """Name of the fastest installed backend for a format from detect_format()."""
+    names = READERS[fmt]
+    forced = os.environ.get('REPORT_READER')
+    return _first_installed((forced,) if forced in names else names, fmt)
+
+
+def _first_installed(names, fmt):
+    for name in names:
+        if importlib.util.find_spec(READER_MODULES[name]) is not None:
+            return name
+    packages = ' or '.join(READER_MODULES[name].replace('_', '-') for name in names)
+    raise ReportReadError(f"Reading {fmt} files needs {packages} (pip install {READER_MODULES[names[-1]]})")
+
+
+def iter_sheet_rows(input_path, sheet_name=None, layout=None, filename=None):
+    """Stream a worksheet row by row with the fastest reader for its format.
+
+    input_path may also be a binary file object or the workbook's bytes. The
+    workbook is opened and the sheet name checked eagerly so a bad file or a
+    missing sheet (SheetNotFoundError) fails here; rows are only read as the
+    caller iterates. Without a sheet_name the report sheet is found with
+    find_report_sheet(), using `layout`'s markers. Returns a SheetRows, whose
+    `reader` says which backend was used. A CSV file is its only sheet,
+    whatever sheet_name says; without a sheet_name it is still checked for
+    the report's markers. `filename` is the name the file came with, when
+    input_path isn't a path (see detect_format()).
+    """
+    fmt = detect_format(input_path, filename)
+    reader = choose_reader(fmt)
+    if sheet_name is None:
+        sheet_name = _find_report_sheet(input_path, fmt, layout=layout)
+    rows, total = _READER_FUNCTIONS[reader](_open_source(input_path), sheet_name)
+    return SheetRows(reader, rows, sheet_name, total)
+
+
+def _missing_sheet(sheet_name, available):
+    return SheetNotFoundError(f"Worksheet named '{sheet_name}' not found. Available sheets: {list(available)}")
+
+
+# Each backend returns (row generator, total rows or None). Totals come from
+# the sheet's dimension record, which is only used for progress reporting.
+
+def _openpyxl_rows(source, sheet_name):
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    if sheet_name not in workbook.sheetnames:
+        available = workbook.sheetnames
+        workbook.close()
+        raise _missing_sheet(sheet_name, available)
+    worksheet = workbook[sheet_name]
+    return _stream_rows(workbook, worksheet), worksheet.max_row
+
+
+def _stream_rows(workbook, worksheet):
+    try:
+        for row in worksheet.iter_rows(values_only=True):
+            yield [_normalize_cell(v) for v in row]
+    finally:
+        workbook.close()
+
+
+def _calamine_rows(source, sheet_name):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_object(source)
+    if sheet_name not in workbook.sheet_names:
+        available = workbook.sheet_names
+        workbook.close()
+        raise _missing_sheet(sheet_name, available)
+    sheet = workbook.get_sheet_by_name(sheet_name)
+    return _stream_calamine(workbook, sheet), sheet.end[0] + 1 if sheet.end else 0
+
+
+def _calamine_value(value):
+    # Whole-day dates come back as datetime.date; openpyxl gives datetimes
+    if type(value) is datetime.date:
+        return datetime.datetime(value.year, value.month, value.day)
+    return _normalize_cell(value)
+
+
+def _stream_calamine(workbook, sheet):
+    # calamine starts at the first used cell; pad back to A1 like openpyxl so
+    # row numbers and column positions come out the same. (A whitespace-only
+    # inline string written without xml:space="preserve", as openpyxl does,
+    # reads as empty here; _normalize_cell() makes it blank for every reader.)
+    try:
+        yield from _stream_calamine_rows(sheet)
+    finally:
+        workbook.close()
+
+
+def _stream_calamine_rows(sheet):
+    first_row, first_col = sheet.start or (0, 0)
+    for _ in range(first_row):
+        yield []
+    lead = [np.nan] * first_col
+    for row in sheet.iter_rows():
+        yield lead + [_calamine_value(v) for v in row]
+
+
+def _open_xlrd(source):
+    import xlrd
+
+    # on_demand: sheets are only parsed when asked for
+    if isinstance(source, (str, os.PathLike)):
+        return xlrd.open_workbook(source, on_demand=True)
+    return xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+
+
+def _xlrd_row(cells, datemode):
+    import xlrd
+
+    row = []
+    for cell in cells:
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            value = xlrd.xldate_as_datetime(cell.value, datemode)
+        elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            value = bool(cell.value)
+        elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+            value = None
+        else:
+            value = cell.value
+        row.append(_normalize_cell(value))
+    return row
+
+
+def _xlrd_rows(source, sheet_name):
+    book = _open_xlrd(source)
+    if sheet_name not in book.sheet_names():
+        available = book.sheet_names()
+        book.release_resources()
+        raise _missing_sheet(sheet_name, available)
+    sheet = book.sheet_by_name(sheet_name)
+    return _stream_xlrd(book, sheet), sheet.nrows
+
+
+def _stream_xlrd(book, sheet):
+    try:
+        for r in range(sheet.nrows):
+            yield _xlrd_row(sheet.row(r), book.datemode)
+    finally:
+        book.release_resources()
+
+
+def _pyxlsb_rows(source, sheet_name):
+    from pyxlsb import open_workbook
+
+    workbook = open_workbook(source)
+    if sheet_name not in workbook.sheets:
+        available = workbook.sheets
+        workbook.close()
+        raise _missing_sheet(sheet_name, available)
+    sheet = workbook.get_sheet(sheet_name)
+    dimension = getattr(sheet, 'dimension', None)
+    return _stream_pyxlsb(workbook, sheet), dimension.r + dimension.h if dimension else None
+
+
+def _stream_pyxlsb(workbook, sheet):
+    # .xlsb keeps dates as serial numbers and pyxlsb doesn't read the cell
+    # styles that say which ones are dates, so dates come out as numbers here;
+    # python-calamine doesn't have that problem
+    try:
+        with sheet:
+            for row in sheet.rows(sparse=False):
+                yield [_normalize_cell(cell.v) for cell in row]
+    finally:
+        workbook.close()
+
+
+def _csv_rows(source, sheet_name):
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, encoding='utf-8-sig', newline='')
+        return _stream_csv(f, f.close), None
+    # The caller's file object stays open, like it does for the Excel readers
+    f = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+    return _stream_csv(f, f.detach), None
+
+
+def _stream_csv(f, release):
+    # CSV cells have no types: numbers are read as numbers, everything else
+    # (dates included) stays text
+    number = CSV_NUMBER_PATTERN.match
+    try:
+        for row in csv.reader(f):
+            yield [_normalize_cell(float(v) if number(v) else v) for v in row]
+    finally:
+        release()
+
+
+_READER_FUNCTIONS = {
+    'calamine': _calamine_rows,
+    'openpyxl': _openpyxl_rows,
+    'xlrd': _xlrd_rows,
+    'pyxlsb': _pyxlsb_rows,
+    'csv': _csv_rows,
+}
+
+
+# --- Finding the report sheet ---------------------------------------------------
+# Oracle names the report sheet 'Sheet2', but renamed copies and workbooks with
+# extra sheets turn up too. Every sheet is scored on its first rows only, read
+# by something that can stop there. For .xlsx that is _sample_xlsx() below:
+# opening a workbook with openpyxl, even read-only, parses the whole
+# shared-strings table, which for a big report is most of the file. .xlsb goes
+# through pyxlsb, which streams each sheet, and .xls through xlrd, which parses
+# one sheet at a time. calamine always loads a whole sheet, so it is only the
+# fallback for those two. A CSV file's first rows are checked the same way, so
+# a text file that isn't a report fails instead of coming out empty.
+
+DEFAULT_SHEET = 'Sheet2'
+SHEET_SAMPLE_ROWS = 200
+SAMPLE_READERS = {
+    '.xls': ('xlrd', 'calamine'),
+    '.xlsb': ('pyxlsb', 'calamine'),
+}
+
+
+def score_sheet(rows, layout=None):
+    """How much rows look like the report: one point per "Journal Entr..."
+    section title or "Transaction Number" block, 0 without any section title
+    (our own output sheets have a "Transaction Number" column, but no titles)."""
+    layout = get_layout(layout)
+    sections = blocks = 0
+    for index, row in enumerate(rows):
+        tag = classify_row(index, row, layout).tag
+        if tag is SECTION_PROCESSED or tag is SECTION_ERROR:
+            sections += 1
+        elif tag is TXN_HEADER:
+            blocks += 1
+    return sections + blocks if sections else 0
+
+
+def find_report_sheet(source, sample_rows=SHEET_SAMPLE_ROWS, layout=None):
+    """Name of the sheet that holds the report, judged by its first sample_rows rows.
+
+    Ties go to 'Sheet2', then to the first sheet. Raises SheetNotFoundError
+    when no sheet has any report markers; returns None for a CSV file that has them.
+    """
+    return _find_report_sheet(source, detect_format(source), sample_rows, layout)
+
+
+def _find_report_sheet(source, fmt, sample_rows=SHEET_SAMPLE_ROWS, layout=None):
+    if fmt in _FORMAT_SAMPLERS:
+        sampler = _FORMAT_SAMPLERS[fmt]
+    else:
+        sampler = _SAMPLERS[_first_installed(SAMPLE_READERS[fmt], fmt)]
+    source = _open_source(source)
+    position = None if isinstance(source, (str, os.PathLike)) else source.tell()
+    try:
+        scores = {name: score_sheet(rows, layout) for name, rows in sampler(source, sample_rows)}
+    finally:
+        if position is not None:
+            source.seek(position)
+    if fmt == '.csv' and not max(scores.values()):
+        raise SheetNotFoundError(f"The CSV file doesn't look like a Create Accounting report "
+                                 f"(checked its first {sample_rows} rows)")
+    if not scores or max(scores.values()) == 0:
+        raise SheetNotFoundError(f"No sheet looks like a Create Accounting report "
+                                 f"(checked the first {sample_rows} rows of {list(scores)})")
+    return max(scores, key=lambda name: (scores[name], name == DEFAULT_SHEET))
+
+
+def _local(tag):
+    # '{namespace}row' -> 'row'; transitional and strict OOXML use different namespaces
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column_index(ref):
+    # 'AB12' -> 27
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - 64
+    return index - 1
+
+
+def _item_text(element):
+    # Text of a shared or inline string: its <t> parts, skipping phonetic runs
+    if _local(element.tag) == 't':
+        return element.text or ''
+    return ''.join(_item_text(child) for child in element if _local(child.tag) != 'rPh')
+
+
+class _SharedStrings:
+    """Shared-strings table parsed only as far as the highest index asked for."""
+
+    def __init__(self, archive, path):
+        self.items = []
+        self._events = ElementTree.iterparse(archive.open(path)) if path in archive.namelist() else iter(())
+
+    def __getitem__(self, index):
+        while len(self.items) <= index:
+            try:
+                _, element = next(self._events)
+            except StopIteration:
+                return None
+            if _local(element.tag) == 'si':
+                self.items.append(_item_text(element))
+                element.clear()
+        return self.items[index]
+
+
+def _sample_xlsx(source, sample_rows):
+    # Sheet names from workbook.xml, then the first rows of each worksheet's
+    # XML. Values are only good enough for score_sheet(): numbers aren't
+    # checked against their number formats, so dates stay serial numbers.
+    with zipfile.ZipFile(source) as archive:
+        workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+        strings = _SharedStrings(archive, 'xl/sharedStrings.xml')
+        for sheet in workbook.iter():
+            if _local(sheet.tag) != 'sheet':
+                continue
+            rel_id = next((v for k, v in sheet.attrib.items() if _local(k) == 'id'), None)
+            target = targets.get(rel_id, '')
+            path = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+            if 'worksheets/' not in path or path not in archive.namelist():
+                continue  # chartsheet or dialog sheet
+            yield sheet.get('name'), _sample_xlsx_rows(archive.open(path), strings, sample_rows)
+
+
+def _sample_xlsx_rows(f, strings, sample_rows):
+    rows = []
+    with f:
+        for _, element in ElementTree.iterparse(f):
+            if _local(element.tag) != 'row':
+                continue
+            row = []
+            for cell in element:
+                if _local(cell.tag) != 'c':
+                    continue
+                column = _column_index(cell.get('r', '')) if cell.get('r') else len(row)
+                row.extend([np.nan] * (column - len(row)))
+                kind = cell.get('t', 'n')
+                value = next((child.text for child in cell if _local(child.tag) == 'v'), None)
+                if kind == 's' and value is not None:
+                    value = strings[int(value)]
+                elif kind == 'inlineStr':
+                    value = ''.join(_item_text(child) for child in cell if _local(child.tag) == 'is')
+                elif kind == 'n' and value is not None:
+                    value = float(value)
+                elif kind == 'e':
+                    value = None
+                row.append(_normalize_cell(value))
+            element.clear()
+            rows.append(row)
+            if len(rows) >= sample_rows:
+                break
+    return rows
+
+
+def _sample_xlrd(source, sample_rows):
+    book = _open_xlrd(source)
+    try:
+        for name in book.sheet_names():
+            sheet = book.sheet_by_name(name)
+            yield name, [_xlrd_row(sheet.row(r), book.datemode) for r in range(min(sample_rows, sheet.nrows))]
+            book.unload_sheet(name)
+    finally:
+        book.release_resources()
+
+
+def _sample_pyxlsb(source, sample_rows):
+    from pyxlsb import open_workbook
+
+    workbook = open_workbook(source)
+    try:
+        for name in workbook.sheets:
+            with workbook.get_sheet(name) as sheet:
+                rows = sheet.rows(sparse=False)
+                yield name, [[_normalize_cell(cell.v) for cell in row] for _, row in zip(range(sample_rows), rows)]
+    finally:
+        workbook.close()
+
+
+def _sample_calamine(source, sample_rows):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_object(source)
+    try:
+        for name in workbook.sheet_names:
+            rows = _stream_calamine_rows(workbook.get_sheet_by_name(name))
+            yield name, [row for _, row in zip(range(sample_rows), rows)]
+    finally:
+        workbook.close()
+
+
+def _sample_csv(source, sample_rows):
+    # The one "sheet" of a CSV file, named None
+    rows, _ = _csv_rows(source, None)
+    try:
+        yield None, [row for _, row in zip(range(sample_rows), rows)]
+    finally:
+        rows.close()
+
+
+_SAMPLERS = {
+    'xlrd': _sample_xlrd,
+    'pyxlsb': _sample_pyxlsb,
+    'calamine': _sample_calamine,
+}
+# Formats with a sampler of their own, whatever reader is installed
+_FORMAT_SAMPLERS = {
+    '.xlsx': _sample_xlsx,
+    '.csv': _sample_csv,
+}
+
+
+# Relaxed Regex patterns
+# The markers rows are recognised by (section titles, "Transaction Number",
+# "Accounting Class", ...) come from a layout profile, see report_layout.py.
+# Functions taking a `layout` accept anything get_layout() does; None is the
+# default English profile (or REPORT_LAYOUT).
+
+# Row tags assigned by classify_row()
+SECTION_ERROR = 'SECTION_ERROR'
+SECTION_PROCESSED = 'SECTION_PROCESSED'
+TXN_HEADER = 'TXN_HEADER'
+LINE_HEADER = 'LINE_HEADER'
+ERROR_HEADER = 'ERROR_HEADER'
+TOTAL = 'TOTAL'
+DATA = 'DATA'
+BLANK = 'BLANK'
+SKIP = 'SKIP'              # one of the profile's skip_rows
+
+# classify_frame() tags come back as plain strings; map them to the constants
+# the parser compares by identity
+TAGS = {t: t for t in [SECTION_ERROR, SECTION_PROCESSED, TXN_HEADER, LINE_HEADER,
+                       ERROR_HEADER, TOTAL, DATA, BLANK, SKIP]}
+
+# Parser states
+SCAN = 'SCAN'                  # between blocks, looking for the next marker
+TXN_BLOCK = 'TXN_BLOCK'        # reading key/value rows under "Transaction Number"
+LINE_TABLE = 'LINE_TABLE'      # rows under an "Accounting Class" header
+ERROR_TABLE = 'ERROR_TABLE'    # rows under an "Error Message" header
+
+
+class ClassifiedRow(namedtuple('ClassifiedRow', [
+        'index', 'tag', 'values', 'cells', 'text',
+        'has_txn', 'has_line_header', 'has_error_header', 'has_total', 'ends_table'])):
+    # One sheet row, stringified and matched once.
+    #   cells       str() of every value ('nan' for empty cells)
+    #   text        the non-empty cells joined with spaces
+    #   ends_table  the row closes a line/error table: a transaction header or a
+    #               section title starting in the first column (summary or not)
+    __slots__ = ()
+
+
+def classify_row(index, row, layout=None):
+    # `layout` is a compiled ReportLayout; the hot loops pass the one they
+    # resolved up front
+    if layout is None:
+        layout = get_layout()
+    cells = [str(x) for x in row]
+    # Filter out 'nan' string which comes from str(np.nan)
+    text = " ".join([x for x in cells if x != 'nan' and x != 'None'])
+
+    # One scan of the text for every text marker, one set lookup per cell for
+    # the whole-cell ones; most rows have neither
+    found = layout.find(text)
+    if 'skip' in found:
+        return ClassifiedRow(index, SKIP, row, cells, text, False, False, False, False, False)
+    has_txn = 'txn' in found
+    has_total = 'total' in found
+    if layout.cell_markers.isdisjoint(cells):
+        has_line_header = has_error_header = False
+    else:
+        has_line_header = layout.line_header in cells
+        has_error_header = layout.error_header in cells
+
+    section = None
+    ends_table = has_txn
+    if 'section' in found:
+        if layout.section_exclude is None or not layout.section_exclude.search(text):
+            section = SECTION_ERROR if layout.error_section.search(text) else SECTION_PROCESSED
+        # Inside a table only a title in the first column counts, so match
+        # against the row with its empty cells still in place
+        ends_table = ends_table or layout.section_title.search(" ".join(cells)) is not None
+
+    if section is not None:
+        tag = section
+    elif ends_table and not has_txn:
+        # Summary table title or "Total" row that looks like a section title
+        tag = TOTAL
+    elif has_txn:
+        tag = TXN_HEADER
+    elif has_line_header:
+        tag = LINE_HEADER
+    elif has_error_header:
+        tag = ERROR_HEADER
+    elif has_total:
+        tag = TOTAL
+    elif not text.strip():
+        tag = BLANK
+    else:
+        tag = DATA
+
+    return ClassifiedRow(index, tag, row, cells, text,
+                         has_txn, has_line_header, has_error_header, has_total, ends_table)
+
+
+class JournalLine(Mapping):
+    """One parsed table row; reads like the dict of column -> value it replaces.
+
+    The row's own cells are a tuple, keyed by a column -> position dict shared
+    by every row of its table. Once the transaction is flushed, `txn` is the
+    transaction's header values (one dict shared by all its lines, not copied
+    onto each) and, in the Error section, `error` its joined messages. Keys
+    come out in the order the old line.update(txn_info) dict had them.
+    """
+
+    __slots__ = ('columns', 'values', 'txn', 'error')
+
+    def __init__(self, columns, values, txn=None, error=None):
+        self.columns = columns
+        self.values = values
+        self.txn = txn
+        self.error = error
+
+    def __getitem__(self, key):
+        if self.error is not None and key == 'Error':
+            return self.error
+        txn = self.txn
+        if txn and key in txn:
+            return txn[key]
+        return self.values[self.columns[key]]
+
+    def __iter__(self):
+        columns = self.columns
+        yield from columns
+        if self.txn:
+            for key in self.txn:
+                if key not in columns:
+                    yield key
+        if self.error is not None and 'Error' not in columns:
+            yield 'Error'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def pairs(self):
+        # (key, value) in key order without a lookup per key; items() does the same, slower
+        error = self.error
+        txn = self.txn or {}
+        for key, pos in self.columns.items():
+            if error is not None and key == 'Error':
+                yield key, error
+            else:
+                yield key, txn[key] if key in txn else self.values[pos]
+        for key, value in txn.items():
+            if key not in self.columns:
+                yield key, value
+        if error is not None and 'Error' not in self.columns:
+            yield 'Error', error
+
+    def __repr__(self):
+        return f"JournalLine({dict(self)!r})"
+
+
+class ReportColumns:
+    """Column buffers that journal lines are appended to; to_frame() builds the
+    DataFrame from them directly, with the same columns, order and NaN gaps
+    pd.DataFrame(list_of_dicts) would give."""
+
+    def __init__(self):
+        self.columns = {}
+        self.length = 0
+
+    def append(self, line):
+        n = self.length
+        columns = self.columns
+        added = 0
+        for key, value in (line.pairs() if type(line) is JournalLine else line.items()):
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [np.nan] * n
+            column.append(value)
+            added += 1
+        self.length = n + 1
+        if added != len(columns):
+            for column in columns.values():
+                if len(column) == n:
+                    column.append(np.nan)
+
+    def to_frame(self):
+        if not self.columns:
+            return pd.DataFrame()
+        return pd.DataFrame(self.columns)
+
+
+class ReportParser:
+    """State machine over classified rows.
+
+    feed() takes one ClassifiedRow and returns the (section, line) tuples of any
+    transaction it completed; close() flushes the last one.
+    """
+
+    def __init__(self, section="Unknown", log=print, metrics=None, layout=None):
+        # Context variables
+        self.section = section
+        # The ReportLayout giving the header keys and table key columns
+        self.layout = get_layout(layout)
+        # Where "Found Section" messages go; None silences them
+        self.log = log
+        # Optional RunMetrics; time spent flushing transactions is charged to 'flush'
+        self.metrics = metrics
+        self.state = SCAN
+        self.txn_info = {}
+        self.txn_lines = []
+        self.errors = []
+        # Transactions emitted so far, for progress reports
+        self.transactions = 0
+        # Column index -> header name of the table being read, plus the columns
+        # that make a row count as data ("Line"/"Accounting Class" or "Error Message")
+        self.table_map = {}
+        self.table_keys = ()
+        # The table's distinct header names -> tuple position (shared by its
+        # JournalLines), and the sheet column each position is read from
+        self.table_columns = {}
+        self.table_cells = []
+
+    def feed(self, row):
+        state = self.state
+        if row.tag is SKIP:
+            return ()
+        if state is TXN_BLOCK:
+            # The block runs until the line table header or the next transaction
+            if row.has_line_header or row.has_txn:
+                self.state = SCAN
+                return self._dispatch(row.tag, row.index, row.values, row.text)
+            self._read_txn_keys(row.values)
+            return ()
+
+        if state is LINE_TABLE:
+            # "Error Message" header might appear inside an Error section block
+            if row.ends_table or row.has_error_header:
+                self.state = SCAN
+                return self._dispatch(row.tag, row.index, row.values, row.text)
+            if not row.has_total:
+                self._read_line_row(row.values)
+            return ()
+
+        if state is ERROR_TABLE:
+            if row.ends_table:
+                self.state = SCAN
+                return self._dispatch(row.tag, row.index, row.values, row.text)
+            if not row.has_total:
+                self._read_error_row(row.values)
+            return ()
+
+        return self._dispatch(row.tag, row.index, row.values, row.text)
+
+    def close(self):
+        return self._flush()
+
+    def _dispatch(self, tag, index, values, text, present=None):
+        # What a row does outside of a block; `values` is the row as a list and
+        # `present` its notna() mask when the caller already has one
+        if tag is SECTION_ERROR or tag is SECTION_PROCESSED:
+            emitted = self._flush()
+            self.section = 'Error' if tag is SECTION_ERROR else 'Processed'
+            if self.log:
+                self.log(f"Found Section: {self.section} (Row {index + 1}): {text}")
+            return emitted
+
+        if tag is TXN_HEADER:
+            emitted = self._flush()
+            self.state = TXN_BLOCK
+            self._read_txn_keys(values, present)
+            return emitted
+
+        if tag is LINE_HEADER:
+            self._start_table(values, LINE_TABLE, self.layout.line_keys, present)
+        elif tag is ERROR_HEADER:
+            self._start_table(values, ERROR_TABLE, self.layout.error_keys, present)
+        return ()
+
+    def _read_txn_keys(self, values, present=None):
+        # Extract Key-Value pairs
+        # We look for known keys and find the first value to their right
+        for k, name in self.layout.header_names:
+            if k in values:
+                if present is None:
+                    present = pd.notna(np.asarray(values, dtype=object))
+                k_idx = values.index(k)
+                for val_idx in range(k_idx + 1, len(values)):
+                    if present[val_idx]:
+                        val_str = str(values[val_idx])
+                        if val_str.lower() != 'nan' and val_str.strip() != '':
+                            self.txn_info[name] = values[val_idx]
+                            break
+
+    def _start_table(self, values, state, key_names, present=None):
+        if present is None:
+            present = pd.notna(np.asarray(values, dtype=object))
+        labels = {idx: str(values[idx]).strip() for idx in np.flatnonzero(present).tolist()}
+        self.table_keys = [idx for idx, label in labels.items() if label in key_names]
+        self.table_map = {idx: self.layout.column(label) for idx, label in labels.items()}
+        # A repeated header name keeps its first position but the last column's
+        # value, as building a dict from table_map did
+        last_idx = {name: idx for idx, name in self.table_map.items()}
+        self.table_columns = {name: pos for pos, name in enumerate(last_idx)}
+        self.table_cells = list(last_idx.values())
+        self.state = state
+
+    def _read_table_row(self, values, target):
+        width = len(values)
+        if any(idx < width and pd.notna(values[idx]) for idx in self.table_keys):
+            # Rows streamed from a sheet without a dimension record can be ragged
+            cells = tuple(values[idx] if idx < width else np.nan for idx in self.table_cells)
+            target.append(JournalLine(self.table_columns, cells))
+
+    # Line and error tables are read the same way; they have their own entry
+    # points so a profile (report_profile.py) can tell the two apart
+    def _read_line_row(self, values):
+        self._read_table_row(values, self.txn_lines)
+
+    def _read_error_row(self, values):
+        self._read_table_row(values, self.errors)
+
+    def _read_line_block(self, block, present):
+        self._read_table_block(block, self.txn_lines, present)
+
+    def _read_error_block(self, block, present):
+        self._read_table_block(block, self.errors, present)
+
+    def _read_table_block(self, block, target, present):
+        # Batch counterpart of _read_table_row(): `block` is a 2-D object array
+        # of consecutive data rows with the "Total" rows already dropped, and
+        # `present` its notna() mask
+        if not len(block):
             return
-        
-        for line in current_txn_lines:
-            # Merge txn info (Transaction Number, Date, etc.)
-            line.update(current_txn_info)
+        if self.table_keys:
+            valid = present[:, self.table_keys].any(axis=1)
+        else:
+            valid = np.zeros(len(block), dtype=bool)
+        columns = self.table_columns
+        for vals in block[valid][:, self.table_cells].tolist():
+            target.append(JournalLine(columns, tuple(vals)))
+
+    def _index_errors(self):
+        # Built once per transaction: line number -> " | "-joined messages of
+        # the errors on that line, plus the joined messages of all its errors
+        messages_by_line = {}
+        for e in self.errors:
+            err_line = e.get('Line')
+            if pd.notna(err_line):
+                messages_by_line.setdefault(str(err_line).strip(), []).append(e.get('Error Message'))
+        errors_by_line = {num: " | ".join([str(m) for m in messages if pd.notna(m)])
+                          for num, messages in messages_by_line.items()}
+        all_errors = " | ".join([str(e.get('Error Message')) for e in self.errors
+                                 if pd.notna(e.get('Error Message'))])
+        return errors_by_line, all_errors
+
+    def _flush(self):
+        if self.metrics is None or not self.txn_lines:
+            return self._flush_lines()
+        start = time.perf_counter()
+        emitted = self._flush_lines()
+        self.metrics.add_time('flush', time.perf_counter() - start)
+        return emitted
+
+    def _flush_lines(self):
+        if not self.txn_lines:
+            return ()
+
+        current_section = self.section
+        if current_section == 'Error':
+            errors_by_line, all_errors = self._index_errors()
+
+        emitted = []
+        txn_info = self.txn_info
+        for line in self.txn_lines:
+            # Attach txn info (Transaction Number, Date, etc.), shared by reference
+            line.txn = txn_info
             
             # Logic for Error Section
             if current_section == 'Error':
-                line_num = line.get('Line')
-                # Find matching errors for this line
-                matching_errors = [e.get('Error Message') for e in current_errors 
-                                   if str(e.get('Line', '')).strip() == str(line_num).strip() and pd.notna(e.get('Line'))]
-                
-                if matching_errors:
-                    line['Error'] = " | ".join([str(m) for m in matching_errors if pd.notna(m)])
-                else:
-                    # Fallback: If no specific line match, attach ALL errors for this transaction
-                    # This ensures we don't lose the error message usually at the transaction level
-                    all_trans_errors = [e.get('Error Message') for e in current_errors if pd.notna(e.get('Error Message'))]
-                    if all_trans_errors:
-                         line['Error'] = " | ".join([str(m) for m in all_trans_errors])
-                    else:
-                        line['Error'] = ""
+                # Errors for this line number, or the fallback: ALL errors for this
+                # transaction, so we don't lose the message usually given at the
+                # transaction level
+                line.error = errors_by_line.get(str(line.get('Line')).strip(), all_errors)
             
-            # Append to appropriate list
-            if current_section == 'Processed':
-                processed_rows.append(line)
-            elif current_section == 'Error':
-                error_rows.append(line)
+            # Emit into the appropriate output
+            if current_section in ('Processed', 'Error'):
+                emitted.append((current_section, line))
         
+        if emitted:
+            self.transactions += 1
         # Reset per-transaction buffers
-        current_txn_lines = []
-        current_errors = []
+        self.txn_lines = []
+        self.errors = []
         # We reset txn_info because "Transaction Number" usually restarts the block
-        current_txn_info = {}
+        self.txn_info = {}
+        return emitted
 
-    print("Starting processing...")
-    
-    i = 0
-    while i < len(rows):
-        row = rows[i]
-        row_str = [str(x) for x in row]
-        # Filter out 'nan' string which comes from str(np.nan)
-        clean_cells = [x for x in row_str if x != 'nan' and x != 'None']
-        row_joined = " ".join(clean_cells)
-        
-        # 1. Detect Section Headers
-        # Exclusion keywords to avoid summary tables and "Total" rows triggering sections
-        exclusion_keywords = ["Event Class", "Number of documents", "Number of events", "Total for Journal Entry"]
-        is_summary_or_total = any(k.lower() in row_joined.lower() for k in exclusion_keywords)
-
-        # We start with Error pattern check
-        if section_error_pattern.search(row_joined):
-            if is_summary_or_total:
-                i += 1
-                continue
-            flush_transaction()
-            print(f"Found Section: Error (Row {i+1}): {row_joined}")
-            current_section = 'Error'
-            i += 1
-            continue
-            
-        if section_processed_pattern.search(row_joined):
-            if is_summary_or_total:
-                i += 1
-                continue
-            flush_transaction()
-            print(f"Found Section: Processed (Row {i+1}): {row_joined}")
-            current_section = 'Processed'
-            i += 1
-            continue
-            
-        # 2. Detect Transaction Header Block
-        if txn_num_pattern.search(row_joined):
-            flush_transaction()
-            
-            # Scan forward to extract context keys (Transaction Number, Event Class, etc.)
-            # Stop when we hit the table header "Accounting Class" or proper data
-            j = i
-            while j < len(rows):
-                r_scan = rows[j]
-                r_scan_str = [str(x) for x in r_scan]
-                
-                # Stop if we hit the line header
-                if "Accounting Class" in r_scan_str:
-                    break
-                
-                # Stop if we hit a new section or transaction (safety break)
-                # But allow the FIRST row (j=i) to match
-                if j > i:
-                    r_scan_joined = " ".join([str(x) for x in r_scan if str(x) != 'nan'])
-                    if txn_num_pattern.search(r_scan_joined):
-                        break
-
-                # Extract Key-Value pairs
-                # We look for known keys and find the first value to their right
-                known_keys = ["Transaction Number", "Event Class", "Event Type", "Ledger", 
-                              "Accounting Date", "Transaction Date", "Source"]
-                
-                for k in known_keys:
-                    # Simple check: is key in this row?
-                    if k in r_scan_str:
-                        # Find the index
-                        try:
-                            k_idx = r_scan_str.index(k)
-                            # Find next non-nan value
-                            for val_idx in range(k_idx + 1, len(r_scan)):
-                                val = r_scan[val_idx]
-                                if pd.notna(val) and str(val).lower() != 'nan' and str(val).strip() != '':
-                                    current_txn_info[k] = val
-                                    break
-                        except ValueError:
-                            pass
-                j += 1
-            
-            # Don't advance i completely to j, because j might be the "Accounting Class" header line 
-            # which needs to be processed by block 3.
-            # But we can advance i to j-1 to skip the context rows we just read?
-            # actually checking the while condition: we want to process the row j if it is "Accounting Class"
-            i = j 
-            # Note: if j broke because of "Accounting Class", i is now at that line.
-            # Next iteration will catch it in block 3.
-            continue
 
-        # 3. Detect Line Table Header
-        if "Accounting Class" in row_str:
-            # Parse Header
-            line_header_map = {}
-            for idx, cell in enumerate(row):
-                if pd.notna(cell):
-                    line_header_map[idx] = str(cell).strip()
-            
-            # Consume Data Rows
-            i += 1
-            while i < len(rows):
-                r_data = rows[i]
-                r_data_str = [str(x) for x in r_data]
-                r_data_joined = " ".join(r_data_str)
-                
-                # Exit conditions: New Transaction or New Section or Error Header
-                if txn_num_pattern.search(r_data_joined) or \
-                   section_processed_pattern.search(r_data_joined) or \
-                   section_error_pattern.search(r_data_joined):
-                    break
-                
-                # Special Case: "Error Message" header might appear inside an Error section block
-                if "Error Message" in r_data_str:
-                    break
-                
-                # Check for "Total for Journal Entry" and skip
-                if "Total for Journal Entry" in r_data_joined:
-                    i += 1
-                    continue
+# --- Progress and cancellation -------------------------------------------------
+# The parse loops report how far they have got and check for cancellation only
+# every PROGRESS_EVERY_ROWS rows, which costs one integer comparison per row;
+# the callback itself runs at most every PROGRESS_INTERVAL seconds.
 
-                # Check for validity
-                # A valid line usually has a non-empty 'Accounting Class' or 'Line'
-                line_obj = {}
-                is_valid = False
-                for col_idx, col_name in line_header_map.items():
-                    if col_idx < len(r_data):
-                        val = r_data[col_idx]
-                        line_obj[col_name] = val
-                        # criteria: Line column exists or Accounting Class exists
-                        if (col_name == "Line" and pd.notna(val)) or \
-                           (col_name == "Accounting Class" and pd.notna(val)):
-                            is_valid = True
-                            
-                if is_valid:
-                    current_txn_lines.append(line_obj)
-                
-                i += 1
-            continue
+PROGRESS_EVERY_ROWS = 2000
+PROGRESS_INTERVAL = 0.5
 
-        # 4. Detect Error Table Header
-        if "Error Message" in row_str:
-            error_header_map = {}
-            for idx, cell in enumerate(row):
-                if pd.notna(cell):
-                    error_header_map[idx] = str(cell).strip()
-            
-            i += 1
-            while i < len(rows):
-                r_err = rows[i]
-                r_err_str = [str(x) for x in r_err]
-                r_err_joined = " ".join(r_err_str)
-                
-                if txn_num_pattern.search(r_err_joined) or \
-                   section_processed_pattern.search(r_err_joined) or \
-                   section_error_pattern.search(r_err_joined):
-                    break
-
-                if "Total for Journal Entry" in r_err_joined:
-                    i += 1
-                    continue
-                
-                err_obj = {}
-                is_valid = False
-                for col_idx, col_name in error_header_map.items():
-                    if col_idx < len(r_err):
-                        val = r_err[col_idx]
-                        err_obj[col_name] = val
-                        if col_name == "Error Message" and pd.notna(val):
-                            is_valid = True
-                
-                if is_valid:
-                    current_errors.append(err_obj)
-                    
-                i += 1
+# stage is 'read' (the batch paths load the whole sheet first), 'parse' or
+# 'write'; total is None when the reader can't tell how many rows there are.
+# A 'write' Progress counts the output lines instead of sheet rows.
+Progress = namedtuple('Progress', ['stage', 'rows', 'total', 'transactions', 'section'])
+
+
+class CancelToken:
+    """Cooperative cancellation: cancel() from any thread and the run stops
+    with ReportCancelled at its next check.
+
+    With a flag_path the token also counts as cancelled once that file exists,
+    so another process can cancel a run by creating it. With a timeout (in
+    seconds) it cancels itself that long after it was made; `timed_out` then
+    says why.
+    """
+
+    def __init__(self, flag_path=None, timeout=None):
+        self.flag_path = flag_path
+        self.timeout = timeout
+        self._deadline = time.monotonic() + timeout if timeout else None
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+        if self.flag_path is not None:
+            open(self.flag_path, 'a').close()
+
+    @property
+    def timed_out(self):
+        return self._deadline is not None and time.monotonic() > self._deadline
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.flag_path is not None and os.path.exists(self.flag_path):
+            self._event.set()
+        return self._event.is_set() or self.timed_out
+
+    def check(self):
+        if self.cancelled:
+            if self.timed_out and not self._event.is_set():
+                raise ReportCancelled(f"Processing took longer than {self.timeout:g} seconds")
+            raise ReportCancelled("Processing was cancelled")
+
+
+class ProgressReporter:
+    """Throttled progress callbacks and cancellation checks for one run.
+
+    `callback` gets a Progress; `cancel` is a CancelToken. The parse loops call
+    tick() every `every` rows; the callback runs at most every `interval`
+    seconds, and always when a stage starts or ends.
+    """
+
+    def __init__(self, callback=None, cancel=None, every=PROGRESS_EVERY_ROWS, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.cancel = cancel
+        self.every = every
+        self.interval = interval
+        self.stage = None
+        self.total = None
+        self.rows = 0
+        self.transactions = 0
+        self.section = None
+        self._next_report = 0.0
+
+    def snapshot(self):
+        return Progress(self.stage, self.rows, self.total, self.transactions, self.section)
+
+    def start(self, stage, total=None):
+        self.stage = stage
+        self.total = total
+        self.rows = 0
+        self._report(force=True)
+
+    def tick(self, rows, transactions=None, section=None):
+        self.rows = rows
+        if transactions is not None:
+            self.transactions = transactions
+        if section is not None:
+            self.section = section
+        self._report()
+
+    def done(self, transactions=None):
+        # The whole stage is through; the total is exact from here on
+        self.total = self.rows = max(self.rows, self.total or 0)
+        if transactions is not None:
+            self.transactions = transactions
+        self._report(force=True)
+
+    def _report(self, force=False):
+        if self.cancel is not None:
+            self.cancel.check()
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if force or now >= self._next_report:
+            self._next_report = now + self.interval
+            self.callback(self.snapshot())
+
+    def track(self, rows):
+        """Yield from rows, ticking every `every` rows (used while a sheet is loaded whole)."""
+        n = 0
+        for n, row in enumerate(rows, 1):
+            if n % self.every == 0:
+                self.tick(n)
+            yield row
+        self.rows = n
+
+
+def parse_report_rows(rows, metrics=None, log=print, reporter=None, layout=None):
+    """Parse Create Accounting report rows into journal lines.
+
+    `rows` is any iterable of row lists (e.g. iter_sheet_rows()). Each row is
+    classified once and fed to a ReportParser; yields (section, line) tuples,
+    section being 'Processed' or 'Error', as soon as each transaction is complete.
+    With a RunMetrics, time spent reading rows is charged to its 'read' stage.
+    A ProgressReporter is ticked every few thousand rows. `layout` picks the
+    layout profile the rows are matched against.
+    """
+    parser = ReportParser(log=log, metrics=metrics, layout=layout)
+    layout = parser.layout
+    if metrics is not None:
+        rows = metrics.timed_rows(rows)
+    check = reporter.every if reporter is not None else -1
+    index = -1
+    for index, row in enumerate(rows):
+        if index == check:
+            reporter.tick(index, parser.transactions, parser.section)
+            check += reporter.every
+        emitted = parser.feed(classify_row(index, row, layout))
+        if emitted:
+            yield from emitted
+    yield from parser.close()
+    if reporter is not None:
+        reporter.rows = index + 1
+        reporter.done(parser.transactions)
+
+
+def read_sheet_frame(input_path, sheet_name=None):
+    """Load a whole worksheet as an object-dtype DataFrame, one column per sheet column.
+
+    Cells are normalised exactly like iter_sheet_rows(), so both parse paths see
+    the same values.
+    """
+    return pd.DataFrame(list(iter_sheet_rows(input_path, sheet_name)), dtype=object)
+
+
+def _join_cells(frame):
+    # Row-wise " ".join() of an all-string frame. Joining the rows of the object
+    # array measured faster than Series.str.cat over ~40 columns.
+    return pd.Series([" ".join(r) for r in frame.to_numpy(dtype=object).tolist()],
+                     index=frame.index, dtype=object)
+
+
+def classify_frame(df, layout=None):
+    """Column-wise classify_row() for a whole sheet.
+
+    Returns a DataFrame aligned with `df` holding the tag and boundary flags of
+    every row. Empty cells join as '' rather than being dropped, which only adds
+    whitespace the marker patterns already tolerate.
+    """
+    layout = get_layout(layout)
+    present = df.notna()
+    text = _join_cells(df.where(present, '').astype(str))
+
+    has_txn = text.str.contains(layout.transaction).to_numpy(dtype=bool)
+    has_line_header = df.isin([layout.line_header]).any(axis=1).to_numpy()
+    has_error_header = df.isin([layout.error_header]).any(axis=1).to_numpy()
+    has_total = text.str.contains(layout.total_marker, regex=False).to_numpy(dtype=bool)
+    has_key = df.isin(layout.header_keys).any(axis=1).to_numpy()
+    blank = (text.str.strip() == '').to_numpy()
+
+    # Section titles are rare, so the finer checks only run on those rows
+    is_section = text.str.contains(layout.section_title).to_numpy(dtype=bool)
+    section_idx = np.flatnonzero(is_section)
+    section_text = text.iloc[section_idx]
+    if layout.section_exclude is not None:
+        excluded = section_text.str.contains(layout.section_exclude).to_numpy(dtype=bool)
+    else:
+        excluded = np.zeros(len(section_idx), dtype=bool)
+    is_error = section_text.str.contains(layout.error_section).to_numpy(dtype=bool)
+    # Same first-column rule as classify_row(): match with 'nan' left in place
+    section_rows = df.iloc[section_idx]
+    anchored = _join_cells(section_rows.where(section_rows.notna(), 'nan').astype(str)).str.contains(
+        layout.section_title).to_numpy(dtype=bool)
+
+    section_error = np.zeros(len(df), dtype=bool)
+    section_processed = np.zeros(len(df), dtype=bool)
+    section_error[section_idx[~excluded & is_error]] = True
+    section_processed[section_idx[~excluded & ~is_error]] = True
+    ends_table = has_txn.copy()
+    ends_table[section_idx[anchored]] = True
+
+    tag = np.select(
+        [section_error, section_processed, ends_table & ~has_txn, has_txn,
+         has_line_header, has_error_header, has_total, blank],
+        [SECTION_ERROR, SECTION_PROCESSED, TOTAL, TXN_HEADER,
+         LINE_HEADER, ERROR_HEADER, TOTAL, BLANK],
+        default=DATA)
+
+    if layout.skip is not None:
+        # Skipped rows match nothing else and don't end any block
+        skip = text.str.contains(layout.skip).to_numpy(dtype=bool)
+        tag[skip] = SKIP
+        keep = ~skip
+        has_txn, has_line_header, has_error_header = has_txn & keep, has_line_header & keep, has_error_header & keep
+        has_total, has_key, ends_table = has_total & keep, has_key & keep, ends_table & keep
+    else:
+        skip = np.zeros(len(df), dtype=bool)
+
+    return pd.DataFrame({
+        'tag': tag,
+        'has_txn': has_txn,
+        'has_line_header': has_line_header,
+        'has_error_header': has_error_header,
+        'has_total': has_total,
+        'has_key': has_key,
+        'ends_table': ends_table,
+        'skip': skip,
+    }, index=df.index)
+
+
+def _next_at_or_after(positions, start, default):
+    k = np.searchsorted(positions, start)
+    return positions[k] if k < len(positions) else default
+
+
+def _walk_boundaries(marks):
+    # The rows the parser dispatches, and where the block each one opens ends.
+    # Yields (row, tag, end); rows between a dispatched row and its `end` belong
+    # to its transaction header block or table. Mirrors ReportParser.feed().
+    n = len(marks)
+    tags = marks['tag'].to_numpy()
+    has_txn = marks['has_txn'].to_numpy()
+    ends_table = marks['ends_table'].to_numpy()
+    boundaries = np.flatnonzero(marks['tag'].isin(
+        [SECTION_ERROR, SECTION_PROCESSED, TXN_HEADER, LINE_HEADER, ERROR_HEADER]).to_numpy())
+    block_ends = {
+        TXN_HEADER: np.flatnonzero(marks['has_line_header'].to_numpy() | has_txn),
+        LINE_HEADER: np.flatnonzero(ends_table | marks['has_error_header'].to_numpy()),
+        ERROR_HEADER: np.flatnonzero(ends_table),
+    }
+    pos = 0
+    while True:
+        i = _next_at_or_after(boundaries, pos, n)
+        if i >= n:
+            return
+        tag = TAGS[tags[i]]
+        ends = block_ends.get(tag)
+        end = _next_at_or_after(ends, i + 1, n) if ends is not None else i + 1
+        yield i, tag, end
+        pos = end
+
+
+def parse_report_frame(df, marks=None, parser=None, offset=0, metrics=None, log=print, reporter=None, layout=None):
+    """Batch counterpart of parse_report_rows() for a sheet already in memory.
+
+    Rows are classified column-wise by classify_frame() (or `marks`, if given);
+    the Python loop then only visits boundary rows and hands each line/error
+    table to the parser as one array slice. Yields the same (section, line)
+    tuples as the row path. `parser` and `offset` let a caller continue a parse
+    from the middle of a sheet (see parse_report_parallel). A ProgressReporter
+    is ticked as the boundary rows pass every few thousand rows.
+    """
+    if df.empty:
+        return
+    if parser is None:
+        parser = ReportParser(log=log, metrics=metrics, layout=layout)
+    layout = parser.layout
+    if marks is None:
+        marks = classify_frame(df, layout)
+    values = df.to_numpy(dtype=object)
+    present = df.notna().to_numpy()
+    keep = ~(marks['has_total'].to_numpy() | marks['skip'].to_numpy())
+    key_rows = np.flatnonzero(marks['has_key'].to_numpy())
+    check = reporter.every if reporter is not None else len(df)
+
+    for i, tag, end in _walk_boundaries(marks):
+        if i >= check:
+            reporter.tick(int(offset + i), parser.transactions, parser.section)
+            check = i + reporter.every
+        row = values[i].tolist()
+        text = ''
+        if (tag is SECTION_ERROR or tag is SECTION_PROCESSED) and parser.log:
+            # Section titles are printed, so take the exact per-row text
+            text = classify_row(i, row, layout).text
+        emitted = parser._dispatch(tag, offset + i, row, text, present[i])
+        if emitted:
+            yield from emitted
+
+        if tag is TXN_HEADER:
+            for r in key_rows[np.searchsorted(key_rows, i + 1):np.searchsorted(key_rows, end)]:
+                parser._read_txn_keys(values[r].tolist(), present[r])
+        elif tag is LINE_HEADER or tag is ERROR_HEADER:
+            rows = keep[i + 1:end]
+            read = parser._read_line_block if tag is LINE_HEADER else parser._read_error_block
+            read(values[i + 1:end][rows], present[i + 1:end][rows])
+        parser.state = SCAN
+
+    yield from parser.close()
+    if reporter is not None:
+        reporter.rows = offset + len(df)
+        reporter.done(parser.transactions)
+
+
+# Chunks smaller than this are not worth shipping to another process
+MIN_CHUNK_ROWS = 5000
+
+
+def _parse_chunk(df, marks, offset, section, carry, layout=None):
+    # Worker: parse rows [offset, offset + len(df)) of a sheet. `carry` is the
+    # (txn_info, errors) a line-less transaction left behind in the previous
+    # chunk. Returns the lines, whatever this chunk leaves behind and the
+    # number of transactions it emitted.
+    parser = ReportParser(section=section, log=None, layout=layout)
+    if carry:
+        parser.txn_info, parser.errors = carry
+    lines = list(parse_report_frame(df, marks=marks, parser=parser, offset=offset))
+    left = (parser.txn_info, parser.errors) if (parser.txn_info or parser.errors) else None
+    return lines, left, parser.transactions
+
+
+def parse_report_parallel(df, workers=None, log=print, reporter=None, layout=None):
+    """parse_report_frame() split across a process pool at transaction boundaries.
+
+    Every "Transaction Number" row starts a new transaction whatever state the
+    parser is in, so the sheet can be cut there. A first pass walks only the
+    boundary rows to learn the section in force at each cut; the chunks are
+    then parsed in parallel and their lines yielded in sheet order. A
+    transaction without lines leaves its header values and errors to the next
+    one; when a chunk ends that way the following chunk is parsed again with
+    that state, so the result is identical to the serial path. A
+    ProgressReporter hears about each chunk as it comes back, and cancelling
+    drops the chunks not started yet.
+    """
+    n = len(df)
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunk_rows = max(MIN_CHUNK_ROWS, n // (workers * 4) + 1)
+    if workers == 1 or n < 2 * MIN_CHUNK_ROWS:
+        yield from parse_report_frame(df, log=log, reporter=reporter, layout=layout)
+        return
+
+    layout = get_layout(layout)
+    marks = classify_frame(df, layout)
+
+    # First pass: section at each transaction header, and the cut points
+    section = "Unknown"
+    cuts = [(0, section)]
+    for i, tag, end in _walk_boundaries(marks):
+        if tag is SECTION_ERROR or tag is SECTION_PROCESSED:
+            section = 'Error' if tag is SECTION_ERROR else 'Processed'
+            if log:
+                log(f"Found Section: {section} (Row {i + 1}): {classify_row(i, df.iloc[i].tolist(), layout).text}")
+        elif tag is TXN_HEADER and i - cuts[-1][0] >= chunk_rows:
+            cuts.append((i, section))
+    bounds = [start for start, _ in cuts[1:]] + [n]
+
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(cuts)))
+    try:
+        futures = [pool.submit(_parse_chunk, df.iloc[start:stop], marks.iloc[start:stop], start, chunk_section, None,
+                               layout) for (start, chunk_section), stop in zip(cuts, bounds)]
+        carry = None
+        transactions = 0
+        for (start, chunk_section), stop, future in zip(cuts, bounds, futures):
+            if reporter is not None:
+                # Wake up now and then so a cancel doesn't wait for the chunk
+                while not wait([future], timeout=reporter.interval).done:
+                    reporter.tick(int(start), transactions, chunk_section)
+            lines, left, emitted = future.result()
+            if carry:
+                lines, left, emitted = _parse_chunk(df.iloc[start:stop], marks.iloc[start:stop], start,
+                                                    chunk_section, carry, layout)
+            transactions += emitted
+            if reporter is not None:
+                reporter.tick(int(stop), transactions, chunk_section)
+            yield from lines
+            carry = left
+    finally:
+        # Chunks already running are waited for, the rest are dropped
+        pool.shutdown(cancel_futures=True)
+    if reporter is not None:
+        reporter.done(transactions)
+
+
+def read_report_lines(input_path, batch=False, workers=None, metrics=None, log=print, sheet_name=None,
+                      progress=None, cancel=None, layout=None, filename=None):
+    """Open a report and return the iterator of its (section, line) tuples.
+
+    batch=True loads the sheet into a DataFrame and classifies it column-wise
+    (parse_report_frame); workers > 1 does the same but parses chunks of the
+    sheet in that many processes (parse_report_parallel). The default streams
+    the sheet row by row (parse_report_rows). The report sheet is found with
+    find_report_sheet() unless sheet_name is given; SheetNotFoundError (a
+    ValueError) if it can't be. `metrics` (a RunMetrics) gets the sheet and
+    reader used, the row count and read/flush times; `log` gets the sheet and
+    reader and the "Found Section" messages. `progress` is called with a
+    Progress now and then, and a CancelToken in `cancel` stops the run with
+    ReportCancelled (see ProgressReporter). `layout` is the layout profile to
+    match the report against (see report_layout.get_layout()). `filename` is
+    the name of an input that isn't a path, see detect_format().
+    """
+    layout = get_layout(layout)
+    # Read the raw sheet; there is no header row because data starts at variable rows
+    rows = iter_sheet_rows(input_path, sheet_name=sheet_name, layout=layout, filename=filename)
+    if metrics is not None:
+        metrics.label('sheet', rows.sheet)
+        metrics.label('reader', rows.reader)
+        metrics.label('layout', layout.name)
+    if log:
+        log(f"Reading sheet '{rows.sheet}' with {rows.reader}" if rows.sheet else f"Reading with {rows.reader}")
+    reporter = ProgressReporter(progress, cancel) if progress is not None or cancel is not None else None
+    if workers and workers > 1 or batch:
+        if reporter is not None:
+            reporter.start('read', rows.total)
+            df = pd.DataFrame(list(reporter.track(rows)), dtype=object)
+            reporter.done()
+            reporter.start('parse', len(df))
+        else:
+            df = pd.DataFrame(list(rows), dtype=object)
+        if metrics is not None:
+            metrics.count('rows', len(df))
+        if workers and workers > 1:
+            return parse_report_parallel(df, workers=workers, log=log, reporter=reporter, layout=layout)
+        return parse_report_frame(df, metrics=metrics, log=log, reporter=reporter, layout=layout)
+    if reporter is not None:
+        # Rows are read and parsed together here, so there is no 'read' stage
+        reporter.start('parse', rows.total)
+    return parse_report_rows(rows, metrics=metrics, log=log, reporter=reporter, layout=layout)
+
+
+def collect_report_frames(lines, metrics=None):
+    """Drain (section, line) tuples into the processed and errored DataFrames."""
+    df_proc, df_err = _collect_frames(lines, metrics)
+    if metrics is not None:
+        metrics.count('transactions', count_transactions(df_proc, df_err))
+        metrics.count('processed_lines', len(df_proc))
+        metrics.count('errored_lines', len(df_err))
+    return df_proc, df_err
+
+
+def _collect_frames(lines, metrics=None):
+    # Column-wise, so no per-line dicts are ever built. The lines are drained
+    # as they come: a streamed read goes on while this loop runs, and its
+    # share is charged to 'read' by timed_rows(), leaving 'parse' the rest
+    processed = ReportColumns()
+    errored = ReportColumns()
+    with _stage(metrics, 'parse'):
+        for section, line in lines:
+            if section == 'Processed':
+                processed.append(line)
+            else:
+                errored.append(line)
+    with _stage(metrics, 'frames'):
+        return processed.to_frame(), errored.to_frame()
+
+
+def _stage(metrics, name):
+    return metrics.stage(name) if metrics is not None else contextlib.nullcontext()
+
+
+def count_transactions(*frames):
+    # Distinct transaction numbers per output sheet
+    return sum(int(df['Transaction Number'].nunique()) for df in frames if 'Transaction Number' in df)
+
+
+# --- Library API --------------------------------------------------------------
+
+def iter_report_lines(source, batch=False, workers=None, metrics=None, log=None, sheet_name=None,
+                      progress=None, cancel=None, layout=None, filename=None):
+    """Open a report and return an iterator of its (section, line) records.
+
+    `source` is a path, a binary file object or the workbook's bytes. Section is
+    'Processed' or 'Error' and line a JournalLine, a read-only mapping of
+    column -> value (dict(line) for a plain dict); lines come out as
+    each transaction is parsed, so a streaming consumer never holds the whole
+    report. The report sheet is found by its contents unless sheet_name is
+    given. Opening fails straight away with SheetNotFoundError or
+    ReportReadError. `log` gets the "Found Section" messages (default: none).
+    `progress` (a callable taking a Progress) and `cancel` (a CancelToken) are
+    passed to read_report_lines(); a cancelled run raises ReportCancelled.
+    `layout` is a layout name, profile path or dict (default: REPORT_LAYOUT,
+    else 'oracle_en'); LayoutError (a ValueError) if it can't be loaded.
+    `filename` is the name an upload came with: a source that isn't a path is
+    only read as CSV if that says .csv or it looks like text.
+    """
+    # Outside the try: a bad layout is the caller's mistake, not the file's
+    layout = get_layout(layout)
+    try:
+        with _stage(metrics, 'read'):
+            return read_report_lines(source, batch=batch, workers=workers, metrics=metrics, log=log,
+                                     sheet_name=sheet_name, progress=progress, cancel=cancel, layout=layout,
+                                     filename=filename)
+    except ReportError:
+        raise
+    except Exception as e:
+        raise ReportReadError(str(e)) from e
+
+
+def extract_report(source, batch=False, workers=None, metrics=None, log=None, sheet_name=None,
+                   progress=None, cancel=None, layout=None, summary=None, filename=None):
+    """Parse a report into (processed, errored) DataFrames without writing anything.
+
+    Takes the same arguments as iter_report_lines() and raises the same errors.
+    Lines are also counted into `summary` (a ReportSummary) if given.
+    """
+    lines = iter_report_lines(source, batch=batch, workers=workers, metrics=metrics, log=log, sheet_name=sheet_name,
+                              progress=progress, cancel=cancel, layout=layout, filename=filename)
+    if summary is not None:
+        lines = summary.track(lines, os.path.basename(source) if isinstance(source, (str, os.PathLike)) else None)
+    return collect_report_frames(lines, metrics=metrics)
+
+
+def warm_up():
+    """Load what parsing and writing a report needs now, rather than on the first report.
+
+    Returns the names of the reader backends it loaded.
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    readers = []
+    for fmt in ('.xlsx', '.csv'):
+        try:
+            reader = choose_reader(fmt)
+        except ReportReadError:
             continue
+        importlib.import_module(READER_MODULES[reader])
+        readers.append(reader)
+    # pandas imports its Excel machinery on first use
+    report_workbook_bytes(pd.DataFrame(), pd.DataFrame())
+    return readers
+
 
-        # Advance if nothing matched
-        i += 1
+def report_workbook_bytes(df_proc, df_err, fast=False):
+    """The output workbook write_report() would save, as bytes."""
+    buffer = io.BytesIO()
+    write_report(df_proc, df_err, buffer, fast=fast)
+    return buffer.getvalue()
 
-    # Final flush
-    flush_transaction()
+
+PROCESSED_SHEET = 'Journal Entries Processed'
+ERRORED_SHEET = 'Journal Entries Errored'
+
+
+def _output_sheets(df_proc, df_err):
+    # Sheet name -> frame to write, with a one-cell message for an empty result
+    return {
+        PROCESSED_SHEET: df_proc if not df_proc.empty else pd.DataFrame({'Message': ['No processed entries found']}),
+        ERRORED_SHEET: df_err if not df_err.empty else pd.DataFrame({'Message': ['No errored entries found']}),
+    }
+
+
+def write_report(df_proc, df_err, output_path, fast=False):
+    # fast=True skips the openpyxl object model entirely, see _write_report_fast()
+    if fast:
+        _write_report_fast(df_proc, df_err, output_path)
+        return
+
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        for sheet_name, df in _output_sheets(df_proc, df_err).items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+        
+        # Auto-adjust column width
+        for sheet_name in writer.sheets:
+            worksheet = writer.sheets[sheet_name]
+            for column_cells in worksheet.columns:
+                length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
+                # Add a little padding, max out at 50 to avoid massive columns
+                worksheet.column_dimensions[column_cells[0].column_letter].width = min(length + 2, 60)
+
+
+def column_widths(df, sample_rows=None):
+    """Autofit widths computed from the DataFrame instead of the written cells.
+
+    Same rule as the openpyxl pass in write_report(): longest str() of the
+    header or any value, plus 2, capped at 60. With sample_rows only the first
+    that many rows are measured.
+    """
+    if sample_rows is not None:
+        df = df.head(sample_rows)
+    widths = []
+    for name in df.columns:
+        values = df[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            # Cells hold datetimes, measured as str(datetime): 'YYYY-MM-DD HH:MM:SS'
+            lengths = pd.Series(np.where(values.notna(), 19, 0))
+        else:
+            lengths = values.astype(str).str.len().where(values.notna(), 0)
+        longest = max(len(str(name)), int(lengths.max()) if len(lengths) else 0)
+        widths.append(min(longest + 2, 60))
+    return widths
+
+
+def _write_report_fast(df_proc, df_err, output_path, sample_rows=None):
+    # Column widths come from column_widths() and rows are streamed to disk:
+    # xlsxwriter in constant_memory mode when it is installed, otherwise
+    # openpyxl's write-only mode. Neither keeps the sheet in memory.
+    sheets = _output_sheets(df_proc, df_err)
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(output_path, {
+            'constant_memory': True,
+            'default_date_format': 'YYYY-MM-DD HH:MM:SS',
+        })
+        try:
+            header_format = workbook.add_format({'bold': True})
+            for sheet_name, df in sheets.items():
+                worksheet = workbook.add_worksheet(sheet_name)
+                for col, width in enumerate(column_widths(df, sample_rows)):
+                    worksheet.set_column(col, col, width)
+                worksheet.write_row(0, 0, [str(c) for c in df.columns], header_format)
+                for row_idx, row in enumerate(_iter_output_rows(df), start=1):
+                    worksheet.write_row(row_idx, 0, row)
+        finally:
+            workbook.close()
+        return
+
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, df in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        for col, width in enumerate(column_widths(df, sample_rows), start=1):
+            worksheet.column_dimensions[get_column_letter(col)].width = width
+        header = []
+        for name in df.columns:
+            cell = WriteOnlyCell(worksheet, value=str(name))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        worksheet.append(header)
+        date_cols = [i for i, name in enumerate(df.columns) if pd.api.types.is_datetime64_any_dtype(df[name])]
+        for row in _iter_output_rows(df):
+            for i in date_cols:
+                if row[i] is not None:
+                    cell = WriteOnlyCell(worksheet, value=row[i])
+                    cell.number_format = 'YYYY-MM-DD HH:MM:SS'
+                    row[i] = cell
+            worksheet.append(row)
+    workbook.save(output_path)
+
+
+def _iter_output_rows(df):
+    # Rows as lists of plain Python values, missing values as None
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(row)
+
+
+# --- Columnar outputs (Parquet / Feather / CSV) -------------------------------
+
+OUTPUT_FORMATS = ('xlsx', 'parquet', 'feather', 'csv')
+COLUMNAR_SUFFIXES = {PROCESSED_SHEET: '_processed', ERRORED_SHEET: '_errored'}
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Packages a format needs on top of pandas; any one of them will do
+FORMAT_ENGINES = {'parquet': ('pyarrow', 'fastparquet'), 'feather': ('pyarrow',)}
+
+
+def parse_output_formats(output_format):
+    """'parquet', 'xlsx,csv' or ['xlsx', 'feather'] -> tuple of lowercase format names."""
+    if isinstance(output_format, str):
+        output_format = output_format.split(',')
+    formats = tuple(f.strip().lower().lstrip('.') for f in output_format if f.strip())
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Unknown output format {unknown or output_format!r}; choose from {', '.join(OUTPUT_FORMATS)}")
+    # Checked here, before the report is parsed, rather than when saving it
+    for fmt in formats:
+        engines = FORMAT_ENGINES.get(fmt, ())
+        if engines and not any(importlib.util.find_spec(name) is not None for name in engines):
+            raise ValueError(f"Writing {fmt} files needs {' or '.join(engines)} (pip install {engines[0]})")
+    return formats
+
+
+def column_dtype(name):
+    # Explicit dtype for an output column, decided by its header.
+    # Transaction Number stays text: it is an identifier, not a quantity.
+    name = str(name)
+    if name == 'Line' or name.endswith(' Line'):
+        return 'Int64'
+    if 'Date' in name:
+        return 'datetime64[ns]'
+    if any(word in name for word in ('Debit', 'Credit', 'Amount')):
+        return 'float64'
+    return 'string'
+
+
+def typed_report_frame(df, name=''):
+    """Copy of df with every column converted to its column_dtype().
+
+    Values that don't fit (e.g. text in an amount column) become missing, and
+    we say how many so it doesn't happen silently.
+    """
+    typed = {}
+    for col in df.columns:
+        values = df[col]
+        dtype = column_dtype(col)
+        if dtype != 'string' and pd.api.types.is_string_dtype(values):
+            # Blank cells (' ') are just missing, not conversion failures
+            values = values.mask(values.map(lambda v: isinstance(v, str) and not v.strip()))
+        if dtype == 'string':
+            converted = values.astype('string')
+        elif dtype.startswith('datetime'):
+            converted = pd.to_datetime(values, errors='coerce')
+        else:
+            converted = pd.to_numeric(values, errors='coerce')
+            if dtype == 'Int64':
+                whole = converted.dropna() % 1 == 0
+                converted = converted.astype('Int64' if whole.all() else 'float64')
+        lost = int((values.notna() & converted.isna()).sum())
+        if lost:
+            print(f"Warning: {lost} value(s) in {name + ' ' if name else ''}column '{col}' are not {dtype}, written as missing")
+        typed[col] = converted
+    return pd.DataFrame(typed, index=df.index)
+
+
+def columnar_output_paths(output_path, fmt):
+    # Output.xlsx -> Output_processed.<fmt>, Output_errored.<fmt>
+    stem = os.path.splitext(output_path)[0]
+    return {sheet: f"{stem}{suffix}.{fmt}" for sheet, suffix in COLUMNAR_SUFFIXES.items()}
+
+
+def write_columnar_report(df_proc, df_err, output_path, fmt):
+    """Write both tables as <stem>_processed.<fmt> and <stem>_errored.<fmt>.
+
+    Parquet and Feather need pyarrow. Returns the paths written.
+    """
+    paths = columnar_output_paths(output_path, fmt)
+    frames = {PROCESSED_SHEET: df_proc, ERRORED_SHEET: df_err}
+    for sheet, path in paths.items():
+        df = typed_report_frame(frames[sheet], sheet).reset_index(drop=True)
+        df.columns = [str(c) for c in df.columns]
+        if fmt == 'parquet':
+            df.to_parquet(path, index=False)
+        elif fmt == 'feather':
+            df.to_feather(path)
+        else:
+            df.to_csv(path, index=False, date_format=CSV_DATE_FORMAT)
+    return list(paths.values())
+
+
+def read_report_tables(output_path, fmt):
+    """Load the (processed, errored) tables written by write_columnar_report()."""
+    paths = columnar_output_paths(output_path, fmt)
+    frames = []
+    for sheet, path in paths.items():
+        if fmt == 'parquet':
+            df = pd.read_parquet(path)
+        elif fmt == 'feather':
+            df = pd.read_feather(path)
+        else:
+            # CSV keeps no types, so apply the same column_dtype() rules on the way in
+            try:
+                df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame()
+            df = typed_report_frame(df, sheet)
+        frames.append(df)
+    return tuple(frames)
+
+
+def save_report(df_proc, df_err, output_path, output_format='xlsx', fast_write=False):
+    # Writes every requested format; returns the list of files written. If one
+    # fails, whatever this call wrote is removed before the error goes on up,
+    # so a failed run doesn't leave some formats (or half a file) behind
+    written = []
+    paths = []
+    try:
+        for fmt in parse_output_formats(output_format):
+            if fmt == 'xlsx':
+                paths = [output_path]
+                write_report(df_proc, df_err, output_path, fast=fast_write)
+            else:
+                paths = list(columnar_output_paths(output_path, fmt).values())
+                write_columnar_report(df_proc, df_err, output_path, fmt)
+            written.extend(paths)
+            paths = []
+    except BaseException:
+        for path in written + paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+    return written
+
+
+def process_accounting_report(input_path, output_path, batch=False, workers=None, fast_write=False,
+                              output_format='xlsx', metrics=None, sheet_name=None, progress=None, cancel=None,
+                              layout=None, summary=None):
+    # Returns the (processed, errored) DataFrames, or None if the input could
+    # not be read, the output could not be saved or the run was cancelled
+    # through `cancel`; problems are printed. `progress` gets a Progress now
+    # and then, ending with a 'write' one before the output is saved. Lines
+    # are also counted into `summary` (a report_summary.ReportSummary) if given.
+    # Wraps iter_report_lines()/collect_report_frames() and save_report(), which
+    # raise instead. Stage timings/counts go to `metrics` (a new RunMetrics if
+    # not given) and are logged as one JSON line at the end, see report_metrics.py.
+    if metrics is None:
+        metrics = RunMetrics(source=os.path.basename(input_path))
+    try:
+        parse_output_formats(output_format)
+    except ValueError as e:
+        print(f"Error: {e}")
+        metrics.finish('failed')
+        return None
+
+    print(f"Reading input file: {input_path}")
     
-    # Save Output
-    print(f"Extraction complete. Processed Lines: {len(processed_rows)}, Error Lines: {len(error_rows)}")
+    try:
+        lines = iter_report_lines(input_path, batch=batch, workers=workers, metrics=metrics, log=print,
+                                  sheet_name=sheet_name, progress=progress, cancel=cancel, layout=layout)
+    except SheetNotFoundError as e:
+        print(f"Error: Could not find the report sheet. {e}")
+        metrics.finish('failed')
+        return None
+    except ReportReadError as e:
+        print(f"Error reading file: {e}")
+        metrics.finish('failed')
+        return None
+    except ReportCancelled as e:
+        print(f"{e}.")
+        metrics.finish('cancelled')
+        return None
+    except LayoutError as e:
+        print(f"Error: {e}")
+        metrics.finish('failed')
+        return None
+    if summary is not None:
+        lines = summary.track(lines, os.path.basename(input_path))
+
+    print("Starting processing...")
     
-    df_proc = pd.DataFrame(processed_rows)
-    df_err = pd.DataFrame(error_rows)
+    try:
+        df_proc, df_err = collect_report_frames(lines, metrics=metrics)
+        # Last chance to stop before the output is written
+        if cancel is not None:
+            cancel.check()
+    except ReportCancelled as e:
+        print(f"{e}.")
+        metrics.finish('cancelled')
+        return None
+
+    # Save Output
+    print(f"Extraction complete. Processed Lines: {len(df_proc)}, Error Lines: {len(df_err)}")
+    if progress is not None:
+        lines_out = len(df_proc) + len(df_err)
+        progress(Progress('write', lines_out, lines_out, metrics.counts.get('transactions', 0), None))
     
     try:
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            if not df_proc.empty:
-                df_proc.to_excel(writer, sheet_name='Journal Entries Processed', index=False)
-            else:
-                pd.DataFrame({'Message': ['No processed entries found']}).to_excel(writer, sheet_name='Journal Entries Processed', index=False)
-                
-            if not df_err.empty:
-                df_err.to_excel(writer, sheet_name='Journal Entries Errored', index=False)
-            else:
-                pd.DataFrame({'Message': ['No errored entries found']}).to_excel(writer, sheet_name='Journal Entries Errored', index=False)
-            
-            # Auto-adjust column width
-            for sheet_name in writer.sheets:
-                worksheet = writer.sheets[sheet_name]
-                for column_cells in worksheet.columns:
-                    length = max(len(str(cell.value)) if cell.value is not None else 0 for cell in column_cells)
-                    # Add a little padding, max out at 50 to avoid massive columns
-                    worksheet.column_dimensions[column_cells[0].column_letter].width = min(length + 2, 60)
-
-        print(f"Successfully saved to: {output_path}")
-    except PermissionError:
-        print(f"CRITICAL ERROR: Permission denied when writing to '{output_path}'.")
+        with metrics.stage('write'):
+            for path in save_report(df_proc, df_err, output_path, output_format, fast_write):
+                print(f"Successfully saved to: {path}")
+    except PermissionError as e:
+        print(f"CRITICAL ERROR: Permission denied when writing to '{e.filename or output_path}'.")
         print("Please close the Excel file if it is open and run the script again.")
+        metrics.finish('failed')
+        return None
     except Exception as e:
         print(f"Error saving file: {e}")
+        metrics.finish('failed')
+        return None
+    metrics.finish('ok')
+    return df_proc, df_err
+
+
+# --- Command line: many reports in parallel ---------------------------------
+
+OUTPUT_PREFIX = "Processed_"
+
+
+def output_name(input_name):
+    # Report.xlsx -> Processed_Report.xlsx, Report.xls -> Processed_Report_xls.xlsx:
+    # the output is always a workbook, and Report.csv next to it gets its own
+    stem, ext = os.path.splitext(os.path.basename(input_name))
+    if ext.lower() != '.xlsx':
+        stem += '_' + ext.lstrip('.').lower() if ext else ''
+    return OUTPUT_PREFIX + stem + '.xlsx'
+
+
+def expand_input_paths(specs):
+    """Resolve files, glob patterns and directories to a list of reports.
+
+    Directories contribute their .xlsx/.xlsm/.xls/.xlsb/.csv files (not
+    recursively). Excel lock files (~$...) and our own Processed_ outputs are
+    skipped; duplicates are dropped.
+    """
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            matches = sorted(path for path in glob.glob(os.path.join(spec, '*'))
+                             if os.path.splitext(path)[1].lower() in INPUT_SUFFIXES)
+        elif any(ch in spec for ch in '*?['):
+            matches = sorted(glob.glob(spec, recursive=True))
+        else:
+            matches = [spec]
+        for path in matches:
+            name = os.path.basename(path)
+            if name.startswith('~$') or (name.startswith(OUTPUT_PREFIX) and path != spec):
+                continue
+            path = os.path.abspath(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _process_file_job(input_path, output_path, batch, split, fast_write=False, output_format='xlsx',
+                      incremental=False, sheet_name=None, layout=None, summarize=False, profile=False):
+    # Worker: parse one report and write its own output workbook. Its console
+    # output is captured so parallel runs don't interleave; the last message
+    # becomes the failure reason in the summary. With summarize the report's
+    # ReportSummary comes back too, for run_batch() to merge. With profile the
+    # run is profiled (see report_profile.py): the raw profile is saved next to
+    # the output and its phase breakdown comes back as 'profile'.
+    log = io.StringIO()
+    start = time.perf_counter()
+    summary = _new_summary() if summarize else None
+    profiler = ReportProfile(os.path.basename(input_path)) if profile else None
+    running = profiler.running() if profiler is not None else contextlib.nullcontext()
+    with contextlib.redirect_stdout(log), running:
+        if incremental:
+            # Imported here: incremental_report imports this module
+            from incremental_report import update_report
+            result = update_report(input_path, output_path, batch=batch, workers=split, fast_write=fast_write,
+                                   output_format=output_format, sheet_name=sheet_name, layout=layout,
+                                   summary=summary)
+        else:
+            result = process_accounting_report(input_path, output_path, batch=batch, workers=split,
+                                               fast_write=fast_write, output_format=output_format,
+                                               sheet_name=sheet_name, layout=layout, summary=summary)
+    elapsed = time.perf_counter() - start
+    profiled = {}
+    if profiler is not None:
+        # Failed runs too; a report can be slow to fail
+        profiled = {'profile': profiler.summary(),
+                    'profile_path': profiler.save(os.path.splitext(output_path)[0] + '.prof')}
+    if result is None:
+        messages = log.getvalue().strip().splitlines()
+        return {'file': input_path, 'status': f"failed: {messages[-1] if messages else 'unknown error'}",
+                'processed': 0, 'errored': 0, 'seconds': elapsed, **profiled}
+    extra = {'summary': summary, **profiled} if summary is not None else profiled
+    if incremental:
+        # e.g. "ok (merged: 40 new, 1 changed, 0 removed)"
+        status = f"ok ({result['status']}: {result['new']} new, {result['changed']} changed, " \
+                 f"{result['removed']} removed)"
+        return {'file': input_path, 'status': status, 'output': output_path,
+                'processed': result['processed'], 'errored': result['errored'], 'seconds': elapsed, **extra}
+    df_proc, df_err = result
+    return {'file': input_path, 'status': 'ok', 'output': output_path,
+            'processed': len(df_proc), 'errored': len(df_err), 'seconds': elapsed, **extra}
+
+
+def _new_summary():
+    # Imported here: report_summary imports this module
+    from report_summary import ReportSummary
+    return ReportSummary()
+
+
+def _extract_file_job(input_path, batch, split, sheet_name=None, layout=None, summarize=False):
+    # Worker for --merge: parse one report and hand the frames back to the parent
+    start = time.perf_counter()
+    summary = _new_summary() if summarize else None
+    df_proc, df_err = extract_report(input_path, batch=batch, workers=split, sheet_name=sheet_name, layout=layout,
+                                     summary=summary)
+    elapsed = time.perf_counter() - start
+    source = os.path.basename(input_path)
+    for df in (df_proc, df_err):
+        if not df.empty:
+            df.insert(0, 'Source File', source)
+    extra = {'summary': summary} if summary is not None else {}
+    return {'file': input_path, 'status': 'ok', 'processed': len(df_proc), 'errored': len(df_err),
+            'seconds': elapsed, 'frames': (df_proc, df_err), **extra}
+
+
+def run_batch(input_paths, output_dir=None, merge_path=None, workers=None, batch=False, split=None,
+              fast_write=False, output_format='xlsx', incremental=False, sheet_name=None, layout=None,
+              summary_path=None, profile=False):
+    """Process many reports with a process pool; returns one result dict per input, in input order.
+
+    Without merge_path every input gets a Processed_<name>.xlsx workbook in output_dir
+    (default: next to the input). With merge_path all lines go to that single
+    workbook, with a leading 'Source File' column. output_format is passed on to
+    save_report(), so columnar files land next to each workbook path.
+    incremental=True updates each output from its last run (see incremental_report.py).
+    sheet_name overrides the report sheet detection for every input, and
+    layout (a layout name or profile path) picks the layout profile.
+    summary_path also writes the totals of all inputs there (see
+    report_summary.py), counted while the reports are parsed.
+    profile=True profiles each report (not with merge_path): its result gets
+    the phase breakdown as 'profile' and a <output>.prof next to its workbook.
+    """
+    summarize = summary_path is not None
+    workers = max(1, workers or os.cpu_count() or 1)
+    jobs = []
+    for path in input_paths:
+        if merge_path:
+            jobs.append((_extract_file_job, (path, batch, split, sheet_name, layout, summarize)))
+        else:
+            out_dir = output_dir or os.path.dirname(path)
+            output_path = os.path.join(out_dir, output_name(path))
+            jobs.append((_process_file_job, (path, output_path, batch, split, fast_write, output_format,
+                                             incremental, sheet_name, layout, summarize, profile)))
+
+    results = []
+    if workers == 1 or len(jobs) <= 1:
+        for func, args in jobs:
+            results.append(_run_job(func, args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(func, *args) for func, args in jobs]
+            for (func, args), future in zip(jobs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(_failed_result(args[0], e))
+
+    if summarize:
+        summary = _new_summary()
+        for r in results:
+            if 'summary' in r:
+                summary.merge(r.pop('summary'))
+        try:
+            print(f"Summary saved to: {summary.write(summary_path)}")
+        except Exception as e:
+            print(f"Error saving summary: {e}")
+
+    if merge_path:
+        merged = [r.pop('frames') for r in results if 'frames' in r]
+        df_proc = _concat_frames([p for p, _ in merged])
+        df_err = _concat_frames([e for _, e in merged])
+        try:
+            for path in save_report(df_proc, df_err, merge_path, output_format, fast_write):
+                print(f"Successfully saved to: {path}")
+        except Exception as e:
+            print(f"Error saving file: {e}")
+            for r in results:
+                if r['status'].startswith('ok'):
+                    r['status'] = 'failed: merged workbook not saved'
+    return results
+
+
+def _concat_frames(frames):
+    frames = [df for df in frames if not df.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _run_job(func, args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return _failed_result(args[0], e)
+
+
+def _failed_result(input_path, error):
+    return {'file': input_path, 'status': f'failed: {error}', 'processed': 0, 'errored': 0, 'seconds': 0.0}
+
+
+def print_summary(results, wall_seconds):
+    headers = ['File', 'Processed', 'Errored', 'Seconds', 'Status']
+    table = [[os.path.basename(r['file']), str(r['processed']), str(r['errored']),
+              f"{r['seconds']:.2f}", r['status']] for r in results]
+    table.append(['TOTAL', str(sum(r['processed'] for r in results)), str(sum(r['errored'] for r in results)),
+                  f"{wall_seconds:.2f}", f"{sum(r['status'].startswith('ok') for r in results)}/{len(results)} ok"])
+    # Status is left ragged; failure messages can be long
+    widths = [max(len(row[i]) for row in [headers] + table) for i in range(len(headers) - 1)]
+    rule = "  ".join("-" * w for w in widths + [len(headers[-1])])
+    for n, row in enumerate([headers] + table):
+        if n == 1 or n == len(table):
+            print(rule)
+        cells = [row[0].ljust(widths[0])] + [cell.rjust(w) for cell, w in zip(row[1:-1], widths[1:])]
+        print("  ".join(cells + [row[-1]]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract processed and errored journal lines from Create Accounting reports.")
+    parser.add_argument('inputs', nargs='+', help="report files (.xlsx, .xls, .xlsb, .csv), glob patterns or directories")
+    parser.add_argument('-o', '--output-dir', help="where Processed_<name>.xlsx outputs go (default: next to each input)")
+    parser.add_argument('-m', '--merge', metavar='PATH', help="write all inputs into this one workbook instead")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--batch', action='store_true', help="use the column-wise batch parser")
+    parser.add_argument('--split', type=int, default=None, metavar='N',
+                        help="also parse each report in N parallel chunks (large single files)")
+    parser.add_argument('--fast-write', action='store_true',
+                        help="stream the output workbook (write-only, widths computed per column)")
+    parser.add_argument('--log-metrics', action='store_true',
+                        help="log per-report stage timings and memory as JSON lines on stderr")
+    parser.add_argument('-f', '--format', default='xlsx', metavar='FMT',
+                        help=f"output format(s), comma separated: {', '.join(OUTPUT_FORMATS)} (default: xlsx)")
+    parser.add_argument('--sheet', metavar='NAME',
+                        help="read this sheet instead of finding the report sheet by its contents")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only redo what changed since the last run of the same output "
+                             "(keeps a <output>.index.json next to it). Only CSV output is updated in "
+                             "place; other formats are skipped when nothing changed, else written in full")
+    parser.add_argument('--summary', metavar='PATH',
+                        help="also write totals by ledger, event class, accounting class and error message "
+                             "across all inputs to this workbook")
+    parser.add_argument('--layout', metavar='NAME|PATH',
+                        help=f"report layout profile: one of {', '.join(available_layouts())} or a .json/.yaml "
+                             f"file (default: $REPORT_LAYOUT, else {DEFAULT_LAYOUT})")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile each report: print the time per parser phase and the hot spots, and save "
+                             "the profile as <output>.prof (for snakeviz, gprof2dot or python -m pstats)")
+    args = parser.parse_args(argv)
+    if args.log_metrics:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        metrics_log = logging.getLogger(METRICS_LOGGER)
+        metrics_log.addHandler(handler)
+        metrics_log.setLevel(logging.INFO)
+
+    try:
+        formats = parse_output_formats(args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.incremental and args.merge:
+        parser.error("--incremental can't be combined with --merge")
+    if args.incremental and formats != ('csv',):
+        # A workbook can't be appended to: the xlsx writer sizes every column
+        # to its longest value, so a changed report means writing it all again
+        print("Note: --incremental only saves work with --format csv. Other formats are left alone when "
+              "the report hasn't changed, but written in full (after a full parse) when it has.")
+    if args.profile and args.merge:
+        parser.error("--profile can't be combined with --merge")
+    try:
+        get_layout(args.layout)
+    except LayoutError as e:
+        parser.error(str(e))
+    input_paths = expand_input_paths(args.inputs)
+    if not input_paths:
+        parser.error("no input reports found")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = run_batch(input_paths, output_dir=args.output_dir, merge_path=args.merge,
+                        workers=args.workers, batch=args.batch, split=args.split,
+                        fast_write=args.fast_write, output_format=args.format,
+                        incremental=args.incremental, sheet_name=args.sheet, layout=args.layout,
+                        summary_path=args.summary, profile=args.profile)
+    print_summary(results, time.perf_counter() - start)
+    for r in results:
+        if 'profile' in r:
+            print()
+            print(format_profile(r['profile']))
+            print(f"Profile saved to: {r['profile_path']}")
+    return 0 if all(r['status'].startswith('ok') for r in results) else 1
+
 
 if __name__ == "__main__":
-    # Adjust paths as needed or use relative paths
-    base_dir = r"C:\Users\Ahad1503038\Desktop\AIC"
-    input_file = os.path.join(base_dir, "CreateAccounting_Create Accounting Report (3).xlsx")
-    output_file = os.path.join(base_dir, "Output_Accounting_Report_v2.xlsx")
-    
-    process_accounting_report(input_file, output_file)
+    sys.exit(main())
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+# Layout profiles: the markers a Create Accounting report is recognised by.
+# Oracle words them differently per language and report version, so they live
+# in JSON files (or YAML, with PyYAML installed) under layouts/ rather than in
+# the parser. A profile names
+#   section_title       regex (case-insensitive) for a section title at the start of a row
+#   error_section       regex for the titles among those that open the error section
+#   section_exclude     text that makes a title-like row a summary table instead
+#   transaction_marker  text (case-insensitive) of the row that starts a transaction
+#   header_keys         labels read from the transaction header block
+#   line_header         cell heading the line table, line_keys its key columns
+#   error_header        cell heading the error table, error_keys its key columns
+#   total_marker        text of the total rows, which are left out
+#   skip_rows           regexes for rows to ignore anywhere, e.g. repeated page headers
+#   columns             sheet label -> output column name, so a translated report
+#                       still comes out with the English column names
+#
+# Each profile is compiled once per process into a ReportLayout and cached.
+# Its text markers are one alternation regex and its whole-cell markers one
+# frozenset, so classifying a row is a single regex scan of its text plus one
+# set lookup per cell, however many markers the profile has (skip_rows, when
+# given, are a second scan).
+
+LAYOUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts')
+DEFAULT_LAYOUT = 'oracle_en'
+LAYOUT_SUFFIXES = ('.json', '.yaml', '.yml')
+
+REQUIRED_FIELDS = {
+    'section_title': str, 'error_section': str, 'transaction_marker': str, 'header_keys': list,
+    'line_header': str, 'line_keys': list, 'error_header': str, 'error_keys': list, 'total_marker': str,
+}
+OPTIONAL_FIELDS = {
+    'name': str, 'description': str, 'section_exclude': list, 'skip_rows': list, 'columns': dict,
+}
+
+
+class LayoutError(ValueError):
+    """A layout profile that can't be found, read or compiled."""
+
+
+class ReportLayout:
+    """A compiled layout profile; get one with get_layout()."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.name = profile.get('name', 'custom')
+        self.fingerprint = hashlib.sha256(json.dumps(profile, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        columns = profile.get('columns', {})
+        self.columns = columns
+
+        self.transaction_marker = profile['transaction_marker']
+        self.total_marker = profile['total_marker']
+        self.line_header = profile['line_header']
+        self.error_header = profile['error_header']
+        self.line_keys = tuple(profile['line_keys'])
+        self.error_keys = tuple(profile['error_keys'])
+        self.header_keys = tuple(profile['header_keys'])
+        # (sheet label, output name) of every header key
+        self.header_names = tuple((k, columns.get(k, k)) for k in self.header_keys)
+
+        self.section_title = _compile(profile['section_title'], re.IGNORECASE)
+        self.error_section = _compile(profile['error_section'], re.IGNORECASE)
+        self.transaction = re.compile(re.escape(self.transaction_marker), re.IGNORECASE)
+        exclude = profile.get('section_exclude', [])
+        self.section_exclude = re.compile('|'.join(re.escape(k) for k in exclude), re.IGNORECASE) if exclude else None
+        skip = profile.get('skip_rows', [])
+        self.skip = _compile('|'.join(f"(?:{p})" for p in skip)) if skip else None
+
+        # Everything looked for in a row's text, as one regex over the
+        # lowercased text. No named groups: plain literals let the regex engine
+        # jump straight to candidate positions, which is what keeps the scan as
+        # cheap as the single pattern it replaces. The few rows it hits are then
+        # checked marker by marker.
+        self.markers = _compile('|'.join([re.escape(self.transaction_marker.lower()),
+                                          re.escape(self.total_marker.lower()),
+                                          f"(?i:{profile['section_title']})"]))
+        # Markers that have to be a whole cell
+        self.cell_markers = frozenset([self.line_header, self.error_header])
+
+    def find(self, text):
+        """Names of the text markers in text ('txn', 'total', 'section', 'skip'); empty for most rows."""
+        found = ()
+        if self.markers.search(text.lower()) is not None:
+            found = {name for name, hit in (('txn', self.transaction.search(text)),
+                                            ('total', self.total_marker in text),
+                                            ('section', self.section_title.search(text))) if hit}
+        if self.skip is not None and self.skip.search(text):
+            found = {'skip', *found}
+        return found
+
+    def column(self, label):
+        """Output column name for a label from the sheet."""
+        return self.columns.get(label, label)
+
+    def __repr__(self):
+        return f"ReportLayout({self.name!r})"
+
+    def __reduce__(self):
+        # Pickled (e.g. to a process pool) as its profile, compiled again there
+        return ReportLayout, (self.profile,)
+
+
+def _compile(pattern, flags=0):
+    try:
+        return re.compile(pattern, flags)
+    except re.error as e:
+        raise LayoutError(f"Bad pattern {pattern!r} in layout profile: {e}") from e
+
+
+def validate_profile(profile, source='layout profile'):
+    """Check a loaded profile's fields and types; returns it."""
+    if not isinstance(profile, dict):
+        raise LayoutError(f"{source} must be a mapping of settings")
+    unknown = sorted(set(profile) - set(REQUIRED_FIELDS) - set(OPTIONAL_FIELDS))
+    if unknown:
+        raise LayoutError(f"{source}: unknown setting(s) {', '.join(unknown)}")
+    for field, kind in list(REQUIRED_FIELDS.items()) + list(OPTIONAL_FIELDS.items()):
+        if field not in profile:
+            if field in REQUIRED_FIELDS:
+                raise LayoutError(f"{source}: '{field}' is missing")
+            continue
+        value = profile[field]
+        if not isinstance(value, kind) or (kind is list and not all(isinstance(v, str) for v in value)):
+            raise LayoutError(f"{source}: '{field}' should be a {'list of strings' if kind is list else kind.__name__}")
+    return profile
+
+
+def layout_path(spec):
+    """File for a layout name (a profile in layouts/) or path."""
+    if os.path.splitext(spec)[1].lower() in LAYOUT_SUFFIXES or os.sep in spec or '/' in spec:
+        if not os.path.exists(spec):
+            raise LayoutError(f"Layout profile {spec} not found")
+        return spec
+    for suffix in LAYOUT_SUFFIXES:
+        path = os.path.join(LAYOUTS_DIR, spec + suffix)
+        if os.path.exists(path):
+            return path
+    raise LayoutError(f"Unknown layout '{spec}'. Available layouts: {available_layouts()}")
+
+
+def available_layouts():
+    try:
+        names = os.listdir(LAYOUTS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.splitext(n)[0] for n in names if os.path.splitext(n)[1].lower() in LAYOUT_SUFFIXES)
+
+
+def load_profile(path):
+    """Read a JSON or YAML profile file into a validated dict."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    try:
+        if path.lower().endswith('.json'):
+            profile = json.loads(text)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise LayoutError("Reading YAML layout profiles needs PyYAML (pip install pyyaml)") from None
+            profile = yaml.safe_load(text)
+    except LayoutError:
+        raise
+    except Exception as e:
+        raise LayoutError(f"Could not read layout profile {path}: {e}") from e
+    if isinstance(profile, dict):
+        profile.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return validate_profile(profile, os.path.basename(path))
+
+
+# (absolute path, mtime) -> ReportLayout; an edited profile file is compiled again
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_layout(spec=None):
+    """The compiled layout for a name, a profile path or a profile dict.
+
+    None means REPORT_LAYOUT from the environment, else the default
+    ('oracle_en'). A ReportLayout is passed through. Files are compiled once
+    per process and then served from a cache.
+    """
+    if isinstance(spec, ReportLayout):
+        return spec
+    if isinstance(spec, dict):
+        return ReportLayout(validate_profile(dict(spec)))
+    path = os.path.abspath(layout_path(spec or os.environ.get('REPORT_LAYOUT') or DEFAULT_LAYOUT))
+    key = (path, os.stat(path).st_mtime_ns)
+    layout = _cache.get(key)
+    if layout is None:
+        layout = ReportLayout(load_profile(path))
+        with _cache_lock:
+            _cache[key] = layout
+    return layout
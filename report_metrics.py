@@ -0,0 +1,246 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-run timing and memory for process_accounting_report(), logged as one JSON
+# line per report, plus process-wide totals rendered in Prometheus text format
+# for the app's /metrics endpoint. Everything here is a few perf_counter() calls
+# per stage (and two per row for the streamed read), so it stays on in production.
+# Set REPORT_TRACEMALLOC=1 to also get the exact peak of Python allocations per
+# stage; that one does slow parsing down noticeably.
+
+METRICS_LOGGER = 'accounting_report.metrics'
+logger = logging.getLogger(METRICS_LOGGER)
+
+STAGES = ('read', 'parse', 'flush', 'frames', 'write')
+RUN_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+
+def rss_mb():
+    """Current resident set size in MB, or None where we can't tell cheaply."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 1048576, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    # High-water mark of the whole process (ru_maxrss is KB on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1048576 if os.uname().sysname == 'Darwin' else 1024), 1)
+
+
+class RunMetrics:
+    """Stage timings and counts for one report."""
+
+    def __init__(self, source=None, trace_memory=None):
+        self.source = source
+        if trace_memory is None:
+            trace_memory = os.environ.get('REPORT_TRACEMALLOC') == '1'
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counts = {}
+        # Non-numeric facts about the run, e.g. which reader backend was used
+        self.labels = {}
+        self.started = time.perf_counter()
+        # Time already attributed to some stage; lets an enclosing stage report
+        # only its own (exclusive) time
+        self._attributed = 0.0
+        # The summary logged by finish()
+        self.result = None
+
+    def _stage_entry(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0})
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        peak_before = peak_rss_mb()
+        attributed_before = self._attributed
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self._stage_entry(name)
+            entry['seconds'] += elapsed - (self._attributed - attributed_before)
+            self._attributed = attributed_before + elapsed
+            entry['rss_mb'] = rss_mb()
+            peak_after = peak_rss_mb()
+            if peak_after is not None:
+                # How far this stage pushed the process high-water mark
+                entry['peak_rss_growth_mb'] = round(peak_after - peak_before, 1)
+            if self.trace_memory:
+                entry['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 1048576, 1)
+                if tracing:
+                    tracemalloc.stop()
+
+    def add_time(self, name, seconds):
+        """Attribute time measured elsewhere (e.g. inside an iterator) to a stage."""
+        self._stage_entry(name)['seconds'] += seconds
+        self._attributed += seconds
+
+    def label(self, name, value):
+        self.labels[name] = value
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def timed_rows(self, rows, stage='read'):
+        """Yield from rows, charging the time spent producing them to stage."""
+        entry = self._stage_entry(stage)
+        clock = time.perf_counter
+        n = 0
+        total = 0.0
+        iterator = iter(rows)
+        try:
+            while True:
+                start = clock()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    total += clock() - start
+                    return
+                total += clock() - start
+                n += 1
+                yield row
+        finally:
+            entry['seconds'] += total
+            self._attributed += total
+            self.count('rows', n)
+
+    def summary(self, status='ok'):
+        seconds = time.perf_counter() - self.started
+        rows = self.counts.get('rows', 0)
+        stages = {name: {k: (round(v, 4) if k == 'seconds' else v) for k, v in entry.items()}
+                  for name, entry in sorted(self.stages.items(), key=lambda item: _stage_order(item[0]))}
+        return {
+            'event': 'report_processed',
+            'source': self.source,
+            'status': status,
+            **self.labels,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            **self.counts,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+        }
+
+    def finish(self, status='ok', registry=None):
+        """Log the JSON summary, add it to the process-wide totals and return it."""
+        summary = self.result = self.summary(status)
+        logger.info(json.dumps(summary, default=str))
+        (registry or REGISTRY).observe(summary)
+        return summary
+
+
+def _stage_order(name):
+    return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+class MetricsRegistry:
+    """Totals across every report this process has handled, for /metrics.
+
+    Each process keeps its own totals; with several gunicorn workers a scrape
+    sees whichever worker answers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = {}
+        self.readers = {}
+        self.stage_seconds = {}
+        self.stage_runs = {}
+        self.totals = {}
+        self.run_seconds_buckets = [0] * len(RUN_SECONDS_BUCKETS)
+        self.run_seconds_sum = 0.0
+        self.run_seconds_count = 0
+        self.last_peak_rss_mb = None
+
+    def observe(self, summary):
+        with self._lock:
+            status = summary.get('status', 'ok')
+            self.runs[status] = self.runs.get(status, 0) + 1
+            if summary.get('reader'):
+                self.readers[summary['reader']] = self.readers.get(summary['reader'], 0) + 1
+            for name, entry in summary.get('stages', {}).items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + entry['seconds']
+                self.stage_runs[name] = self.stage_runs.get(name, 0) + 1
+            for key in ('rows', 'transactions', 'processed_lines', 'errored_lines'):
+                if summary.get(key):
+                    self.totals[key] = self.totals.get(key, 0) + summary[key]
+            seconds = summary.get('seconds')
+            if seconds is not None:
+                for i, bound in enumerate(RUN_SECONDS_BUCKETS):
+                    if seconds <= bound:
+                        self.run_seconds_buckets[i] += 1
+                self.run_seconds_sum += seconds
+                self.run_seconds_count += 1
+            if summary.get('peak_rss_mb') is not None:
+                self.last_peak_rss_mb = summary['peak_rss_mb']
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        prefix = 'accounting_report'
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {prefix}_{name} {help_text}")
+            out.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                out.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text
+                           else f"{prefix}_{name} {value}")
+
+        with self._lock:
+            metric('runs_total', 'counter', "Reports processed, by outcome.",
+                   [({'status': s}, n) for s, n in sorted(self.runs.items())])
+            metric('reader_runs_total', 'counter', "Reports read, by reader backend.",
+                   [({'reader': r}, n) for r, n in sorted(self.readers.items())])
+            metric('stage_seconds_total', 'counter', "Wall time spent in each processing stage.",
+                   [({'stage': s}, round(v, 6)) for s, v in sorted(self.stage_seconds.items(), key=lambda i: _stage_order(i[0]))])
+            metric('stage_runs_total', 'counter', "Reports that went through each stage.",
+                   [({'stage': s}, n) for s, n in sorted(self.stage_runs.items(), key=lambda i: _stage_order(i[0]))])
+            metric('rows_total', 'counter', "Sheet rows read.", [({}, self.totals.get('rows', 0))])
+            metric('transactions_total', 'counter', "Transactions extracted.",
+                   [({}, self.totals.get('transactions', 0))])
+            metric('lines_total', 'counter', "Journal lines written, by sheet.",
+                   [({'section': 'processed'}, self.totals.get('processed_lines', 0)),
+                    ({'section': 'errored'}, self.totals.get('errored_lines', 0))])
+            cumulative = []
+            for bound, n in zip(RUN_SECONDS_BUCKETS, self.run_seconds_buckets):
+                cumulative.append(({'le': bound}, n))
+            cumulative.append(({'le': '+Inf'}, self.run_seconds_count))
+            out.append(f"# HELP {prefix}_run_seconds Wall time per report.")
+            out.append(f"# TYPE {prefix}_run_seconds histogram")
+            for labels, n in cumulative:
+                out.append(f'{prefix}_run_seconds_bucket{{le="{labels["le"]}"}} {n}')
+            out.append(f"{prefix}_run_seconds_sum {round(self.run_seconds_sum, 6)}")
+            out.append(f"{prefix}_run_seconds_count {self.run_seconds_count}")
+            if self.last_peak_rss_mb is not None:
+                metric('peak_rss_megabytes', 'gauge', "Process peak RSS after the last report.",
+                       [({}, self.last_peak_rss_mb)])
+        current = rss_mb()
+        if current is not None:
+            metric('rss_megabytes', 'gauge', "Process resident set size now.", [({}, current)])
+        return '\n'.join(out) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,152 @@
+import contextlib
+import cProfile
+import importlib
+import os
+import pstats
+import time
+
+from lazy_imports import HEAVY_MODULES
+
+# Profiling a slow report where it runs, so the file never has to leave the
+# customer: the CLI's --profile and the app's X-Profile header run the parse
+# under cProfile and give back
+#   - the time per parser phase (PHASES below), so "it's slow" becomes "it's
+#     the line tables" without a second look at the file,
+#   - the functions with the most time of their own (hot spots), and
+#   - the raw profile as a .prof file, which snakeviz, gprof2dot, flameprof
+#     or `python -m pstats` open as they are.
+#
+# A phase is the time spent inside its functions in process_accounting_report,
+# counted only where they are entered from outside every phase (a caller only
+# ever called from within a phase is inside it too), so nothing is counted
+# twice: finding the report sheet (which classifies sample rows) is all 'read',
+# and a row's classification while parsing is 'section detection'. What no
+# phase covers (the parse loops themselves, building the batch DataFrame,
+# summaries) is 'other'. cProfile roughly doubles the time of this Python-heavy
+# code, so the phases are for comparing with each other, not with an
+# unprofiled run. Chunks parsed in other processes (--split) aren't seen; only
+# the wait for them is.
+
+PARSER_FILE = 'process_accounting_report.py'
+
+PHASE_FUNCTIONS = {
+    # Every reader's rows come through SheetRows.__next__; the readers' own
+    # generators are resumed through next() and would be counted twice
+    'read': ('iter_sheet_rows', 'read_sheet_frame', '__next__', '_find_report_sheet'),
+    'section detection': ('classify_row', 'classify_frame', '_walk_boundaries'),
+    'header scan': ('_read_txn_keys', '_start_table'),
+    'line table': ('_read_line_row', '_read_line_block'),
+    'error table': ('_read_error_row', '_read_error_block'),
+    'flush': ('_flush',),
+    'frames': ('to_frame',),
+    'write': ('save_report', 'write_report', 'report_workbook_bytes', 'write_columnar_report'),
+}
+PHASES = tuple(PHASE_FUNCTIONS) + ('other',)
+HOTSPOTS = 15
+
+_PHASE_OF = {name: phase for phase, names in PHASE_FUNCTIONS.items() for name in names}
+
+
+def function_label(func):
+    # (file, line, name) as pstats keys it -> 'module.py:123(name)'
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-in
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _nested(stats, owner):
+    # The phase functions plus every function only ever called from them,
+    # directly or through others like it (e.g. score_sheet(), which only
+    # _find_report_sheet() calls)
+    inside = set(owner)
+    changed = True
+    while changed:
+        changed = False
+        for func, (_, _, _, _, callers) in stats.items():
+            if func not in inside and callers and all(caller in inside for caller in callers):
+                inside.add(func)
+                changed = True
+    return inside
+
+
+class ReportProfile:
+    """cProfile of one report run, broken down by parser phase."""
+
+    def __init__(self, source=None):
+        self.source = source
+        self.profiler = cProfile.Profile()
+        self.stats = None
+        self.seconds = None
+
+    @contextlib.contextmanager
+    def running(self):
+        """Profile the code run in the with block (this thread only)."""
+        # Imported first, or the import would be charged to whichever phase
+        # happens to touch pandas first
+        for name in HEAVY_MODULES:
+            importlib.import_module(name)
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            yield self
+        finally:
+            self.profiler.disable()
+            self.seconds = time.perf_counter() - start
+            self.stats = pstats.Stats(self.profiler)
+
+    def phases(self):
+        """Phase -> seconds, in PHASES order; 'other' is the rest of the run."""
+        stats = self.stats.stats
+        owner = {func: _PHASE_OF[func[2]] for func in stats
+                 if func[2] in _PHASE_OF and os.path.basename(func[0]) == PARSER_FILE}
+        inside = _nested(stats, owner)
+        seconds = dict.fromkeys(PHASES, 0.0)
+        for func, phase in owner.items():
+            callers = stats[func][4]
+            if not callers:
+                seconds[phase] += stats[func][3]
+            for caller, (_, _, _, cumulative) in callers.items():
+                if caller not in inside:
+                    seconds[phase] += cumulative
+        seconds['other'] = max(0.0, self.seconds - sum(seconds.values()))
+        return seconds
+
+    def hotspots(self, count=HOTSPOTS):
+        """The `count` functions with the most time of their own, as dicts."""
+        top = sorted(self.stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+        return [{'function': function_label(func), 'calls': calls, 'own_seconds': round(own, 4),
+                 'total_seconds': round(cumulative, 4)}
+                for func, (_, calls, own, cumulative, _) in top]
+
+    def summary(self, count=HOTSPOTS):
+        """Everything but the raw profile, as plain data (JSON-able, picklable)."""
+        return {'source': self.source, 'seconds': round(self.seconds, 4),
+                'phases': {phase: round(s, 4) for phase, s in self.phases().items()},
+                'hotspots': self.hotspots(count)}
+
+    def save(self, path):
+        """Write the raw profile (pstats format, for snakeviz & co.); returns path."""
+        self.profiler.dump_stats(path)
+        return path
+
+    def server_timing(self):
+        """The phases as a Server-Timing header value (milliseconds)."""
+        parts = [f"{phase.replace(' ', '-')};dur={s * 1000:.1f}" for phase, s in self.phases().items() if s]
+        return ', '.join(parts + [f"total;dur={self.seconds * 1000:.1f}"])
+
+
+def format_profile(summary):
+    """A profile summary() as a printable phase table plus its hot spots."""
+    total = summary['seconds'] or 1
+    lines = [f"Profile of {summary['source'] or 'report'}: {summary['seconds']:.2f}s under cProfile", ""]
+    width = max(len(phase) for phase in PHASES)
+    lines.append(f"{'Phase'.ljust(width)}  {'Seconds':>8}  {'Share':>6}")
+    lines.append(f"{'-' * width}  {'-' * 8}  {'-' * 6}")
+    for phase, seconds in summary['phases'].items():
+        lines.append(f"{phase.ljust(width)}  {seconds:8.3f}  {seconds / total:6.1%}")
+    lines += ["", f"{'Own s':>8}  {'Total s':>8}  {'Calls':>9}  Function"]
+    for spot in summary['hotspots']:
+        lines.append(f"{spot['own_seconds']:8.3f}  {spot['total_seconds']:8.3f}  {spot['calls']:9d}  "
+                     f"{spot['function']}")
+    return "\n".join(lines)
@@ -0,0 +1,300 @@
+import argparse
+import numbers
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from incremental_report import iter_transactions
+from process_accounting_report import (
+    ReportError, column_dtype, column_widths, expand_input_paths, iter_report_lines,
+)
+from report_layout import LayoutError, get_layout
+
+# Consolidated totals across many reports: debits/credits, line and
+# transaction counts by Ledger, Event Class and Accounting Class, plus the most
+# frequent error messages, the pivots finance otherwise builds in Excel from
+# the per-file outputs. Lines are streamed through a ReportSummary one
+# transaction at a time and only the running totals are kept, so memory
+# depends on how many distinct ledgers/classes/messages there are, not on the
+# size of the reports. Error messages are capped at MAX_ERROR_MESSAGES
+# distinct texts; past that the rarest are dropped and the counts of the top
+# ones become lower bounds (the sheet says so).
+#
+#   python report_summary.py reports/*.xlsx -o Summary.xlsx
+#   python process_accounting_report.py reports/ --summary Summary.xlsx
+#
+# The second form writes the per-file outputs too, in the same pass.
+#
+# Amounts are every Debit/Credit/Amount column, summed as they come: Accounted
+# amounts are in the ledger currency, Entered ones are whatever their lines
+# were entered in.
+
+GROUP_BY = ('Ledger', 'Event Class', 'Accounting Class')
+MAX_ERROR_MESSAGES = 10000
+TOP_ERRORS = 100
+SUMMARY_SHEET = 'Summary'
+ERRORS_SHEET = 'Top Errors'
+BLANK = '(blank)'
+
+
+class _Totals:
+    __slots__ = ('transactions', 'lines', 'amounts')
+
+    def __init__(self):
+        self.transactions = 0
+        self.lines = 0
+        self.amounts = {}
+
+    def add(self, other):
+        self.transactions += other.transactions
+        self.lines += other.lines
+        for col, value in other.amounts.items():
+            self.amounts[col] = self.amounts.get(col, 0.0) + value
+
+
+def _amount(value):
+    # Numbers as they are, text like '1,234.50' parsed, anything else skipped
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, numbers.Real):
+        return float(value) if value == value else None
+    if isinstance(value, str) and value.strip():
+        try:
+            return float(value.replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+
+def _label(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return BLANK
+    text = str(value).strip()
+    return text or BLANK
+
+
+class ReportSummary:
+    """Running totals over the (section, line) records of any number of reports."""
+
+    def __init__(self, group_by=GROUP_BY, max_messages=MAX_ERROR_MESSAGES):
+        self.group_by = tuple(group_by)
+        self.max_messages = max_messages
+        # source file -> section -> _Totals
+        self.sources = {}
+        # column -> (section, value) -> _Totals
+        self.groups = {col: {} for col in self.group_by}
+        # message -> [transactions, lines]
+        self.messages = {}
+        # True once rare messages have been dropped to stay under max_messages
+        self.messages_truncated = False
+        # Amount columns in the order they were first seen
+        self.amount_columns = {}
+
+    def add_transaction(self, section, lines, source=None):
+        """Count one transaction's lines (all from the same section)."""
+        amount_columns = [col for col in lines[0].keys() if column_dtype(col) == 'float64']
+        for col in amount_columns:
+            self.amount_columns.setdefault(col, None)
+        touched = set()
+        per_source = self.sources.setdefault(source, {}).setdefault(section, _Totals())
+        per_source.transactions += 1
+        for line in lines:
+            amounts = {}
+            for col in amount_columns:
+                value = _amount(line.get(col))
+                if value is not None:
+                    amounts[col] = value
+            targets = [per_source]
+            for col in self.group_by:
+                key = (section, _label(line.get(col)))
+                totals = self.groups[col].get(key)
+                if totals is None:
+                    totals = self.groups[col][key] = _Totals()
+                if (col, key) not in touched:
+                    touched.add((col, key))
+                    totals.transactions += 1
+                targets.append(totals)
+            for totals in targets:
+                totals.lines += 1
+                for col, value in amounts.items():
+                    totals.amounts[col] = totals.amounts.get(col, 0.0) + value
+        if section == 'Error':
+            self._count_messages(lines)
+
+    def _count_messages(self, lines):
+        # Each line's Error holds its " | "-joined messages
+        seen = set()
+        for line in lines:
+            for message in str(line.get('Error') or '').split(' | '):
+                message = message.strip()
+                if not message:
+                    continue
+                counts = self.messages.get(message)
+                if counts is None:
+                    counts = self.messages[message] = [0, 0]
+                if message not in seen:
+                    seen.add(message)
+                    counts[0] += 1
+                counts[1] += 1
+        if len(self.messages) > self.max_messages:
+            self._prune_messages()
+
+    def _prune_messages(self):
+        keep = sorted(self.messages.items(), key=lambda item: item[1], reverse=True)[:self.max_messages // 2]
+        self.messages = dict(keep)
+        self.messages_truncated = True
+
+    def add(self, lines, source=None):
+        """Count every (section, line) record of a report."""
+        for section, txn_lines in iter_transactions(lines):
+            self.add_transaction(section, txn_lines, source)
+        return self
+
+    def track(self, lines, source=None):
+        """Pass (section, line) records through, counting them on the way."""
+        for section, txn_lines in iter_transactions(lines):
+            self.add_transaction(section, txn_lines, source)
+            for line in txn_lines:
+                yield section, line
+
+    def merge(self, other):
+        """Fold in another summary, e.g. one built in a worker process."""
+        for col in other.amount_columns:
+            self.amount_columns.setdefault(col, None)
+        for source, sections in other.sources.items():
+            for section, totals in sections.items():
+                self.sources.setdefault(source, {}).setdefault(section, _Totals()).add(totals)
+        for col, groups in other.groups.items():
+            mine = self.groups.setdefault(col, {})
+            for key, totals in groups.items():
+                mine.setdefault(key, _Totals()).add(totals)
+        for message, (transactions, lines) in other.messages.items():
+            counts = self.messages.setdefault(message, [0, 0])
+            counts[0] += transactions
+            counts[1] += lines
+        self.messages_truncated = self.messages_truncated or other.messages_truncated
+        if len(self.messages) > self.max_messages:
+            self._prune_messages()
+        return self
+
+    def _rows(self, labels, totals):
+        return labels + [totals.transactions, totals.lines] + \
+            [round(totals.amounts.get(col, 0.0), 2) for col in self.amount_columns]
+
+    def frames(self, top_errors=TOP_ERRORS):
+        """Sheet name -> DataFrame of the summary workbook."""
+        amount_columns = list(self.amount_columns)
+        counts = ['Transactions', 'Lines'] + amount_columns
+        rows = []
+        grand = {}
+        for source in sorted(self.sources, key=str):
+            for section in ('Processed', 'Error'):
+                totals = self.sources[source].get(section)
+                if totals is not None:
+                    rows.append(self._rows([source, section], totals))
+                    grand.setdefault(section, _Totals()).add(totals)
+        for section, totals in grand.items():
+            rows.append(self._rows(['TOTAL', section], totals))
+        sheets = {SUMMARY_SHEET: pd.DataFrame(rows, columns=['Source File', 'Section'] + counts)}
+
+        for col in self.group_by:
+            groups = self.groups.get(col, {})
+            # Processed before Error, then the biggest groups first
+            ordered = sorted(groups.items(), key=lambda item: (item[0][0] != 'Processed', -item[1].lines, item[0][1]))
+            sheets[f"By {col}"] = pd.DataFrame([self._rows([section, value], totals)
+                                                 for (section, value), totals in ordered],
+                                                columns=['Section', col] + counts)
+
+        top = sorted(self.messages.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))[:top_errors]
+        errors = pd.DataFrame([[message, transactions, lines] for message, (transactions, lines) in top],
+                              columns=['Error Message', 'Transactions', 'Lines'])
+        if self.messages_truncated:
+            note = f"More than {self.max_messages} distinct messages: counts are lower bounds"
+            errors = pd.concat([errors, pd.DataFrame([[note, None, None]], columns=errors.columns)],
+                               ignore_index=True)
+        sheets[ERRORS_SHEET] = errors
+        return sheets
+
+    def write(self, path, top_errors=TOP_ERRORS):
+        """Save the summary workbook; returns path."""
+        with pd.ExcelWriter(path, engine='openpyxl') as writer:
+            for sheet_name, df in self.frames(top_errors).items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+                worksheet = writer.sheets[sheet_name]
+                for col, width in enumerate(column_widths(df), start=1):
+                    worksheet.column_dimensions[worksheet.cell(1, col).column_letter].width = width
+        return path
+
+
+def _summarize_file(input_path, batch=False, split=None, sheet_name=None, layout=None):
+    # Worker: one report's summary, or the reason it couldn't be read
+    start = time.perf_counter()
+    try:
+        summary = ReportSummary().add(iter_report_lines(input_path, batch=batch, workers=split,
+                                                         sheet_name=sheet_name, layout=layout),
+                                      os.path.basename(input_path))
+    except ReportError as e:
+        return {'file': input_path, 'status': f"failed: {e}", 'seconds': time.perf_counter() - start}
+    return {'file': input_path, 'status': 'ok', 'summary': summary, 'seconds': time.perf_counter() - start}
+
+
+def summarize_reports(input_paths, workers=None, batch=False, split=None, sheet_name=None, layout=None):
+    """One ReportSummary over many reports, one process per report at a time.
+
+    Returns (summary, results) with a result dict per input, in input order.
+    Nothing but the summary is written.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    args = [(path, batch, split, sheet_name, layout) for path in input_paths]
+    if workers == 1 or len(args) <= 1:
+        results = [_summarize_file(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(args))) as pool:
+            results = list(pool.map(_summarize_file, *zip(*args)))
+    summary = ReportSummary()
+    for result in results:
+        if 'summary' in result:
+            summary.merge(result.pop('summary'))
+    return summary, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Totals by ledger, event class, accounting class and error "
+                                                 "message across many Create Accounting reports.")
+    parser.add_argument('inputs', nargs='+', help="report files, glob patterns or directories")
+    parser.add_argument('-o', '--output', default='Summary.xlsx', help="summary workbook (default Summary.xlsx)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--batch', action='store_true', help="use the column-wise batch parser")
+    parser.add_argument('--sheet', metavar='NAME', help="read this sheet instead of finding the report sheet")
+    parser.add_argument('--layout', metavar='NAME|PATH', help="report layout profile (default: $REPORT_LAYOUT)")
+    parser.add_argument('--top-errors', type=int, default=TOP_ERRORS,
+                        help=f"error messages to list (default {TOP_ERRORS})")
+    args = parser.parse_args(argv)
+
+    try:
+        get_layout(args.layout)
+    except LayoutError as e:
+        parser.error(str(e))
+    input_paths = expand_input_paths(args.inputs)
+    if not input_paths:
+        parser.error("no input reports found")
+    start = time.perf_counter()
+    summary, results = summarize_reports(input_paths, workers=args.workers, batch=args.batch,
+                                         sheet_name=args.sheet, layout=args.layout)
+    for r in results:
+        print(f"{os.path.basename(r['file'])}: {r['status']} ({r['seconds']:.2f}s)")
+    try:
+        print(f"Summary saved to: {summary.write(args.output, args.top_errors)}")
+    except PermissionError:
+        print(f"CRITICAL ERROR: Permission denied when writing to '{args.output}'.")
+        print("Please close the Excel file if it is open and run the script again.")
+        return 1
+    print(f"{len(input_paths)} reports in {time.perf_counter() - start:.2f}s")
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
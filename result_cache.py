@@ -0,0 +1,143 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# On-disk cache of processed workbooks, keyed by what was uploaded.
+# Each entry is one file named <key><suffix>. Its mtime is when it was stored
+# (for the TTL) and its atime is when it was last served (for LRU eviction);
+# both are set explicitly so noatime mounts don't matter.
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'accounting_report_cache')
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+HASH_CHUNK = 1024 * 1024
+TMP_SUFFIX = '.tmp'
+# A temp file this old was left by a writer that died (OOM, timeout, recycling)
+STALE_TMP_SECONDS = 10 * 60
+
+
+def content_hasher(version=''):
+    """The hashlib object content_key() uses, for hashing bytes as they arrive."""
+    return hashlib.sha256(version.encode('utf-8') + b'\0')
+
+
+def content_key(path, version=''):
+    """SHA-256 of the file's bytes, salted with the parser version."""
+    digest = content_hasher(version)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, suffix='.xlsx'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        # RESULT_CACHE_DIR / RESULT_CACHE_MAX_MB / RESULT_CACHE_TTL_HOURS
+        return cls(
+            directory=os.environ.get('RESULT_CACHE_DIR', DEFAULT_CACHE_DIR),
+            max_bytes=int(float(os.environ.get('RESULT_CACHE_MAX_MB', DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+            ttl_seconds=float(os.environ.get('RESULT_CACHE_TTL_HOURS', DEFAULT_TTL_SECONDS / 3600)) * 3600,
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Path of the cached result for key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            stored = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stored > self.ttl_seconds:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, (now, stored))
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, result_path):
+        """Copy a finished result into the cache and return the cached path."""
+        return self._store(key, lambda tmp_path: shutil.copyfile(result_path, tmp_path))
+
+    def put_bytes(self, key, data):
+        """Like put(), for a result that only exists in memory."""
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        return self._store(key, write)
+
+    def _store(self, key, write):
+        path = self._path(key)
+        # Write under a temp name then rename, so readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=TMP_SUFFIX)
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        now = time.time()
+        os.utime(path, (now, now))
+        self.evict()
+        return path
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes.
+
+        Temp files of writes that never finished go once they are
+        STALE_TMP_SECONDS old; until then they count towards max_bytes.
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            writing = 0
+            for entry in os.scandir(self.directory):
+                is_tmp = entry.name.endswith(TMP_SUFFIX)
+                if not is_tmp and not entry.name.endswith(self.suffix):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if is_tmp:
+                    if now - st.st_mtime > STALE_TMP_SECONDS:
+                        self._remove(entry.path)
+                    else:
+                        writing += st.st_size
+                elif now - st.st_mtime > self.ttl_seconds:
+                    self._remove(entry.path)
+                else:
+                    entries.append((st.st_atime, st.st_size, entry.path))
+
+            total = writing + sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,272 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flask import send_file
+from werkzeug.utils import secure_filename
+
+from process_accounting_report import INPUT_SUFFIXES
+
+# Managed scratch space for the web app. Every request gets its own workspace
+# under one root; it is removed when the response is done. A background sweeper
+# deletes anything left behind (crashed workers, old job directories) after
+# max_age_seconds, and new workspaces are refused while the root is over its
+# byte budget instead of letting /tmp fill up.
+#
+# Uploads and responses up to in_memory_bytes never touch the disk at all:
+# the app's request class spools uploads in memory up to that size (a bigger
+# one goes to a temp file under the root), and receive_upload() hands that
+# same stream to the readers without copying it.
+
+DEFAULT_SCRATCH_DIR = os.path.join(tempfile.gettempdir(), 'accounting_report_scratch')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+DEFAULT_IN_MEMORY_BYTES = 20 * 1024 * 1024
+
+COPY_CHUNK = 1024 * 1024
+# What an upload is called when its own name is unusable
+FALLBACK_UPLOAD_NAME = 'report.xlsx'
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class ScratchFull(OSError):
+    pass
+
+
+def _env_mb(name, default_bytes):
+    return int(float(os.environ.get(name, default_bytes / 1024 / 1024)) * 1024 * 1024)
+
+
+def upload_name(filename):
+    """An uploaded file's name, safe to use as a file name on this server.
+
+    Directory parts and odd characters are dropped; a name with nothing left
+    or without a report suffix ('..', 'a/..', 'notes.txt') becomes
+    FALLBACK_UPLOAD_NAME.
+    """
+    name = secure_filename(filename or '')
+    if os.path.splitext(name)[1].lower() not in INPUT_SUFFIXES:
+        return FALLBACK_UPLOAD_NAME
+    return name
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class _WorkspaceFile(io.FileIO):
+    # Output file that takes its workspace with it when the server closes it.
+    # (Response.call_on_close doesn't fire for send_file's passthrough responses.)
+    def __init__(self, path, workspace):
+        super().__init__(path, 'rb')
+        self._workspace = workspace
+
+    def close(self):
+        super().close()
+        self._workspace.cleanup()
+
+
+class SpooledUpload:
+    """A received upload: werkzeug's own (seekable) stream, plus a workspace if one is needed."""
+
+    def __init__(self, scratch, filename, stream, size, threshold):
+        self.scratch = scratch
+        self.filename = filename
+        self.stream = stream
+        self.size = size
+        self.threshold = threshold
+        self._workspace = None
+
+    @property
+    def spilled(self):
+        # Too big to keep in memory, so it was spooled to disk, and so should its output be
+        return self.size > self.threshold
+
+    @property
+    def workspace(self):
+        # Only made when asked for: a small upload never needs a directory
+        if self._workspace is None:
+            self._workspace = self.scratch.workspace()
+        return self._workspace
+
+    def source(self):
+        """What to hand the report readers: the upload stream, rewound."""
+        self.stream.seek(0)
+        return self.stream
+
+    def cleanup(self):
+        # The stream itself is closed by werkzeug at the end of the request
+        if self._workspace is not None:
+            self._workspace.cleanup()
+
+
+class Workspace:
+    def __init__(self, path):
+        self.path = path
+
+    def file(self, name):
+        return os.path.join(self.path, os.path.basename(name))
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+class ScratchSpace:
+    def __init__(self, directory=DEFAULT_SCRATCH_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 max_age_seconds=DEFAULT_MAX_AGE_SECONDS, max_upload_bytes=DEFAULT_MAX_UPLOAD_BYTES,
+                 in_memory_bytes=DEFAULT_IN_MEMORY_BYTES, sweep_interval=300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_upload_bytes = max_upload_bytes
+        self.in_memory_bytes = in_memory_bytes
+        self.sweep_interval = sweep_interval
+        self.watched = [(directory, max_age_seconds)]
+        self._sweeper = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        # SCRATCH_DIR / SCRATCH_MAX_MB / SCRATCH_MAX_AGE_HOURS / MAX_UPLOAD_MB / IN_MEMORY_RESPONSE_MB
+        # (the last one is the in-memory limit for uploads as well as responses)
+        return cls(
+            directory=os.environ.get('SCRATCH_DIR', DEFAULT_SCRATCH_DIR),
+            max_bytes=_env_mb('SCRATCH_MAX_MB', DEFAULT_MAX_BYTES),
+            max_age_seconds=float(os.environ.get('SCRATCH_MAX_AGE_HOURS', DEFAULT_MAX_AGE_SECONDS / 3600)) * 3600,
+            max_upload_bytes=_env_mb('MAX_UPLOAD_MB', DEFAULT_MAX_UPLOAD_BYTES),
+            in_memory_bytes=_env_mb('IN_MEMORY_RESPONSE_MB', DEFAULT_IN_MEMORY_BYTES),
+        )
+
+    def watch(self, directory, max_age_seconds):
+        """Have the sweeper also expire entries of another directory (e.g. job dirs)."""
+        self.watched.append((directory, max_age_seconds))
+
+    def workspace(self):
+        """New private directory for one request; call cleanup() (or use with) when done."""
+        self.start_sweeper()
+        if directory_size(self.directory) > self.max_bytes:
+            self.sweep()
+            if directory_size(self.directory) > self.max_bytes:
+                raise ScratchFull("Server scratch space is full, please try again later")
+        return Workspace(tempfile.mkdtemp(dir=self.directory))
+
+    def _copy_upload(self, file_storage, write=None, digest=None):
+        # Chunks of the upload to write() (if given), stopping at max_upload_bytes
+        written = 0
+        while True:
+            chunk = file_storage.stream.read(COPY_CHUNK)
+            if not chunk:
+                return written
+            written += len(chunk)
+            if written > self.max_upload_bytes:
+                limit_mb = round(self.max_upload_bytes / (1024 * 1024), 2)
+                raise UploadTooLarge(f"File is larger than the {limit_mb:g} MB upload limit")
+            if digest is not None:
+                digest.update(chunk)
+            if write is not None:
+                write(chunk)
+
+    def save_upload(self, file_storage, dest_path):
+        """Copy an upload to dest_path in chunks, stopping at max_upload_bytes."""
+        try:
+            with open(dest_path, 'wb') as out:
+                return self._copy_upload(file_storage, out.write)
+        except BaseException:
+            try:
+                os.remove(dest_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def receive_upload(self, file_storage, digest=None):
+        """Check an upload's size where werkzeug put it and wrap it in a SpooledUpload.
+
+        Nothing is copied: the readers get file_storage.stream itself. `digest`
+        (a hashlib object) is fed the bytes on the way through, to key the
+        result cache. UploadTooLarge past max_upload_bytes.
+        """
+        stream = file_storage.stream
+        size = self._copy_upload(file_storage, digest=digest)
+        stream.seek(0)
+        return SpooledUpload(self, upload_name(file_storage.filename), stream, size, self.in_memory_bytes)
+
+    def send(self, workspace, path, download_name):
+        """Response for a finished file; the workspace goes away once it is sent.
+
+        Small outputs are read into memory and the workspace is removed straight
+        away; bigger ones are streamed from disk and removed when the response closes.
+        """
+        size = os.path.getsize(path)
+        if size <= self.in_memory_bytes:
+            with open(path, 'rb') as f:
+                buffer = io.BytesIO(f.read())
+            workspace.cleanup()
+            return send_file(buffer, as_attachment=True, download_name=download_name)
+        response = send_file(_WorkspaceFile(path, workspace), as_attachment=True, download_name=download_name)
+        response.content_length = size
+        return response
+
+    def sweep(self):
+        """Delete watched entries older than their max age."""
+        now = time.time()
+        for directory, max_age in self.watched:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    age = now - entry.stat(follow_symlinks=False).st_mtime
+                except FileNotFoundError:
+                    continue
+                if age <= max_age:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def start_sweeper(self):
+        # Started on first use (the app calls this as each request comes in)
+        # rather than at import: with GUNICORN_PRELOAD the import happens in
+        # the master, and a thread started there doesn't exist in the forked
+        # workers. One per worker process; cheap once running.
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name='scratch-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Scratch cleanup failed: {e}")
+            time.sleep(self.sweep_interval)
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repo, not in a package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from generate_sample_report import generate_report  # noqa: E402
+
+SAMPLE_ROWS = 10000
+
+
+def pytest_addoption(parser):
+    parser.addoption('--slow', action='store_true',
+                     help="also run the tests marked slow (the 100k and 1M row benchmarks)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "slow: takes minutes; only run with --slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--slow'):
+        return
+    skip = pytest.mark.skip(reason="slow; run with --slow")
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def synthetic_report(tmp_path_factory):
+    """A generated report of about SAMPLE_ROWS rows, written once per test run."""
+    return generate_report(str(tmp_path_factory.mktemp('reports') / 'synthetic.xlsx'), rows=SAMPLE_ROWS, seed=1)
+
+
+@pytest.fixture(scope='session')
+def web_app(tmp_path_factory):
+    """The Flask app, with its scratch, cache, job and profile directories under a temp dir."""
+    root = tmp_path_factory.mktemp('web')
+    with pytest.MonkeyPatch.context() as mp:
+        for name in ('SCRATCH_DIR', 'RESULT_CACHE_DIR', 'JOBS_DIR', 'PROFILE_DIR'):
+            mp.setenv(name, str(root / name.lower()))
+        import app
+    return app
+
+
+@pytest.fixture
+def client(web_app):
+    return web_app.app.test_client()
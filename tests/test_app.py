@@ -0,0 +1,82 @@
+import importlib.util
+import logging
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from conftest import ROOT
+
+
+def test_healthz(client):
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+
+
+def test_readyz_turns_busy_when_the_job_queue_is_full(client, web_app, monkeypatch):
+    response = client.get('/readyz')
+    assert response.status_code == 200 and response.get_json()['status'] == 'ready'
+
+    monkeypatch.setattr(web_app.job_queue, '_pending', web_app.job_queue.max_pending)
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    body = response.get_json()
+    assert body['status'] == 'busy' and body['jobs']['full']
+
+
+def test_readyz_turns_busy_when_scratch_is_full(client, web_app, monkeypatch):
+    monkeypatch.setattr(web_app.scratch, 'max_bytes', -1)
+    response = client.get('/readyz')
+    assert response.status_code == 503 and response.get_json()['scratch_full']
+
+
+def test_request_over_its_time_budget_is_refused(client, web_app, synthetic_report, monkeypatch):
+    monkeypatch.setattr(web_app, 'REQUEST_TIMEOUT_SECONDS', 1e-6)
+    with open(synthetic_report, 'rb') as f:
+        response = client.post('/process', data={'file': (f, 'synthetic.xlsx')})
+    assert response.status_code == 503
+    assert b'/jobs' in response.data
+
+    # Nothing was cached, so with time enough the same upload is parsed
+    monkeypatch.setattr(web_app, 'REQUEST_TIMEOUT_SECONDS', 100)
+    with open(synthetic_report, 'rb') as f:
+        response = client.post('/process', data={'file': (f, 'synthetic.xlsx')})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].endswith('Processed_synthetic.xlsx')
+
+
+@pytest.fixture(scope='module')
+def gunicorn_conf():
+    # Loading it sets a few defaults in the environment; keep them out of the other tests
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(ROOT, 'gunicorn.conf.py'))
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+def _worker(requests, recycle_after=10):
+    return SimpleNamespace(alive=True, nr=requests, recycle_after=recycle_after, pid=1,
+                           log=logging.getLogger('test'))
+
+
+def test_worker_is_recycled_after_enough_requests(gunicorn_conf, web_app, monkeypatch):
+    monkeypatch.setattr(gunicorn_conf, 'rss_mb', lambda: 100)
+    worker = _worker(9)
+    gunicorn_conf.post_request(worker, None, None, None)
+    assert worker.alive
+    worker.nr = 10
+    # Not while it still has jobs running: they would die with it
+    monkeypatch.setattr(web_app.job_queue, '_pending', 1)
+    gunicorn_conf.post_request(worker, None, None, None)
+    assert worker.alive
+    monkeypatch.setattr(web_app.job_queue, '_pending', 0)
+    gunicorn_conf.post_request(worker, None, None, None)
+    assert not worker.alive
+
+
+def test_worker_is_recycled_above_its_memory_cap(gunicorn_conf, web_app, monkeypatch):
+    monkeypatch.setattr(gunicorn_conf, 'rss_mb', lambda: gunicorn_conf.max_worker_rss_mb + 1)
+    worker = _worker(1)
+    gunicorn_conf.post_request(worker, None, None, None)
+    assert not worker.alive
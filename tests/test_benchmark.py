@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+import benchmark_report
+from generate_sample_report import parse_row_count
+from process_accounting_report import extract_report
+
+# Throughput regression checks with pytest-benchmark. Save a baseline with
+#   pytest tests/test_benchmark.py --benchmark-autosave
+# and fail later runs that got slower with
+#   pytest tests/test_benchmark.py --benchmark-compare --benchmark-compare-fail=mean:20%
+# The 100k and 1M row runs are marked slow (add --slow; the reports are
+# generated once into benchmark_report.py's data dir). Each runs in a fresh
+# process and also fails if its peak RSS grew more than MEMORY_TOLERANCE past
+# benchmark_baseline.json, which is refreshed with
+#   python benchmark_report.py --sizes 100k,1M --save tests/benchmark_baseline.json
+
+pytest.importorskip('pytest_benchmark')
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+MEMORY_TOLERANCE = 0.2
+
+
+@pytest.mark.parametrize('options', [{}, {'batch': True}], ids=['streamed', 'batch'])
+def test_parse_throughput(benchmark, synthetic_report, options):
+    df_proc, df_err = benchmark.pedantic(extract_report, args=(synthetic_report,), kwargs=options,
+                                         rounds=3, iterations=1)
+    assert len(df_proc) + len(df_err) > 1000
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('size', ['100k', '1M'])
+def test_large_report(benchmark, size):
+    with open(BASELINE_PATH) as f:
+        baseline = {r['size']: r for r in json.load(f)['results']}[size]
+    rows = parse_row_count(size)
+    # Generated before the clock starts
+    data_dir = benchmark_report.DEFAULT_DATA_DIR
+    benchmark_report.synthetic_report(size, rows, data_dir)
+    result = benchmark.pedantic(benchmark_report.benchmark_size, args=(size, rows, data_dir, 1, {}),
+                                rounds=1, iterations=1)
+    benchmark.extra_info.update(rows_per_sec=result['rows_per_sec'], peak_rss_mb=result['peak_rss_mb'])
+    assert result['peak_rss_mb'] <= baseline['peak_rss_mb'] * (1 + MEMORY_TOLERANCE), \
+        f"peak RSS {result['peak_rss_mb']} MB, baseline {baseline['peak_rss_mb']} MB"
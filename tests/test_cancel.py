@@ -0,0 +1,90 @@
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+import job_queue
+from job_queue import CANCEL_FLAG, CANCELLED, FAILED, QUEUED, run_job
+from process_accounting_report import CancelToken, ReportCancelled, extract_report
+
+
+class CancelWhileParsing(CancelToken):
+    # Cancels itself at its first check once the parse stage has started:
+    # PROGRESS_EVERY_ROWS rows in, or after the first chunk when parallel
+    def __init__(self):
+        super().__init__()
+        self.parsing = False
+        self.checks = 0
+
+    def progress(self, p):
+        self.parsing = p.stage == 'parse'
+
+    def check(self):
+        if self.parsing:
+            self.checks += 1
+            self.cancel()
+        super().check()
+
+
+@pytest.mark.parametrize('options', [{}, {'batch': True}, {'workers': 2}], ids=['streamed', 'batch', 'parallel'])
+def test_cancel_stops_the_parse(synthetic_report, options):
+    cancel = CancelWhileParsing()
+    with pytest.raises(ReportCancelled, match='cancelled'):
+        extract_report(synthetic_report, progress=cancel.progress, cancel=cancel, **options)
+    # Stopped at the check that cancelled it
+    assert cancel.checks == 1
+
+
+@pytest.mark.parametrize('options, stages', [({}, ['parse']), ({'batch': True}, ['read', 'parse']),
+                                             ({'workers': 2}, ['read', 'parse'])],
+                         ids=['streamed', 'batch', 'parallel'])
+def test_progress_covers_every_stage(synthetic_report, options, stages):
+    seen = []
+    df_proc, df_err = extract_report(synthetic_report, progress=seen.append, **options)
+    assert list(dict.fromkeys(p.stage for p in seen)) == stages
+    last = seen[-1]
+    assert last.rows == last.total > 0
+    assert last.transactions == df_proc['Transaction Number'].nunique() + df_err['Transaction Number'].nunique()
+
+
+def test_timeout_sets_timed_out(synthetic_report):
+    cancel = CancelToken(timeout=1e-6)
+    with pytest.raises(ReportCancelled, match='longer than'):
+        extract_report(synthetic_report, cancel=cancel)
+    assert cancel.timed_out
+
+
+@pytest.fixture
+def job(tmp_path, synthetic_report):
+    job_dir = tmp_path / 'job'
+    job_dir.mkdir()
+    with open(job_dir / 'status.json', 'w') as f:
+        json.dump({'id': 'test', 'status': QUEUED, 'filename': 'synthetic.xlsx', 'submitted': 0}, f)
+    return str(job_dir), synthetic_report, str(job_dir / 'Processed_synthetic.xlsx')
+
+
+def test_cancelled_job_is_marked_cancelled(job, monkeypatch):
+    job_dir, input_path, output_path = job
+    parse = job_queue.process_accounting_report
+
+    def cancel_once_running(*args, progress=None, **kwargs):
+        # What POST /jobs/<id>/cancel does, once the run has started
+        def cancelling(p):
+            open(os.path.join(job_dir, CANCEL_FLAG), 'a').close()
+            progress(p)
+        return parse(*args, progress=cancelling, **kwargs)
+
+    monkeypatch.setattr(job_queue, 'process_accounting_report', cancel_once_running)
+    with contextlib.redirect_stdout(io.StringIO()):
+        status = run_job(job_dir, input_path, output_path)
+    assert status['status'] == CANCELLED
+    assert 'started' in status and not os.path.exists(output_path)
+
+
+def test_timed_out_job_is_marked_failed(job):
+    with contextlib.redirect_stdout(io.StringIO()):
+        status = run_job(*job, timeout=1e-6)
+    assert status['status'] == FAILED
+    assert 'longer than' in status['error']
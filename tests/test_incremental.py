@@ -0,0 +1,143 @@
+import contextlib
+import csv
+import filecmp
+import io
+import json
+
+import pytest
+
+import incremental_report
+from generate_sample_report import iter_report_rows
+from incremental_report import _csv_offset, index_path, update_report
+from process_accounting_report import columnar_output_paths, process_accounting_report
+from report_layout import get_layout
+
+# Exports are written as CSV: the incremental logic doesn't care what the
+# input was, and CSV keeps these runs fast
+
+
+@pytest.fixture(scope='module')
+def rows():
+    return list(iter_report_rows(3000, 0.1, 5))
+
+
+def _starts(rows):
+    return [i for i, row in enumerate(rows) if row[0] == 'Transaction Number']
+
+
+def _footer(rows):
+    # The ' ' row closing the last section, then the report footer
+    return len(rows) - 6
+
+
+def _export(tmp_path, name, rows):
+    path = tmp_path / f"{name}.csv"
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(['' if value is None else value for value in row] for row in rows)
+    return str(path)
+
+
+def _update(input_path, output_path, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return update_report(input_path, output_path, output_format='csv', **kwargs)
+
+
+def _same_as_full_run(tmp_path, input_path, output_path):
+    full_path = str(tmp_path / 'full.xlsx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_accounting_report(input_path, full_path, output_format='csv')
+    ours, full = columnar_output_paths(output_path, 'csv'), columnar_output_paths(full_path, 'csv')
+    return all(filecmp.cmp(ours[sheet], full[sheet], shallow=False) for sheet in ours)
+
+
+def test_new_transactions_are_merged(tmp_path, rows):
+    cut = _starts(rows)[-40]
+    day1 = _export(tmp_path, 'day1', rows[:cut] + rows[_footer(rows):])
+    day2 = _export(tmp_path, 'day2', rows)
+    output = str(tmp_path / 'out.xlsx')
+    assert _update(day1, output)['status'] == 'rewritten'
+    result = _update(day2, output)
+    assert result['status'] == 'merged'
+    # 'End of Report' is read as a line of the last transaction, so the one
+    # day1 ended with has changed too
+    assert (result['new'], result['changed'], result['removed']) == (40, 1, 0)
+    assert _same_as_full_run(tmp_path, day2, output)
+    assert _update(day2, output)['status'] == 'current'
+
+
+def test_changed_and_removed_transactions(tmp_path, rows):
+    output = str(tmp_path / 'out.xlsx')
+    _update(_export(tmp_path, 'day1', rows), output)
+
+    changed = [list(row) for row in rows]
+    start = _starts(rows)[len(_starts(rows)) // 3]
+    line = next(i for i in range(start, len(rows)) if isinstance(rows[i][18], (int, float)))
+    changed[line][18] = changed[line][26] = 12345.67
+    day2 = _export(tmp_path, 'day2', changed)
+    result = _update(day2, output)
+    assert (result['status'], result['changed'], result['new']) == ('merged', 1, 0)
+    assert _same_as_full_run(tmp_path, day2, output)
+
+    # The last transactions dropped out of the export again
+    cut = _starts(rows)[-5]
+    day3 = _export(tmp_path, 'day3', changed[:cut] + changed[_footer(rows):])
+    result = _update(day3, output)
+    assert (result['status'], result['removed']) == ('merged', 5)
+    assert _same_as_full_run(tmp_path, day3, output)
+
+
+def test_repeated_transactions_are_numbered(tmp_path, rows):
+    starts = _starts(rows)
+    # Transaction 1 again further down, with the same number and date
+    first, second, later = starts[1], starts[2], starts[4]
+    repeated = rows[:later] + rows[first:second] + rows[later:]
+    output = str(tmp_path / 'out.xlsx')
+    cut = _starts(repeated)[-10]
+    _update(_export(tmp_path, 'day1', repeated[:cut] + repeated[_footer(repeated):]), output)
+    with open(index_path(output)) as f:
+        keys = list(json.load(f)['transactions'])
+    assert any(key.endswith('#2') for key in keys)
+
+    day2 = _export(tmp_path, 'day2', repeated)
+    result = _update(day2, output)
+    assert (result['status'], result['new'], result['changed']) == ('merged', 10, 1)
+    assert _same_as_full_run(tmp_path, day2, output)
+
+
+def test_version_or_layout_change_invalidates_the_index(tmp_path, rows, monkeypatch):
+    day1 = _export(tmp_path, 'day1', rows)
+    output = str(tmp_path / 'out.xlsx')
+    _update(day1, output)
+    assert _update(day1, output)['status'] == 'current'
+
+    # Same markers, different profile: the export has to be parsed again
+    profile = dict(get_layout('oracle_en').profile, description='a copy')
+    result = _update(day1, output, layout=profile)
+    assert (result['status'], result['changed']) == ('unchanged', 0)
+
+    monkeypatch.setattr(incremental_report, 'PARSER_VERSION', 'test')
+    result = _update(day1, output)
+    assert (result['status'], result['new'], result['unchanged']) == ('rewritten', len(_starts(rows)), 0)
+    assert _same_as_full_run(tmp_path, day1, output)
+
+
+def test_csv_offset_counts_records_not_lines(tmp_path):
+    path = tmp_path / 'out.csv'
+    path.write_bytes(b'A,B\r\n1,"two\r\nlines"\r\n2,x\r\n')
+    assert _csv_offset(str(path), 0) == len(b'A,B\r\n')
+    assert _csv_offset(str(path), 1) == len(b'A,B\r\n1,"two\r\nlines"\r\n')
+    assert _csv_offset(str(path), 2) == path.stat().st_size
+    assert _csv_offset(str(path), 3) is None
+
+
+def test_xlsx_output_is_only_skipped_or_rewritten(tmp_path, rows):
+    cut = _starts(rows)[-5]
+    day1 = _export(tmp_path, 'day1', rows[:cut] + rows[_footer(rows):])
+    day2 = _export(tmp_path, 'day2', rows)
+    output = str(tmp_path / 'out.xlsx')
+    with contextlib.redirect_stdout(io.StringIO()):
+        update_report(day1, output)
+        assert update_report(day1, output)['status'] == 'current'
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        assert update_report(day2, output)['status'] == 'rewritten'
+    assert 'only CSV output can be updated in place' in log.getvalue()
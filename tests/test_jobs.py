@@ -0,0 +1,55 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from job_queue import _read_status, _write_json
+from scratch_space import FALLBACK_UPLOAD_NAME, upload_name
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Report.xlsx', 'Report.xlsx'),
+    ('../../etc/Report.csv', 'etc_Report.csv'),
+    ('Rapport été.xls', 'Rapport_ete.xls'),
+    ('..', FALLBACK_UPLOAD_NAME),
+    ('.', FALLBACK_UPLOAD_NAME),
+    ('a/..', FALLBACK_UPLOAD_NAME),
+    ('notes.txt', FALLBACK_UPLOAD_NAME),
+])
+def test_upload_name(name, expected):
+    assert upload_name(name) == expected
+
+
+@pytest.mark.parametrize('name', ['..', '.', 'a/..'])
+def test_job_with_a_directory_name_is_queued(client, web_app, name, monkeypatch):
+    # Not actually run: only the saving of the upload is under test
+    monkeypatch.setattr(web_app.job_queue, '_executor', lambda: _NoPool())
+    # The job never finishes, so its slot is given back afterwards
+    monkeypatch.setattr(web_app.job_queue, '_pending', 0)
+    response = client.post('/jobs', data={'file': (io.BytesIO(b'PK not really'), name)})
+    assert response.status_code == 202
+    assert response.get_json()['filename'] == FALLBACK_UPLOAD_NAME
+
+
+class _NoPool:
+    def submit(self, *args):
+        return _NeverDone()
+
+
+class _NeverDone:
+    def add_done_callback(self, callback):
+        pass
+
+
+def test_status_writes_can_overlap(tmp_path):
+    path = str(tmp_path / 'status.json')
+
+    def write(n):
+        for i in range(200):
+            _write_json(path, {'writer': n, 'i': i})
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(write, range(4)))
+    assert _read_status(str(tmp_path))['i'] == 199
+    assert sorted(os.listdir(tmp_path)) == ['status.json']
@@ -0,0 +1,82 @@
+import csv
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from generate_sample_report import iter_report_rows
+from process_accounting_report import PARSER_VERSION, extract_report
+from report_layout import LAYOUTS_DIR, LayoutError, get_layout
+from result_cache import content_key
+
+
+@pytest.fixture(scope='module')
+def bundled(synthetic_report):
+    return extract_report(synthetic_report, layout='oracle_en')
+
+
+def _assert_same(actual, expected):
+    for a, e in zip(actual, expected):
+        pd.testing.assert_frame_equal(a, e)
+
+
+def _profile_file(tmp_path, name='copy', **changes):
+    with open(f"{LAYOUTS_DIR}/oracle_en.json", encoding='utf-8') as f:
+        profile = json.load(f)
+    profile.update(name=name, **changes)
+    path = tmp_path / f"{name}.json"
+    path.write_text(json.dumps(profile), encoding='utf-8')
+    return str(path)
+
+
+def test_copied_profile_parses_the_same(tmp_path, synthetic_report, bundled):
+    copy = str(tmp_path / 'copy.json')
+    shutil.copyfile(f"{LAYOUTS_DIR}/oracle_en.json", copy)
+    _assert_same(extract_report(synthetic_report, layout=copy), bundled)
+    assert get_layout(copy).fingerprint == get_layout('oracle_en').fingerprint
+
+
+def test_markers_come_from_the_profile(tmp_path):
+    # The same report with its transaction label renamed parses the same
+    # under a profile that knows the new label and maps it back
+    rows = list(iter_report_rows(2000, 0.1, 2))
+    original, renamed = tmp_path / 'original.csv', tmp_path / 'renamed.csv'
+    for path, label in ((original, 'Transaction Number'), (renamed, 'Document No')):
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows([label if v == 'Transaction Number' else ('' if v is None else v) for v in row]
+                                    for row in rows)
+    keys = get_layout('oracle_en').profile['header_keys']
+    profile = _profile_file(tmp_path, 'renamed', transaction_marker='Document No',
+                            header_keys=['Document No' if k == 'Transaction Number' else k for k in keys],
+                            columns={'Document No': 'Transaction Number'})
+    expected = extract_report(str(original), layout='oracle_en')
+    assert len(expected[0]) > 100
+    _assert_same(extract_report(str(renamed), layout=profile), expected)
+
+
+@pytest.mark.parametrize('changes, message', [
+    ({'transaction_marker': None}, "'transaction_marker' should be a str"),
+    ({'header_keys': 'Transaction Number'}, "'header_keys' should be a list of strings"),
+    ({'section_title': '(unclosed'}, "Bad pattern"),
+    ({'markers': []}, "unknown setting"),
+])
+def test_bad_profile_raises_layout_error(tmp_path, changes, message):
+    with pytest.raises(LayoutError, match=message):
+        get_layout(_profile_file(tmp_path, **changes))
+
+
+def test_missing_or_unreadable_profile(tmp_path):
+    with pytest.raises(LayoutError, match='Unknown layout'):
+        get_layout('no_such_layout')
+    broken = tmp_path / 'broken.json'
+    broken.write_text('{"name": ', encoding='utf-8')
+    with pytest.raises(LayoutError, match='Could not read'):
+        get_layout(str(broken))
+
+
+def test_fingerprint_changes_the_cache_key(tmp_path, synthetic_report):
+    changed = get_layout(_profile_file(tmp_path, total_marker='Total for Entry'))
+    keys = {content_key(synthetic_report, f"{PARSER_VERSION}+{layout.fingerprint}")
+            for layout in (get_layout('oracle_en'), changed)}
+    assert len(keys) == 2
@@ -0,0 +1,36 @@
+import os
+
+import pandas as pd
+import pytest
+
+import process_accounting_report as par
+
+
+@pytest.fixture
+def frames():
+    df = pd.DataFrame({'Line': ['1'], 'Transaction Number': ['100'], 'Entered Debit': [1.5]})
+    return df, df.iloc[:0]
+
+
+def test_missing_engine_fails_before_parsing(monkeypatch):
+    monkeypatch.setitem(par.FORMAT_ENGINES, 'parquet', ('no_such_engine',))
+    with pytest.raises(ValueError, match='no_such_engine'):
+        par.parse_output_formats('xlsx,parquet')
+
+
+def test_failed_save_leaves_nothing_behind(tmp_path, frames, monkeypatch):
+    write_columnar = par.write_columnar_report
+
+    def fail_on_parquet(df_proc, df_err, output_path, fmt):
+        if fmt == 'parquet':
+            for path in par.columnar_output_paths(output_path, fmt).values():
+                with open(path, 'w') as f:
+                    f.write('half written')
+            raise OSError('disk full')
+        return write_columnar(df_proc, df_err, output_path, fmt)
+
+    monkeypatch.setattr(par, 'write_columnar_report', fail_on_parquet)
+    monkeypatch.setitem(par.FORMAT_ENGINES, 'parquet', ())
+    with pytest.raises(OSError):
+        par.save_report(*frames, str(tmp_path / 'out.xlsx'), 'xlsx,csv,parquet')
+    assert os.listdir(tmp_path) == []
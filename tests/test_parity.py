@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from process_accounting_report import extract_report
+from report_metrics import RunMetrics
+
+
+@pytest.fixture(scope='module')
+def streamed(synthetic_report):
+    return extract_report(synthetic_report)
+
+
+def test_generated_report_has_both_sections(streamed):
+    df_proc, df_err = streamed
+    assert len(df_proc) > 1000
+    assert len(df_err) > 0
+    assert df_err['Error'].notna().all()
+    assert not df_proc['Transaction Number'].isna().any()
+
+
+@pytest.mark.parametrize('options', [{'batch': True}, {'workers': 2}], ids=['batch', 'parallel'])
+def test_parse_paths_agree(synthetic_report, streamed, options):
+    for expected, actual in zip(streamed, extract_report(synthetic_report, **options)):
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_metrics_dont_change_the_result(synthetic_report, streamed):
+    metrics = RunMetrics()
+    for expected, actual in zip(streamed, extract_report(synthetic_report, metrics=metrics)):
+        pd.testing.assert_frame_equal(actual, expected)
+    # The streamed read is timed apart from the parsing it is interleaved with
+    assert {'read', 'parse', 'frames'} <= set(metrics.stages)
+    assert metrics.counts['rows'] > 0
+    assert metrics.counts['processed_lines'] == len(streamed[0])
@@ -0,0 +1,61 @@
+import importlib.util
+
+import pandas as pd
+import pytest
+
+from process_accounting_report import (READERS, ReportReadError, SheetNotFoundError, detect_format, extract_report,
+                                       iter_sheet_rows)
+
+XLSX_READERS = [name for name in READERS['.xlsx']
+                if importlib.util.find_spec({'calamine': 'python_calamine'}.get(name, name)) is not None]
+
+
+@pytest.fixture(scope='module')
+def by_reader(synthetic_report):
+    frames = {}
+    with pytest.MonkeyPatch.context() as mp:
+        for name in XLSX_READERS:
+            mp.setenv('REPORT_READER', name)
+            frames[name] = extract_report(synthetic_report)
+    return frames
+
+
+def test_openpyxl_is_the_xlsx_default(synthetic_report, monkeypatch):
+    # It streams in flat memory; calamine loads the whole sheet
+    monkeypatch.delenv('REPORT_READER', raising=False)
+    assert iter_sheet_rows(synthetic_report).reader == 'openpyxl'
+
+
+@pytest.mark.parametrize('reader', XLSX_READERS[1:])
+def test_readers_agree(by_reader, reader):
+    for expected, actual in zip(by_reader[XLSX_READERS[0]], by_reader[reader]):
+        pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_whitespace_cells_are_blank(by_reader):
+    # The generator writes ' ' spacer cells, which calamine reads as empty
+    for df_proc, df_err in by_reader.values():
+        for df in (df_proc, df_err):
+            assert not df.map(lambda v: isinstance(v, str) and v.isspace()).any().any()
+
+
+@pytest.mark.parametrize('data, filename', [
+    (b'garbage', 'r.xlsx'),
+    (b'<html><body>Report</body></html>', 'r.xls'),
+    (b'PK\x03\x04 truncated', 'r.xlsx'),
+    (b'\x00\x01\x02\x03', None),
+    (b'', None),
+], ids=['garbage-xlsx', 'html-xls', 'truncated-zip', 'binary', 'empty'])
+def test_broken_files_are_rejected(data, filename):
+    with pytest.raises(ReportReadError):
+        extract_report(data, filename=filename)
+
+
+def test_text_that_is_not_a_report_is_rejected():
+    with pytest.raises(SheetNotFoundError):
+        extract_report(b'a,b\n1,2\n', filename='r.csv')
+
+
+def test_csv_is_recognised_by_name_or_content():
+    assert detect_format(b'a,b\n', filename='export.csv') == '.csv'
+    assert detect_format(b'a,b\n') == '.csv'
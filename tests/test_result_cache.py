@@ -0,0 +1,71 @@
+import os
+import time
+
+import pytest
+
+import result_cache
+from process_accounting_report import PARSER_VERSION
+from report_layout import get_layout
+from result_cache import ResultCache, content_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(directory=str(tmp_path / 'cache'), max_bytes=350, ttl_seconds=60)
+
+
+def _age(path, seconds):
+    # Stored (mtime) and last served (atime) that long ago
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_hit_and_miss(cache):
+    assert cache.get('a') is None
+    path = cache.put_bytes('a', b'workbook')
+    assert cache.get('a') == path
+    with open(path, 'rb') as f:
+        assert f.read() == b'workbook'
+
+
+def test_expired_entries_are_misses(cache):
+    _age(cache.put_bytes('a', b'workbook'), 61)
+    assert cache.get('a') is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_least_recently_used_is_evicted_first(cache):
+    for n, key in enumerate('abc'):
+        _age(cache.put_bytes(key, b'x' * 100), 30 - n)
+    cache.get('a')
+    # 'd' takes it over max_bytes: 'b' was served longest ago
+    cache.put_bytes('d', b'x' * 100)
+    assert [cache.get(key) is not None for key in 'abcd'] == [True, False, True, True]
+
+
+def test_stale_temp_files_are_removed(cache):
+    fresh = os.path.join(cache.directory, 'fresh.tmp')
+    stale = os.path.join(cache.directory, 'stale.tmp')
+    for path in (fresh, stale):
+        with open(path, 'wb') as f:
+            f.write(b'x' * 200)
+    _age(stale, result_cache.STALE_TMP_SECONDS + 1)
+    cache.put_bytes('a', b'x' * 100)
+    assert sorted(os.listdir(cache.directory)) == ['a.xlsx', 'fresh.tmp']
+    # A write still in progress counts towards max_bytes
+    cache.put_bytes('b', b'x' * 100)
+    assert sorted(os.listdir(cache.directory)) == ['b.xlsx', 'fresh.tmp']
+
+
+def test_key_follows_parser_version_and_layout(tmp_path, web_app):
+    path = tmp_path / 'report.xlsx'
+    path.write_bytes(b'the same upload')
+    layout = get_layout()
+    keys = {content_key(str(path), version) for version in (
+        f"{PARSER_VERSION}+{layout.fingerprint}",
+        f"{PARSER_VERSION}.1+{layout.fingerprint}",
+        f"{PARSER_VERSION}+{get_layout(dict(layout.profile, description='a copy')).fingerprint}",
+    )}
+    assert len(keys) == 3
+    assert web_app.RESULT_VERSION == f"{PARSER_VERSION}+{layout.fingerprint}"
+    assert web_app.result_key(str(path)) == content_key(str(path), web_app.RESULT_VERSION)
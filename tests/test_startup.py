@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+from lazy_imports import HEAVY_MODULES
+
+
+def _loaded_by(statement):
+    # The HEAVY_MODULES a fresh interpreter has loaded after running statement
+    check = f"{statement}; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', check], cwd=ROOT, check=True, capture_output=True, text=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+
+def test_import_app_is_lazy():
+    assert _loaded_by('import app') == []
+
+
+def test_import_parser_is_lazy():
+    assert _loaded_by('import process_accounting_report') == []
+
+
+def test_warm_up_loads_everything():
+    assert _loaded_by('import process_accounting_report as p; p.warm_up()') == list(HEAVY_MODULES)
@@ -0,0 +1,40 @@
+import hashlib
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from scratch_space import ScratchSpace, UploadTooLarge
+
+DATA = b'Create Accounting,report\n' * 1000
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    return ScratchSpace(directory=str(tmp_path / 'scratch'), in_memory_bytes=len(DATA), max_upload_bytes=2 * len(DATA))
+
+
+def test_upload_is_read_in_place(scratch):
+    stream = io.BytesIO(DATA)
+    digest = hashlib.sha256()
+    upload = scratch.receive_upload(FileStorage(stream, 'r.csv'), digest)
+    # The readers get werkzeug's own stream, rewound, not a copy of it
+    assert upload.source() is stream and stream.tell() == 0
+    assert digest.hexdigest() == hashlib.sha256(DATA).hexdigest()
+    assert not upload.spilled
+    upload.cleanup()
+    assert os.listdir(scratch.directory) == []
+
+
+def test_big_upload_gets_a_workspace(scratch):
+    upload = scratch.receive_upload(FileStorage(io.BytesIO(DATA + b'x'), 'r.csv'))
+    assert upload.spilled
+    assert os.path.isdir(upload.workspace.path)
+    upload.cleanup()
+    assert os.listdir(scratch.directory) == []
+
+
+def test_upload_over_the_limit_is_refused(scratch):
+    with pytest.raises(UploadTooLarge):
+        scratch.receive_upload(FileStorage(io.BytesIO(DATA * 3), 'r.csv'))